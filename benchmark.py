@@ -0,0 +1,383 @@
+# benchmark.py
+"""
+Offline micro-benchmarks for retrieval, ingestion and prompt assembly.
+
+Runs against a seeded synthetic corpus, stubbed Gemini/Serper and the serving
+query encoder (the int8 ONNX export from onnx_encoder.py by default), then
+compares per-operation p50 latency with a JSON baseline:
+
+    python benchmark.py --save-baseline      # record benchmarks/baseline.json
+    python benchmark.py                      # exit 1 on a regression beyond the threshold
+"""
+
+import argparse
+import gc
+import glob
+import hashlib
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")  # hybrid_rag_gpt refuses to import without one
+
+BASELINE_FILE = "benchmarks/baseline.json"
+DEFAULT_THRESHOLD = 0.25  # 25% slower p50 than the baseline counts as a regression
+DEFAULT_SIZES = (1000, 10000, 50000)
+ENCODER_BENCHMARKS = ("query_encoding", "chat")
+EMBEDDING_DIM = 384
+VOCABULARY = (
+    "network automation netconf restconf yang gnmi telemetry ansible terraform python pyats genie "
+    "cisco devnet api rest json xml ssh https controller catalyst meraki webex sdwan aci nexus "
+    "intersight model driven programmability configuration deployment pipeline ci cd git docker "
+    "kubernetes exam blueprint objective study lab sandbox certification track professional expert"
+).split()
+
+class HashingEncoder:
+    """Deterministic bag-of-words hashing encoder for tests; never used unless asked for by name"""
+    name = f"hashing-{EMBEDDING_DIM}"
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def encode(self, sentences, show_progress_bar=False):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        vectors = np.zeros((len(sentences), self.dim), dtype="float32")
+        for row, sentence in enumerate(sentences):
+            for word in re.findall(r"\w+", sentence.lower()):
+                vectors[row, zlib.crc32(word.encode()) % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_encoder(model_name, backend="onnx"):
+    """The query encoder the app serves with, named after its model, backend and (for ONNX) export digest.
+
+    Raises RuntimeError when it is not available; HashingEncoder is only used when requested by name.
+    """
+    if model_name == HashingEncoder.name:
+        return HashingEncoder()
+    if backend == "onnx":
+        from hybrid_rag_gpt import load_embedding_model
+        from onnx_encoder import ONNX_MODEL_DIR, QUANTIZED_MODEL_FILE
+        encoder = load_embedding_model(model_name, backend)
+        model_path = os.path.join(os.getenv("ONNX_MODEL_DIR", ONNX_MODEL_DIR), QUANTIZED_MODEL_FILE)
+        encoder.name = f"{model_name}@onnx-int8:{file_sha256(model_path)[:12]}"
+        return encoder
+    try:
+        from sentence_transformers import SentenceTransformer
+        encoder = SentenceTransformer(model_name, local_files_only=True)
+    except Exception as e:
+        raise RuntimeError(f"{model_name} is not cached locally for sentence-transformers ({type(e).__name__})") from e
+    encoder.name = f"{model_name}@{backend}"
+    return encoder
+
+def synthetic_corpus(num_docs, words_per_doc=400, seed=0):
+    """Seeded documents of headings and sentences drawn from the certification vocabulary"""
+    rng = np.random.default_rng(seed)
+    documents = []
+    for doc_id in range(num_docs):
+        lines = [f"{doc_id % 9 + 1}.0 {' '.join(rng.choice(VOCABULARY, 3)).title()}"]
+        remaining = words_per_doc
+        while remaining > 0:
+            length = int(rng.integers(8, 20))
+            lines.append(" ".join(rng.choice(VOCABULARY, length)).capitalize() + ".")
+            remaining -= length
+        documents.append("\n".join(lines))
+    return documents
+
+def synthetic_html(num_paragraphs=200, seed=0):
+    """A page with navigation, scripts and styles around the article body, like fetched docs pages"""
+    body = "".join(f"<p>{text}</p>" for text in synthetic_corpus(num_paragraphs, 60, seed))
+    return (
+        "<html><head><style>p{margin:0}</style><script>var tracking = 1;</script></head><body>"
+        "<header><nav><a href='/'>Home</a><a href='/docs'>Docs</a></nav></header>"
+        f"<main><h1>Automation Guide</h1>{body}</main><footer>Copyright</footer></body></html>"
+    )
+
+def measure(fn, repeat=20, warmup=2, items=1):
+    """Time fn() and return per-operation latency stats (and throughput when items > 1)"""
+    for _ in range(warmup):
+        fn()
+    gc.collect()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    result = {
+        "p50_ms": round(statistics.median(samples) * 1000, 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 4),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 4),
+        "repeat": repeat
+    }
+    if items > 1:
+        result["items_per_s"] = round(items / statistics.median(samples), 2)
+    return result
+
+def bench_query_encoding(encoder, repeat):
+    queries = [f"What does the {word} objective cover on the exam?" for word in VOCABULARY]
+    position = iter(range(10 ** 9))
+    return measure(lambda: encoder.encode([queries[next(position) % len(queries)]]), repeat)
+
+def bench_faiss_search(sizes, repeat):
+    import faiss
+    from vectorize import create_index, set_search_parameters
+
+    rng = np.random.default_rng(0)
+    results = {}
+    for size in sizes:
+        vectors = rng.standard_normal((size, EMBEDDING_DIM)).astype("float32")
+        faiss.normalize_L2(vectors)
+        queries = vectors[rng.integers(0, size, 64)] + 0.01
+        for index_type in ("flat", "hnsw"):
+            index = create_index(vectors, index_type=index_type)
+            set_search_parameters(index, ef_search=64)
+            position = iter(range(10 ** 9))
+            results[f"faiss_search.{index_type}.{size}"] = measure(
+                lambda: index.search(queries[next(position) % len(queries)].reshape(1, -1), 5), repeat)
+    return results
+
+def bench_chunking(repeat):
+    from vectorize import chunk_text
+
+    documents = synthetic_corpus(20)
+    size_mb = sum(len(document) for document in documents) / 1e6
+    result = measure(lambda: [chunk_text(document) for document in documents], max(3, repeat // 4), items=len(documents))
+    result["mb_per_s"] = round(size_mb / (result["p50_ms"] / 1000), 3)
+    return result
+
+def bench_html_extraction(repeat):
+    from vectorize import clean_html
+
+    page = synthetic_html()
+    return measure(lambda: clean_html(page), max(3, repeat // 4))
+
+def bench_pdf_extraction(repeat, docs_dir="docs"):
+    """Extract the smallest bundled PDF without the page cache (None when no PDFs are present)"""
+    from vectorize import extract_pdf_pages
+
+    pdfs = sorted(glob.glob(os.path.join(docs_dir, "*.pdf")), key=os.path.getsize)
+    if not pdfs:
+        return None
+    result = measure(lambda: extract_pdf_pages(pdfs[0], file_hash="benchmark", cache_dir=None), max(3, repeat // 4), warmup=1)
+    result["source"] = os.path.basename(pdfs[0])
+    return result
+
+class _StubGeminiModel:
+    """Answers instantly, so the benchmark measures only our side of a chat turn"""
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        class _Response:
+            text = "<strong>NETCONF</strong> uses YANG models over SSH."
+        return _Response()
+
+class _StubSerperClient:
+    def search(self, query, api_key):
+        return "NETCONF is a network management protocol.\nRESTCONF exposes YANG data over HTTPS."
+
+@contextmanager
+def synthetic_vector_store(encoder, num_docs=500):
+    """Point hybrid_rag_gpt at an in-memory FAISS/BM25 index over a synthetic corpus"""
+    import faiss
+    import hybrid_rag_gpt
+    from bm25_index import BM25Index
+    from vectorize import chunk_text
+
+    chunks = [chunk for document in synthetic_corpus(num_docs) for chunk in chunk_text(document)]
+    vectors = np.asarray(encoder.encode(chunks), dtype="float32")
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    with patched(hybrid_rag_gpt, embedding_model=encoder, faiss_index=index, texts=chunks,
+                 bm25_index=BM25Index.build(chunks), track_indexes={}, chunk_metadata=None,
+                 exact_vectors=None, rerank_factor=0):
+        yield hybrid_rag_gpt
+
+@contextmanager
+def patched(module, **overrides):
+    """Temporarily replace module attributes"""
+    saved = {name: getattr(module, name) for name in overrides}
+    try:
+        for name, value in overrides.items():
+            setattr(module, name, value)
+        yield module
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+@contextmanager
+def stubbed_chat_pipeline(encoder, num_docs=500):
+    """Synthetic index plus stubbed Gemini and Serper, so a chat turn needs no network"""
+    saved_key = os.environ.get("SERPAPI_KEY")
+    with synthetic_vector_store(encoder, num_docs) as rag:
+        try:
+            os.environ["SERPAPI_KEY"] = "benchmark"
+            with patched(rag, serper_client=_StubSerperClient(), get_gemini_model=lambda: _StubGeminiModel()):
+                yield rag
+        finally:
+            if saved_key is None:
+                os.environ.pop("SERPAPI_KEY", None)
+            else:
+                os.environ["SERPAPI_KEY"] = saved_key
+
+def bench_chat(encoder, repeat):
+    queries = [f"How do I automate {a} with {b} for the exam?" for a in VOCABULARY[:20] for b in VOCABULARY[20:25]]
+    with stubbed_chat_pipeline(encoder) as rag:
+        position = iter(range(10 ** 9))
+
+        def chat_turn():
+            # Distinct queries and cleared caches so every turn runs the full pipeline
+            rag.answer_cache.clear()
+            rag.embedding_cache.clear()
+            return rag.chat(queries[next(position) % len(queries)])
+        return measure(chat_turn, repeat)
+
+BENCHMARKS = ("query_encoding", "faiss_search", "chunking", "html_extraction", "pdf_extraction", "chat")
+
+def run_benchmarks(only=None, sizes=DEFAULT_SIZES, repeat=50, model_name="paraphrase-MiniLM-L3-v2", backend="onnx"):
+    """Run the selected benchmarks and return a results document"""
+    selected = [name for name in BENCHMARKS if not only or name in only]
+    needs_encoder = set(ENCODER_BENCHMARKS) & set(selected)
+    encoder = load_encoder(model_name, backend) if needs_encoder else None
+    results = {}
+    for name in selected:
+        print(f"⏱️ Running {name}...")
+        if name == "query_encoding":
+            results[name] = bench_query_encoding(encoder, repeat)
+        elif name == "faiss_search":
+            results.update(bench_faiss_search(sizes, repeat))
+        elif name == "chunking":
+            results[name] = bench_chunking(repeat)
+        elif name == "html_extraction":
+            results[name] = bench_html_extraction(repeat)
+        elif name == "pdf_extraction":
+            result = bench_pdf_extraction(repeat)
+            if result is not None:
+                results[name] = result
+        elif name == "chat":
+            results[name] = bench_chat(encoder, repeat)
+
+    import faiss
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "faiss": faiss.__version__,
+            "encoder": getattr(encoder, "name", None),
+            "model": model_name if encoder is not None else None
+        },
+        "benchmarks": results
+    }
+
+def encoder_mismatch(results, baseline):
+    """(baseline encoder, current encoder) when encoder-dependent timings would be compared across encoders, else None"""
+    shared = set(ENCODER_BENCHMARKS) & set(results["benchmarks"]) & set(baseline.get("benchmarks", {}))
+    encoders = (baseline.get("environment", {}).get("encoder"), results["environment"].get("encoder"))
+    return encoders if shared and encoders[0] != encoders[1] else None
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return [(name, baseline_ms, current_ms, allowed_ratio)] for benchmarks whose p50 regressed.
+
+    Per-benchmark limits in ``baseline["thresholds"]`` override ``threshold``.
+    Raises ValueError when encoder-dependent timings come from different encoders.
+    """
+    mismatch = encoder_mismatch(results, baseline)
+    if mismatch:
+        raise ValueError(f"Baseline was recorded with encoder {mismatch[0]}, this run used {mismatch[1]}")
+    regressions = []
+    thresholds = baseline.get("thresholds", {})
+    for name, current in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if previous is None:
+            continue
+        allowed = 1 + thresholds.get(name, threshold)
+        if current["p50_ms"] > previous["p50_ms"] * allowed:
+            regressions.append((name, previous["p50_ms"], current["p50_ms"], allowed))
+    return regressions
+
+def print_results(results, baseline=None):
+    print(f"\n{'benchmark':<28} {'p50 ms':>10} {'p95 ms':>10} {'baseline':>10}")
+    for name, stats in results["benchmarks"].items():
+        previous = (baseline or {}).get("benchmarks", {}).get(name, {}).get("p50_ms")
+        print(f"{name:<28} {stats['p50_ms']:>10.3f} {stats['p95_ms']:>10.3f} {previous if previous is not None else '-':>10}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run offline micro-benchmarks and compare with a JSON baseline")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Benchmarks to run (default: all)")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES), help="Corpus sizes for FAISS search")
+    parser.add_argument("--repeat", type=int, default=50, help="Timed iterations per benchmark")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "paraphrase-MiniLM-L3-v2"),
+                        help=f"Embedding model to time ({HashingEncoder.name} for the test-only hashing encoder)")
+    parser.add_argument("--backend", choices=("onnx", "sentence-transformers"), default=os.getenv("EMBEDDING_BACKEND", "onnx"),
+                        help="Query encoder backend, as EMBEDDING_BACKEND in the app")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed p50 slowdown ratio (0.25 = 25%%)")
+    parser.add_argument("--output", default=None, help="Also write the results JSON here")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        results = run_benchmarks(args.only, args.sizes, args.repeat, args.model, args.backend)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 2
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        if results["environment"]["encoder"] == HashingEncoder.name:
+            print(f"❌ Not saving a baseline timed with {HashingEncoder.name}; export the model with onnx_encoder.py first")
+            return 2
+        if baseline is not None and "thresholds" in baseline:
+            results["thresholds"] = baseline["thresholds"]
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Baseline saved to {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"⚠️ No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    if baseline.get("environment", {}).get("cpu_count") != results["environment"].get("cpu_count"):
+        print(f"⚠️ Baseline was recorded on {baseline.get('environment', {}).get('cpu_count')} CPUs, "
+              f"this machine has {results['environment'].get('cpu_count')}; re-record it here for a meaningful comparison")
+    try:
+        regressions = compare_results(results, baseline, args.threshold)
+    except ValueError as e:
+        print(f"❌ {e}; re-record with --save-baseline or run with the baseline's encoder (--model)")
+        return 2
+    for name, previous, current, allowed in regressions:
+        print(f"❌ {name}: p50 {current:.3f} ms vs baseline {previous:.3f} ms (limit x{allowed:.2f})")
+    if not regressions:
+        print("✅ No regressions against the baseline")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
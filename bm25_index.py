@@ -0,0 +1,136 @@
+# bm25_index.py
+"""
+Compact BM25 lexical index over the chunk store.
+
+Postings are stored CSR-style in flat numpy arrays (term -> slice of chunk IDs
+and precomputed BM25 weights), so scoring a query is a few array slices and a
+single group-by-sum instead of a Python loop over documents. Exact tokens such
+as exam codes ("350-901") and product names ("pyATS") that dense embeddings
+tend to blur are matched literally.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+BM25_FILE = "bm25.npz"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-._/][a-z0-9]+)*")
+COMPOUND_SEPARATORS = re.compile(r"[-._/]")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or that the this to "
+    "was what when where which who why will with you your".split()
+)
+
+def tokenize(text: str):
+    """Lowercased word tokens without stopwords; compounds like "350-901" also yield their parts"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = COMPOUND_SEPARATORS.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+def bm25_index_exists(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, BM25_FILE))
+
+class BM25Index:
+    """Okapi BM25 over chunk IDs with array-backed postings"""
+
+    def __init__(self, terms, indptr, doc_ids, weights, num_docs):
+        self.vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.num_docs = int(num_docs)
+
+    @classmethod
+    def build(cls, chunks, k1=1.2, b=0.75):
+        """Index chunk texts by position (= chunk ID); empty tombstone chunks get no postings"""
+        postings = {}
+        doc_lengths = []
+        for doc_id, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        live_docs = sum(1 for length in doc_lengths if length)
+        avg_length = sum(doc_lengths) / live_docs if live_docs else 1.0
+        doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_ids, weights = [], []
+        for term_id, term in enumerate(terms):
+            entries = postings[term]
+            ids = np.fromiter((doc_id for doc_id, _ in entries), dtype=np.int32, count=len(entries))
+            tf = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (live_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            # Precomputed per-posting score, so queries only sum weights
+            weights.append(idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_lengths[ids] / avg_length)))
+            doc_ids.append(ids)
+            indptr[term_id + 1] = indptr[term_id] + len(entries)
+        return cls(
+            terms,
+            indptr,
+            np.concatenate(doc_ids) if doc_ids else np.zeros(0, dtype=np.int32),
+            np.concatenate(weights).astype(np.float32) if weights else np.zeros(0, dtype=np.float32),
+            len(doc_lengths)
+        )
+
+    def search(self, query: str, k: int = 5, doc_mask=None):
+        """Return up to k (chunk_id, score) pairs, best first, optionally only where doc_mask is True"""
+        term_ids = [self.vocabulary[term] for term in set(tokenize(query)) if term in self.vocabulary]
+        if not term_ids:
+            return []
+        ids = np.concatenate([self.doc_ids[self.indptr[t]:self.indptr[t + 1]] for t in term_ids])
+        weights = np.concatenate([self.weights[self.indptr[t]:self.indptr[t + 1]] for t in term_ids])
+        if doc_mask is not None:
+            keep = doc_mask[ids]
+            ids, weights = ids[keep], weights[keep]
+        candidates, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+        else:
+            top = np.argsort(-scores, kind="stable")
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def save(self, directory: str):
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez(
+            os.path.join(directory, BM25_FILE),
+            terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+            indptr=self.indptr,
+            doc_ids=self.doc_ids,
+            weights=self.weights,
+            num_docs=np.asarray(self.num_docs)
+        )
+
+    @classmethod
+    def load(cls, directory: str):
+        with np.load(os.path.join(directory, BM25_FILE)) as data:
+            joined = data["terms"].tobytes().decode("utf-8")
+            return cls(
+                joined.split("\n") if joined else [],
+                data["indptr"],
+                data["doc_ids"],
+                data["weights"],
+                data["num_docs"]
+            )
+
+def reciprocal_rank_fusion(rankings, k: int = 5, rrf_k: int = 60, with_scores: bool = False):
+    """Merge ranked ID lists by summing 1 / (rrf_k + rank); returns the top k IDs (or (ID, score) pairs)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    ranked = sorted(scores, key=lambda doc_id: -scores[doc_id])[:k]
+    return [(doc_id, scores[doc_id]) for doc_id in ranked] if with_scores else ranked
@@ -0,0 +1,153 @@
+# chunk_metadata.py
+"""
+Per-chunk metadata (source, page, certification track, exam code).
+
+Metadata is stored column-wise in one .npz file next to the chunk store, with
+small string tables for sources and tracks, so a chunk ID maps to its
+metadata through plain array lookups.
+"""
+
+import os
+import re
+
+import numpy as np
+
+METADATA_FILE = "chunks.meta.npz"
+METADATA_VERSION = 2  # Bump when track detection changes so indexes are rebuilt
+
+# Certification tracks: exam code and the names people (and file names/URLs) use for them
+TRACKS = {
+    "CCNAAUTO": {"exam_code": "200-901", "aliases": ("ccnaauto", "ccna automation", "devnet associate", "devasc")},
+    "ENAUTO": {"exam_code": "300-435", "aliases": ("enauto", "enterprise automation", "automating cisco enterprise",
+                                                   "automation for cisco enterprise")},
+    "DCNAUTO": {"exam_code": "300-635", "aliases": ("dcnauto", "data center automation", "automating cisco data center")},
+    "SPAUTO": {"exam_code": "300-535", "aliases": ("spauto", "service provider automation",
+                                                   "automating cisco service provider", "automation for cisco service provider")},
+    "AUTOCOR": {"exam_code": "350-901", "aliases": ("autocor", "devcor")},
+    "CCIEAUTO": {"exam_code": None, "aliases": ("ccie automation", "ccie devnet", "devnet expert")},
+}
+# Certification names spanning several exams: CCNP Automation is the AUTOCOR core plus one concentration
+SHARED_ALIASES = {
+    "ccnp automation": ("AUTOCOR", "ENAUTO", "DCNAUTO", "SPAUTO"),
+    "devnet professional": ("AUTOCOR", "ENAUTO", "DCNAUTO", "SPAUTO"),
+}
+TRACK_NAMES = list(TRACKS)
+_CODE_PATTERNS = {
+    track: re.compile(rf"(?<!\d){re.escape(info['exam_code'])}(?!\d)")
+    for track, info in TRACKS.items() if info["exam_code"]
+}
+_ALIAS_PATTERNS = {
+    track: re.compile(r"\b(?:" + "|".join(
+        re.escape(alias) for alias in info["aliases"] + tuple(name for name, tracks in SHARED_ALIASES.items() if track in tracks)
+    ) + r")\b")
+    for track, info in TRACKS.items()
+}
+
+def detect_tracks(text: str):
+    """Certification tracks named in text (exam codes or aliases), in TRACKS order"""
+    lowered = text.lower()
+    # File names and URLs separate words with - _ / .
+    words = " ".join(re.sub(r"[-_/.&]+", " ", lowered).split())
+    return [
+        track for track in TRACK_NAMES
+        if (track in _CODE_PATTERNS and _CODE_PATTERNS[track].search(lowered)) or _ALIAS_PATTERNS[track].search(words)
+    ]
+
+def detect_track(text: str):
+    """The single track text is about, or None when it names none or several"""
+    tracks = detect_tracks(text)
+    return tracks[0] if len(tracks) == 1 else None
+
+_LEVEL_PATTERN = re.compile(r"\b(?:ccna|ccnp|ccie|ccde|cct|associate|professional|expert|specialist)\b")
+_NUMBER_PATTERN = re.compile(r"\d+(?:[-.]\d+)*")
+
+def certification_scope(text: str) -> frozenset:
+    """Tracks, certification levels and other numbers text names.
+
+    Two questions can share an answer only if their scopes are equal, so
+    "CCNA" vs "CCNP" or "Python 2" vs "Python 3" paraphrases stay distinct.
+    """
+    tracks = detect_tracks(text)
+    exam_codes = {TRACKS[track]["exam_code"] for track in tracks}
+    lowered = text.lower()
+    return frozenset(
+        tracks
+        + _LEVEL_PATTERN.findall(lowered)
+        + [number for number in _NUMBER_PATTERN.findall(lowered) if number not in exam_codes]
+    )
+
+def _encode_strings(strings):
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+def _decode_strings(array):
+    joined = array.tobytes().decode("utf-8")
+    return joined.split("\n") if joined else []
+
+class ChunkMetadata:
+    """Column-wise chunk metadata indexed by chunk ID (removed chunks have source_id -1)"""
+
+    def __init__(self, sources, source_ids, pages, track_ids):
+        self.sources = sources
+        self.source_ids = source_ids
+        self.pages = pages
+        self.track_ids = track_ids
+
+    @classmethod
+    def build(cls, manifest_sources, chunks):
+        """Derive metadata from manifest entries and chunk texts.
+
+        A chunk inherits its source's track (e.g. a 350-901 blueprint PDF);
+        chunks of general sources get a track only if their text names exactly one.
+        """
+        sources = sorted(manifest_sources)
+        count = len(chunks)
+        source_ids = np.full(count, -1, dtype=np.int32)
+        pages = np.zeros(count, dtype=np.int32)
+        track_ids = np.full(count, -1, dtype=np.int16)
+        for source_id, source in enumerate(sources):
+            entry = manifest_sources[source]
+            source_track = detect_track(source)
+            chunk_pages = entry.get("pages") or [None] * len(entry["chunk_ids"])
+            for chunk_id, page in zip(entry["chunk_ids"], chunk_pages):
+                source_ids[chunk_id] = source_id
+                pages[chunk_id] = page or 0
+                track = source_track or detect_track(chunks[chunk_id])
+                if track is not None:
+                    track_ids[chunk_id] = TRACK_NAMES.index(track)
+        return cls(sources, source_ids, pages, track_ids)
+
+    def __len__(self):
+        return len(self.source_ids)
+
+    def track_mask(self, track: str):
+        """Boolean mask over chunk IDs belonging to a track"""
+        return self.track_ids == TRACK_NAMES.index(track)
+
+    def describe(self, chunk_id: int) -> dict:
+        """Source, page, track and exam code of one chunk"""
+        source_id = int(self.source_ids[chunk_id])
+        track_id = int(self.track_ids[chunk_id])
+        track = TRACK_NAMES[track_id] if track_id >= 0 else None
+        return {
+            "source": self.sources[source_id] if source_id >= 0 else None,
+            "page": int(self.pages[chunk_id]) or None,
+            "track": track,
+            "exam_code": TRACKS[track]["exam_code"] if track else None
+        }
+
+    def save(self, directory: str):
+        np.savez(
+            os.path.join(directory, METADATA_FILE),
+            sources=_encode_strings(self.sources),
+            source_ids=self.source_ids,
+            pages=self.pages,
+            track_ids=self.track_ids
+        )
+
+    @classmethod
+    def load(cls, directory: str):
+        with np.load(os.path.join(directory, METADATA_FILE)) as data:
+            return cls(_decode_strings(data["sources"]), data["source_ids"], data["pages"], data["track_ids"])
+
+def chunk_metadata_exists(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, METADATA_FILE))
@@ -0,0 +1,105 @@
+# chunk_store.py
+"""
+Zero-copy chunk store: all chunk texts in one UTF-8 blob plus an offsets array.
+
+Both files are memory-mapped, so opening the store is near-instant and worker
+processes share the page cache instead of each unpickling its own copy.
+"""
+
+import mmap
+import os
+
+import numpy as np
+
+BLOB_FILE = "chunks.bin"
+OFFSETS_FILE = "chunks.offsets.npy"
+
+def chunk_store_exists(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, BLOB_FILE)) and os.path.exists(os.path.join(directory, OFFSETS_FILE))
+
+class ChunkStoreWriter:
+    """Append-only chunk store writer so chunks can be streamed to disk in batches.
+
+    ``flush()`` makes everything appended so far durable; reopening with
+    ``resume=True`` continues from the last flush and drops any later partial writes.
+    """
+
+    def __init__(self, directory: str, resume: bool = False):
+        os.makedirs(directory, exist_ok=True)
+        self._blob_path = os.path.join(directory, BLOB_FILE)
+        self._offsets_path = os.path.join(directory, OFFSETS_FILE)
+        self._offsets = [0]
+        if resume and chunk_store_exists(directory):
+            self._offsets = [int(offset) for offset in np.load(self._offsets_path)]
+            with open(self._blob_path, "r+b") as f:
+                f.truncate(self._offsets[-1])
+        self._blob = open(self._blob_path, "ab" if len(self._offsets) > 1 else "wb")
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def append(self, chunk: str):
+        data = chunk.encode("utf-8")
+        self._blob.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def extend(self, chunks):
+        for chunk in chunks:
+            self.append(chunk)
+
+    def flush(self):
+        self._blob.flush()
+        os.fsync(self._blob.fileno())
+        np.save(self._offsets_path, np.asarray(self._offsets, dtype=np.int64))
+
+    def close(self):
+        self.flush()
+        self._blob.close()
+
+def write_chunk_store(chunks, directory: str):
+    """Write chunk texts as a UTF-8 blob and an int64 offsets array (len(chunks) + 1 entries)"""
+    writer = ChunkStoreWriter(directory)
+    writer.extend(chunks)
+    writer.close()
+
+class ChunkStore:
+    """Read-only, list-like view over a memory-mapped chunk store; chunks are decoded on access"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(directory, BLOB_FILE), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap cannot map an empty file; an empty store has nothing to slice anyway
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def close(self):
+        """Release the memory maps (needed before the files are replaced on some platforms)"""
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._blob = b""
+        self._offsets = np.zeros(1, dtype=np.int64)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        position = int(position)
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("chunk index out of range")
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
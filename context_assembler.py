@@ -0,0 +1,127 @@
+# context_assembler.py
+"""
+Token-budgeted context assembly for the Gemini prompt.
+
+Retrieval over-fetches candidates; this stage trims text that repeats the
+overlap of an already selected chunk, drops near-duplicates and picks chunks
+by maximal marginal relevance (MMR) until a hard token budget is reached.
+Every prompt token costs Gemini latency, so a tighter context answers faster.
+"""
+
+import re
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (words and punctuation)"""
+    return len(TOKEN_PATTERN.findall(text))
+
+def _prefix_function(pattern: str):
+    """KMP failure table: length of the longest proper border of each prefix"""
+    table = [0] * len(pattern)
+    for i in range(1, len(pattern)):
+        k = table[i - 1]
+        while k and pattern[i] != pattern[k]:
+            k = table[k - 1]
+        table[i] = k + 1 if pattern[i] == pattern[k] else k
+    return table
+
+def _suffix_prefix_length(previous: str, pattern: str, table) -> int:
+    """Length of the longest prefix of pattern that previous ends with"""
+    k = 0
+    for char in previous:
+        while k and (k == len(pattern) or char != pattern[k]):
+            k = table[k - 1]
+        if k < len(pattern) and char == pattern[k]:
+            k += 1
+    return k
+
+def strip_overlap(text: str, selected, min_overlap: int = 20, max_overlap: int = 2000) -> str:
+    """Remove a leading span of text that repeats the tail of an already selected chunk.
+
+    Only the first ``max_overlap`` characters are considered, and each
+    comparison is a linear-time KMP scan of the selected chunk's tail.
+    """
+    pattern = text[:max_overlap]
+    if len(pattern) < min_overlap:
+        return text
+    table = _prefix_function(pattern)
+    for previous in selected:
+        size = _suffix_prefix_length(previous[-len(pattern):], pattern, table)
+        if size >= min_overlap:
+            return text[size:].strip()
+    return text
+
+def _word_set(text: str):
+    return frozenset(word.lower() for word in re.findall(r"\w+", text))
+
+def _jaccard(a, b) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def _truncate_to_budget(text: str, budget: int, count_tokens) -> str:
+    words = text.split()
+    while words and count_tokens(" ".join(words)) > budget:
+        words = words[:max(1, int(len(words) * 0.9))] if len(words) > 1 else []
+    return " ".join(words)
+
+def assemble_context(candidates, token_budget: int, max_chunks=None, vectors=None, diversity: float = 0.3,
+                     duplicate_threshold: float = 0.95, count_tokens=estimate_tokens):
+    """Chunk texts for the prompt, in order; see select_context"""
+    return [text for _, text in select_context(candidates, token_budget, max_chunks, vectors, diversity,
+                                               duplicate_threshold, count_tokens)]
+
+def select_context(candidates, token_budget: int, max_chunks=None, vectors=None, diversity: float = 0.3,
+                   duplicate_threshold: float = 0.95, count_tokens=estimate_tokens):
+    """Select (candidate position, text) pairs for the prompt from ranked (text, relevance) candidates.
+
+    Relevance is the candidate score (e.g. the fused FAISS/BM25 RRF score)
+    min-max scaled to [0, 1], so rank differences are not flattened and
+    lexical-only matches keep their place. ``vectors`` (one row per
+    candidate) measure redundancy by cosine; without them word-set Jaccard
+    is used. A candidate whose similarity to a selected chunk exceeds
+    ``duplicate_threshold`` is dropped, the rest are picked by
+    ``(1 - diversity) * relevance - diversity * max_similarity``.
+    The returned texts never exceed ``token_budget`` tokens in total.
+    """
+    if not candidates or token_budget <= 0:
+        return []
+    texts = [text for text, _ in candidates]
+    relevance = np.asarray([score for _, score in candidates], dtype=np.float64)
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+
+    if vectors is not None:
+        unit = np.asarray(vectors, dtype=np.float32)
+        unit = unit / np.maximum(np.linalg.norm(unit, axis=1, keepdims=True), 1e-12)
+        similarity = unit @ unit.T
+    else:
+        word_sets = [_word_set(text) for text in texts]
+        similarity = np.asarray([[_jaccard(a, b) for b in word_sets] for a in word_sets])
+
+    remaining = list(range(len(texts)))
+    selected, chosen, used = [], [], 0
+    max_chunks = max_chunks or len(texts)
+    while remaining and len(selected) < max_chunks and used < token_budget:
+        max_similarity = similarity[np.ix_(remaining, chosen)].max(axis=1) if chosen else np.zeros(len(remaining))
+        scores = (1 - diversity) * relevance[remaining] - diversity * max_similarity
+        position = int(np.argmax(scores))
+        candidate = remaining.pop(position)
+        if chosen and max_similarity[position] >= duplicate_threshold:
+            continue
+        text = strip_overlap(texts[candidate], selected)
+        if not text or any(text in previous for previous in selected):
+            continue
+        tokens = count_tokens(text)
+        if used + tokens > token_budget:
+            if selected:
+                continue  # A smaller candidate may still fit
+            text = _truncate_to_budget(text, token_budget, count_tokens)
+            tokens = count_tokens(text)
+            if not text:
+                break
+        selected.append(text)
+        chosen.append(candidate)
+        used += tokens
+    return list(zip(chosen, selected))
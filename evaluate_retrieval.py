@@ -0,0 +1,286 @@
+# evaluate_retrieval.py
+"""
+Retrieval quality-vs-latency evaluation against a golden question set.
+
+Each golden question (benchmarks/golden_set.json) names the sources that answer
+it and key phrases from the expected passages. Every question runs through
+the ``hybrid_rag_gpt.retrieve_answer`` stages (shortlist, then context
+assembly), for the built rag/index and for candidate configurations rebuilt
+in memory from docs/ (embedding model, chunk token budget, FAISS index type,
+hybrid BM25 on/off, k). The assembled context and the top k of the
+shortlist are scored by recall@k and MRR, next to per-query latency:
+
+    python evaluate_retrieval.py                      # the built rag/index
+    python evaluate_retrieval.py --models paraphrase-MiniLM-L3-v2 all-MiniLM-L6-v2 --chunk-tokens 64 126 --k 3 5 10
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+os.environ.setdefault("GOOGLE_API_KEY", "evaluation")  # hybrid_rag_gpt refuses to import without one
+
+GOLDEN_SET_FILE = "benchmarks/golden_set.json"
+DEFAULT_MODEL = os.getenv("EMBEDDING_MODEL", "paraphrase-MiniLM-L3-v2")
+
+def load_golden_set(path=GOLDEN_SET_FILE):
+    """Golden questions, each with the expected ``sources`` and/or ``terms``"""
+    with open(path) as f:
+        questions = json.load(f)["questions"]
+    for item in questions:
+        if not item.get("question") or not (item.get("sources") or item.get("terms")):
+            raise ValueError(f"Golden question needs a question and expected sources or terms: {item}")
+    return questions
+
+def normalize(text: str) -> str:
+    """Lowercase alphanumerics only, so PDF extraction spacing ("120 -minute") still matches"""
+    return re.sub(r"[^a-z0-9]+", "", text.lower())
+
+def _matches_source(expected: str, source) -> bool:
+    return source is not None and expected.lower() in source.lower()
+
+def score_question(item, retrieved, judge="sources"):
+    """(recall, reciprocal_rank) of retrieved (text, source) pairs, best first.
+
+    With the ``sources`` judge a chunk is relevant when it comes from an expected
+    source and recall is the share of expected sources retrieved; the ``terms``
+    judge (for indexes without chunk metadata) looks for the expected phrases
+    in the chunk text instead.
+    """
+    if judge == "sources":
+        expected = item["sources"]
+        hits = [[_matches_source(source, chunk_source) for source in expected] for _, chunk_source in retrieved]
+    else:
+        expected = [normalize(term) for term in item["terms"]]
+        hits = [[term in normalize(text) for term in expected] for text, _ in retrieved]
+    found = {position for row in hits for position, hit in enumerate(row) if hit}
+    first = next((rank for rank, row in enumerate(hits, start=1) if any(row)), None)
+    return len(found) / len(expected), 1.0 / first if first else 0.0
+
+def evaluate(rag, golden, k=5, source_of=None):
+    """Recall@k, MRR and latency of the assembled answer context over the golden set.
+
+    Each question runs what retrieve_answer runs: retrieve_chunks shortlists
+    max(k, CONTEXT_CANDIDATES) candidates and select_answer_chunks assembles up
+    to k of them into the prompt context. ``recall_at_k``/``mrr`` score that
+    context; ``shortlist_recall_at_k``/``shortlist_mrr`` score the top k of the
+    shortlist. ``source_of`` maps a chunk ID to its source; without it the
+    terms judge is used.
+    """
+    judge = "sources" if source_of is not None else "terms"
+    questions = [item for item in golden if item.get(judge)]
+    if not questions:
+        raise ValueError(f"No golden questions carry expected {judge}")
+
+    def describe(chunk_id, text):
+        return text, source_of(chunk_id) if source_of else None
+
+    rag.retrieve_answer(questions[0]["question"], k)  # Warm up the model and batcher threads
+    per_query = []
+    for item in questions:
+        start = time.perf_counter()
+        query_embedding = rag.embed_query(item["question"])
+        candidates = rag.retrieve_chunks(item["question"], max(k, rag.context_candidates), query_embedding)
+        selected = rag.select_answer_chunks(candidates, k)
+        latency_ms = (time.perf_counter() - start) * 1000
+        context = [describe(chunk_id, text) for chunk_id, text in selected]
+        shortlist = [describe(chunk_id, rag.texts[chunk_id]) for chunk_id, _ in candidates[:k]]
+        recall, reciprocal_rank = score_question(item, context, judge)
+        shortlist_recall, shortlist_reciprocal_rank = score_question(item, shortlist, judge)
+        # Best query/chunk cosine similarity, the signal WEB_SEARCH_CONFIDENCE is compared against
+        similarities = rag.query_similarities(query_embedding,
+                                              rag.chunk_vectors([chunk_id for chunk_id, _ in candidates]) if candidates else None)
+        per_query.append({
+            "question": item["question"],
+            "recall": round(recall, 4),
+            "reciprocal_rank": round(reciprocal_rank, 4),
+            "shortlist_recall": round(shortlist_recall, 4),
+            "shortlist_reciprocal_rank": round(shortlist_reciprocal_rank, 4),
+            "confidence": round(max(similarities), 4) if similarities else None,
+            "latency_ms": round(latency_ms, 3),
+            "context_sources": [source for _, source in context] if source_of else None,
+            "retrieved_sources": [source for _, source in shortlist] if source_of else None
+        })
+
+    latencies = np.asarray([query["latency_ms"] for query in per_query])
+
+    def mean(field):
+        return round(float(np.mean([query[field] for query in per_query])), 4)
+
+    return {
+        "judge": judge,
+        "k": k,
+        "queries": len(per_query),
+        "recall_at_k": mean("recall"),
+        "mrr": mean("reciprocal_rank"),
+        "shortlist_recall_at_k": mean("shortlist_recall"),
+        "shortlist_mrr": mean("shortlist_reciprocal_rank"),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "per_query": per_query
+    }
+
+def load_documents(doc_dir="docs", urls_file=None):
+    """[(source, [(page_number, text)])] from the PDFs in doc_dir and, optionally, the URLs file"""
+    from vectorize import pdf_sources, url_sources
+
+    documents = [(os.path.basename(source), load_pages()) for source, _, load_pages in pdf_sources(doc_dir)]
+    if urls_file:
+        documents.extend((url, [(None, load_text())]) for url, _, load_text in url_sources(urls_file) if load_text)
+    return documents
+
+@contextmanager
+def candidate_store(documents, encoder, chunk_tokens=None, index_type="flat", hybrid=True):
+    """Point hybrid_rag_gpt at an in-memory index built from documents with these settings.
+
+    Chunking, chunk metadata and per-track sub-indexes follow vectorize.py, so
+    the candidate differs from a real build only in the settings under test.
+    Yields (module, source_of, number of chunks).
+    """
+    import faiss
+    import hybrid_rag_gpt
+    from benchmark import patched
+    from bm25_index import BM25Index
+    from chunk_metadata import TRACK_NAMES, ChunkMetadata
+    from context_assembler import estimate_tokens
+    from vectorize import (DEFAULT_CHUNK_TOKENS, DEFAULT_RERANK_FACTOR, QUANTIZED_INDEX_TYPES, chunk_text, create_index,
+                           set_search_parameters)
+
+    tokenizer = getattr(encoder, "tokenizer", None)
+    count_tokens = (lambda text: len(tokenizer.tokenize(text))) if tokenizer is not None else estimate_tokens
+    if not chunk_tokens:
+        max_seq_length = getattr(encoder, "max_seq_length", None)
+        chunk_tokens = max_seq_length - 2 if max_seq_length else DEFAULT_CHUNK_TOKENS
+
+    chunks, manifest_sources = [], {}
+    for source, pages in documents:
+        entry = manifest_sources.setdefault(source, {"chunk_ids": [], "pages": []})
+        for page_number, text in pages:
+            page_chunks = chunk_text(text, chunk_tokens, count_tokens=count_tokens)
+            entry["chunk_ids"].extend(range(len(chunks), len(chunks) + len(page_chunks)))
+            entry["pages"].extend([page_number] * len(page_chunks))
+            chunks.extend(page_chunks)
+    if not chunks:
+        raise ValueError("No chunks to index")
+
+    embeddings = np.ascontiguousarray(encoder.encode(chunks, show_progress_bar=False), dtype="float32")
+    index = create_index(embeddings, index_type)
+    set_search_parameters(index, ef_search=64, nprobe=8)
+    # Quantized candidates are served the way a real build is: shortlisted, then re-ranked exactly
+    quantized = index_type in QUANTIZED_INDEX_TYPES and hybrid_rag_gpt.exact_rerank_enabled
+    metadata = ChunkMetadata.build(manifest_sources, chunks)
+    track_indexes = {}
+    for track_id, track in enumerate(TRACK_NAMES):
+        rows = np.flatnonzero(metadata.track_ids == track_id)
+        if len(rows):
+            track_indexes[track] = faiss.IndexIDMap2(faiss.IndexFlatL2(embeddings.shape[1]))
+            track_indexes[track].add_with_ids(embeddings[rows], rows.astype("int64"))
+
+    with patched(hybrid_rag_gpt, embedding_model=encoder, faiss_index=index, texts=chunks,
+                 bm25_index=BM25Index.build(chunks) if hybrid else None, track_indexes=track_indexes,
+                 chunk_metadata=metadata, embedding_cache=hybrid_rag_gpt.EmbeddingCache(max_entries=0),
+                 exact_vectors=embeddings if quantized else None, rerank_factor=DEFAULT_RERANK_FACTOR if quantized else 0):
+        yield hybrid_rag_gpt, lambda chunk_id: metadata.describe(chunk_id)["source"], len(chunks)
+
+def evaluate_current_index(golden, ks):
+    """Rows for the built rag/index, or [] when it cannot be loaded"""
+    import hybrid_rag_gpt
+    from benchmark import patched
+
+    if not hybrid_rag_gpt.load_vector_store():
+        print("[WARNING] Could not load rag/index (build it with vectorize.py); skipping the current index")
+        return []
+    metadata = hybrid_rag_gpt.chunk_metadata
+    source_of = (lambda chunk_id: metadata.describe(chunk_id)["source"]) if metadata is not None else None
+    rows = []
+    with patched(hybrid_rag_gpt, embedding_cache=hybrid_rag_gpt.EmbeddingCache(max_entries=0)):
+        for k in ks:
+            print(f"🔎 Evaluating the current index at k={k}...")
+            result = evaluate(hybrid_rag_gpt, golden, k, source_of)
+            rows.append({"config": "current", "model": DEFAULT_MODEL, "chunk_tokens": None,
+                         "index_type": type(hybrid_rag_gpt.faiss_index).__name__,
+                         "hybrid": hybrid_rag_gpt.bm25_index is not None, "chunks": len(hybrid_rag_gpt.texts), **result})
+    return rows
+
+def run_evaluation(golden, ks=(5,), models=(), chunk_token_budgets=(None,), index_types=("flat",),
+                   hybrid_modes=(True,), include_current=True, documents=None):
+    """Evaluate the current index and every candidate combination; one row per configuration and k"""
+    from benchmark import load_encoder
+
+    rows = evaluate_current_index(golden, ks) if include_current else []
+    if models:
+        documents = documents if documents is not None else load_documents()
+    for model_name in models:
+        # Candidates re-encode the corpus, so they need the full model rather than the query-only ONNX export
+        encoder = load_encoder(model_name, "sentence-transformers")
+        encoder_name = getattr(encoder, "name", model_name)
+        for chunk_tokens in chunk_token_budgets:
+            for index_type in index_types:
+                for hybrid in hybrid_modes:
+                    config = f"{encoder_name}/{chunk_tokens or 'auto'}t/{index_type}/{'hybrid' if hybrid else 'dense'}"
+                    print(f"🔧 Building candidate {config}...")
+                    with candidate_store(documents, encoder, chunk_tokens, index_type, hybrid) as (rag, source_of, count):
+                        for k in ks:
+                            result = evaluate(rag, golden, k, source_of)
+                            rows.append({"config": config, "model": encoder_name, "chunk_tokens": chunk_tokens,
+                                         "index_type": index_type, "hybrid": hybrid, "chunks": count, **result})
+    return rows
+
+def print_table(rows):
+    """Print a recall/MRR/latency comparison, best recall first within each k"""
+    print(f"\n{'config':<48} {'k':>3} {'judge':>7} {'chunks':>7} {'recall@k':>9} {'MRR':>6} "
+          f"{'list R@k':>9} {'list MRR':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in sorted(rows, key=lambda row: (row["k"], -row["recall_at_k"], -row["mrr"], row["p50_ms"])):
+        print(f"{row['config']:<48} {row['k']:>3} {row['judge']:>7} {row['chunks']:>7} {row['recall_at_k']:>9.3f} "
+              f"{row['mrr']:>6.3f} {row['shortlist_recall_at_k']:>9.3f} {row['shortlist_mrr']:>9.3f} "
+              f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}")
+
+def parse_args(argv=None):
+    from vectorize import INDEX_TYPES
+
+    parser = argparse.ArgumentParser(description="Measure retrieval recall@k, MRR and latency on a golden question set")
+    parser.add_argument("--golden", default=GOLDEN_SET_FILE, help="Golden set JSON")
+    parser.add_argument("--k", type=int, nargs="+", default=[5], help="Retrieval depths to evaluate")
+    parser.add_argument("--models", nargs="+", default=None, help="Embedding models for candidate configurations")
+    parser.add_argument("--chunk-tokens", type=int, nargs="+", default=None,
+                        help="Chunk token budgets for candidates (default: the model's sequence length)")
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=None, help="FAISS index types for candidates")
+    parser.add_argument("--hybrid", choices=["on", "off"], nargs="+", default=None, help="BM25 fusion for candidates")
+    parser.add_argument("--urls", action="store_true", help="Include urls.txt pages in candidate indexes (network)")
+    parser.add_argument("--skip-current", action="store_true", help="Do not evaluate the built rag/index")
+    parser.add_argument("--output", default=None, help="Write all rows, with per-query results, as JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    golden = load_golden_set(args.golden)
+    # Any candidate option builds candidates; unspecified settings keep the production defaults
+    wants_candidates = any(option is not None for option in (args.models, args.chunk_tokens, args.index_types, args.hybrid))
+    rows = run_evaluation(
+        golden,
+        ks=args.k,
+        models=(args.models or [DEFAULT_MODEL]) if wants_candidates else (),
+        chunk_token_budgets=args.chunk_tokens or [None],
+        index_types=args.index_types or ["flat"],
+        hybrid_modes=[mode == "on" for mode in (args.hybrid or ["on"])],
+        include_current=not args.skip_current,
+        documents=load_documents(urls_file="urls.txt" if args.urls else None) if wants_candidates else None
+    )
+    if not rows:
+        print("❌ Nothing was evaluated")
+        return 1
+    print_table(rows)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"golden_set": args.golden, "results": rows}, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,13 +5,26 @@ Maintains exact same UX/UI as Streamlit version but eliminates complexity
 """
 
 from fastapi import FastAPI, Request, Response
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import os
+import json
 import threading
 import time
 from pathlib import Path
-from hybrid_rag_gpt import chat
+from hybrid_rag_gpt import (
+    achat,
+    achat_stream,
+    close_async_clients,
+    answer_path,
+    answer_cache,
+    embedding_cache,
+    embedding_batcher,
+    search_batcher,
+    serper_client
+)
+import metrics
+import tracing
 
 app = FastAPI(title="Cisco Automation Certification Station")
 
@@ -29,13 +42,18 @@ def load_models():
     try:
         print("🔍 Loading ML models...")
         # Preload the chat function and models
-        from hybrid_rag_gpt import load_vector_store
-        load_vector_store()
+        from hybrid_rag_gpt import get_gemini_model, load_vector_store
+        if not load_vector_store():
+            raise RuntimeError("vector store or embedding model failed to load (see [ERROR] above)")
+        # Build the shared Gemini model (and its context cache) before the first request needs it
+        get_gemini_model()
         models_loaded = True
+        metrics.models_loaded_state.set(1)
         print("✅ ML models loaded successfully")
     except Exception as e:
         print(f"❌ Error loading ML models: {e}")
         models_loaded = False
+        metrics.models_loaded_state.set(0)
 
 @app.on_event("startup")
 async def startup_event():
@@ -44,6 +62,11 @@ async def startup_event():
     threading.Thread(target=load_models, daemon=True).start()
     print("🚀 FastAPI startup complete, loading models in background...")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled HTTP connections"""
+    await close_async_clients()
+
 @app.get("/healthz")
 async def health_check():
     """Health check endpoint for Cloud Run"""
@@ -58,9 +81,19 @@ async def status_check():
         "status": "ok",
         "streamlit_flag": models_loaded,  # Keep same API for loading page compatibility
         "streamlit_ready": models_loaded,
-        "models_loaded": models_loaded
+        "models_loaded": models_loaded,
+        "answer_cache": answer_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_batches": embedding_batcher.stats(),
+        "search_batches": search_batcher.stats(),
+        "web_search": serper_client.stats()
     }
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: per-stage latency histograms, answer paths, in-flight requests"""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/", response_class=HTMLResponse)
 async def loading_page(request: Request, app: str = None):
     """Serve custom loading HTML page or redirect to app if ready"""
@@ -461,9 +494,13 @@ async def main_app():
             // Show loading
             loadingSpinner.style.display = 'block';
             
+            // Bot message is filled in as streamed chunks arrive
+            let botMessage = null;
+            let fullResponse = '';
+            
             try {{
-                // Send message to API
-                const response = await fetch('/chat', {{
+                // Send message to the streaming API
+                const response = await fetch('/chat/stream', {{
                     method: 'POST',
                     headers: {{
                         'Content-Type': 'application/json',
@@ -474,15 +511,47 @@ async def main_app():
                     }})
                 }});
                 
-                if (response.ok) {{
-                    const data = await response.json();
-                    addMessage(data.response, 'bot');
+                if (response.ok && response.body) {{
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    
+                    while (true) {{
+                        const {{ done, value }} = await reader.read();
+                        if (done) break;
+                        buffer += decoder.decode(value, {{ stream: true }});
+                        
+                        // Server-Sent Events are separated by a blank line
+                        const events = buffer.split('\\n\\n');
+                        buffer = events.pop();
+                        for (const event of events) {{
+                            const dataLine = event.split('\\n').find(line => line.startsWith('data: '));
+                            if (!dataLine) continue;
+                            const payload = JSON.parse(dataLine.slice(6));
+                            if (payload.delta) {{
+                                fullResponse += payload.delta;
+                                if (!botMessage) {{
+                                    // First token: swap the spinner for the message
+                                    loadingSpinner.style.display = 'none';
+                                    botMessage = addMessage(fullResponse, 'bot');
+                                }} else {{
+                                    updateBotMessage(botMessage, fullResponse);
+                                }}
+                            }} else if (payload.error) {{
+                                throw new Error(payload.error);
+                            }}
+                        }}
+                    }}
                     
-                    // Update conversation history
-                    conversationHistory.push(
-                        {{ role: 'user', content: userInput }},
-                        {{ role: 'assistant', content: data.response }}
-                    );
+                    if (fullResponse) {{
+                        // Update conversation history
+                        conversationHistory.push(
+                            {{ role: 'user', content: userInput }},
+                            {{ role: 'assistant', content: fullResponse }}
+                        );
+                    }} else {{
+                        addMessage('Sorry, I encountered an error. Please try again.', 'bot');
+                    }}
                 }} else {{
                     addMessage('Sorry, I encountered an error. Please try again.', 'bot');
                 }}
@@ -508,6 +577,12 @@ async def main_app():
             
             chatMessages.prepend(messageDiv); /* newest on top */
             // No auto-scroll needed since messages appear at top
+            return messageDiv;
+        }}
+
+        function updateBotMessage(messageDiv, content) {{
+            // Re-render the partial HTML received so far
+            messageDiv.innerHTML = `<strong>Cisco Expert:</strong><br/>${{formatResponse(content)}}`;
         }}
 
         function escapeHtml(text) {{
@@ -539,9 +614,24 @@ async def main_app():
     
     return HTMLResponse(content=html_content)
 
+def incoming_trace(request: Request):
+    """(trace_id, parent_span_id) continuing the caller's W3C traceparent, or a new trace ID"""
+    trace_id, parent_span_id = tracing.parse_traceparent(request.headers.get("traceparent"))
+    return trace_id or tracing.new_trace_id(), parent_span_id
+
 @app.post("/chat")
 async def chat_endpoint(request: Request):
-    """Chat endpoint that uses the hybrid RAG system"""
+    """Chat endpoint that uses the hybrid RAG system (trace ID returned in X-Trace-Id)"""
+    trace_id, parent_span_id = incoming_trace(request)
+    with tracing.span("chat_endpoint", trace_id=trace_id, parent_span_id=parent_span_id,
+                      kind=tracing.SPAN_KIND_SERVER, **{"http.route": "/chat"}) as span:
+        response = await handle_chat(request)
+        span.set_attribute("http.status_code", response.status_code)
+    response.headers[tracing.TRACE_HEADER] = trace_id
+    return response
+
+async def handle_chat(request: Request):
+    """Validate a chat request and answer it with the async RAG pipeline"""
     global models_loaded
     
     try:
@@ -561,10 +651,13 @@ async def chat_endpoint(request: Request):
                 status_code=503
             )
         
-        # Use the same chat function from hybrid_rag_gpt
-        response = chat(user_message, conversation_history)
+        # Async version of the hybrid_rag_gpt chat function keeps the event loop free
+        with metrics.track_request():
+            response = await achat(user_message, conversation_history)
         
-        return JSONResponse(content={"response": response})
+        # Which pipeline answered (casual, cache, rag, fallback), for load tests and dashboards
+        path = answer_path.get()
+        return JSONResponse(content={"response": response}, headers={"X-Answer-Path": path} if path else None)
         
     except Exception as e:
         print(f"❌ Error in chat endpoint: {e}")
@@ -573,6 +666,57 @@ async def chat_endpoint(request: Request):
             status_code=500
         )
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: Request):
+    """Streaming chat endpoint that sends Gemini output as Server-Sent Events"""
+    global models_loaded
+    trace_id, parent_span_id = incoming_trace(request)
+    trace_headers = {tracing.TRACE_HEADER: trace_id}
+    
+    try:
+        data = await request.json()
+        user_message = data.get("message", "")
+        conversation_history = data.get("conversation_history", [])
+    except Exception as e:
+        print(f"❌ Error in chat stream endpoint: {e}")
+        return JSONResponse(
+            content={"error": "An error occurred while processing your request"},
+            status_code=400,
+            headers=trace_headers
+        )
+    
+    if not user_message.strip():
+        return JSONResponse(
+            content={"error": "Message cannot be empty"},
+            status_code=400,
+            headers=trace_headers
+        )
+    
+    if not models_loaded:
+        return JSONResponse(
+            content={"error": "Models are still loading. Please wait a moment and try again."},
+            status_code=503,
+            headers=trace_headers
+        )
+    
+    async def event_stream():
+        # The span covers the whole stream, not just the handler that returns it
+        with tracing.span("chat_stream_endpoint", trace_id=trace_id, parent_span_id=parent_span_id,
+                          kind=tracing.SPAN_KIND_SERVER, **{"http.route": "/chat/stream"}), metrics.track_request():
+            try:
+                async for text in achat_stream(user_message, conversation_history):
+                    yield f"data: {json.dumps({'delta': text})}\n\n"
+            except Exception as e:
+                print(f"❌ Error while streaming chat response: {e}")
+                yield f"data: {json.dumps({'error': 'An error occurred while processing your request'})}\n\n"
+        yield f"data: {json.dumps({'done': True})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **trace_headers}
+    )
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get('PORT', 8080))
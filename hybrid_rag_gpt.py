@@ -2,15 +2,28 @@
 
 import os
 import json
+import datetime
+import contextvars
 import google.generativeai as genai
 from dotenv import load_dotenv
-import requests
+import asyncio
 import gc
+import time
 import concurrent.futures
 import threading
+import queue
+from collections import OrderedDict
+import numpy as np
 import faiss
 import pickle
-from sentence_transformers import SentenceTransformer
+from serper_client import create_serper_client
+from vectorize import QUANTIZED_INDEX_TYPES, VECTORS_FILE, rerank_exact, set_search_parameters
+from chunk_store import ChunkStore, chunk_store_exists
+from bm25_index import BM25Index, bm25_index_exists, reciprocal_rank_fusion
+from chunk_metadata import ChunkMetadata, certification_scope, chunk_metadata_exists, detect_track
+from context_assembler import select_context
+from metrics import chat_requests, stage_latency, web_search_decisions
+import tracing
 
 # Load environment variables from .env file
 load_dotenv()
@@ -25,18 +38,151 @@ if not api_key:
 embedding_model = None
 faiss_index = None
 texts = None
+bm25_index = None
+chunk_metadata = None
+track_indexes = {}
+exact_vectors = None
+rerank_factor = 0
+
+# Hybrid retrieval: FAISS and BM25 candidates per query, merged by reciprocal-rank fusion (HYBRID_SEARCH=0 disables)
+hybrid_search_enabled = os.getenv("HYBRID_SEARCH", "1") != "0"
+hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Prompt context: over-fetch candidates, then dedupe and pick by MMR under a hard token budget
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+context_candidates = int(os.getenv("CONTEXT_CANDIDATES", "15"))
+context_diversity = float(os.getenv("CONTEXT_MMR_DIVERSITY", "0.3"))
+# Restrict search to one certification's sub-index when the query names exactly one (TRACK_ROUTING=0 disables)
+track_routing_enabled = os.getenv("TRACK_ROUTING", "1") != "0"
+# Quantized indexes: re-rank k * factor candidates against exact float32 vectors on disk (EXACT_RERANK=0 disables)
+exact_rerank_enabled = os.getenv("EXACT_RERANK", "1") != "0"
+# Query encoder: "onnx" (int8 export from onnx_encoder.py, needs only requirements.txt) or
+# "sentence-transformers" (imports torch; needs requirements-ingest.txt)
+embedding_backend = os.getenv("EMBEDDING_BACKEND", "onnx")
+onnx_min_cosine = float(os.getenv("ONNX_MIN_COSINE", "0.98"))
+
+def load_search_parameters(config_path="rag/index/index_config.json") -> dict:
+    """Query-time FAISS parameters saved by vectorize.py, overridable via FAISS_EF_SEARCH/FAISS_NPROBE"""
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            config = json.load(f)
+    return {
+        "ef_search": int(os.getenv("FAISS_EF_SEARCH", config.get("ef_search") or 0)) or None,
+        "nprobe": int(os.getenv("FAISS_NPROBE", config.get("nprobe") or 0)) or None
+    }
+
+def read_faiss_index(index_path: str):
+    """Open the FAISS index memory-mapped (FAISS_MMAP=0 reads it fully into RAM)"""
+    if os.getenv("FAISS_MMAP", "1") != "0":
+        try:
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+            return faiss.read_index(index_path, flags)
+        except RuntimeError as e:
+            print(f"[WARNING] Could not memory-map {index_path}, reading into memory: {e}")
+    return faiss.read_index(index_path)
+
+def load_chunk_texts(index_dir: str):
+    """Open the memory-mapped chunk store, falling back to a legacy texts.pkl"""
+    if chunk_store_exists(index_dir):
+        return ChunkStore(index_dir)
+    with open(os.path.join(index_dir, "texts.pkl"), "rb") as f:
+        return pickle.load(f)
+
+def load_lexical_index(index_dir: str, num_chunks: int):
+    """Load the BM25 index written by vectorize.py; None if missing or out of sync with the chunk store"""
+    if not hybrid_search_enabled or not bm25_index_exists(index_dir):
+        return None
+    lexical_index = BM25Index.load(index_dir)
+    if lexical_index.num_docs != num_chunks:
+        print("[WARNING] BM25 index does not match the chunk store; using dense search only")
+        return None
+    return lexical_index
+
+def load_track_indexes(index_dir: str, num_chunks: int):
+    """Load chunk metadata and per-certification sub-indexes; ({}, None) when unavailable or out of sync"""
+    tracks_dir = os.path.join(index_dir, "tracks")
+    if not track_routing_enabled or not chunk_metadata_exists(index_dir) or not os.path.isdir(tracks_dir):
+        return {}, None
+    metadata = ChunkMetadata.load(index_dir)
+    if len(metadata) != num_chunks:
+        print("[WARNING] Chunk metadata does not match the chunk store; track routing disabled")
+        return {}, None
+    indexes = {}
+    for filename in sorted(os.listdir(tracks_dir)):
+        if filename.endswith(".index"):
+            indexes[filename[:-len(".index")]] = faiss.read_index(os.path.join(tracks_dir, filename))
+    return indexes, metadata
+
+def load_exact_vectors(index_dir: str, num_chunks: int, config_path="rag/index/index_config.json"):
+    """Memory-map the float32 vectors written by vectorize.py for re-ranking a quantized index; (None, 0) when unused"""
+    path = os.path.join(index_dir, VECTORS_FILE)
+    if not exact_rerank_enabled or not os.path.exists(path) or not os.path.exists(config_path):
+        return None, 0
+    with open(config_path) as f:
+        config = json.load(f)
+    factor = int(os.getenv("RERANK_FACTOR", config.get("rerank_factor") or 0))
+    if config.get("index_type") not in QUANTIZED_INDEX_TYPES or factor <= 1:
+        return None, 0
+    vectors = np.memmap(path, dtype='float32', mode='r')
+    if len(vectors) != num_chunks * config["dimension"]:
+        print("[WARNING] Exact vectors do not match the chunk store; exact re-ranking disabled")
+        return None, 0
+    return vectors.reshape(num_chunks, config["dimension"]), factor
+
+def load_embedding_model(model_name: str, backend: str = None):
+    """Query encoder for the backend, raising RuntimeError when it cannot be used (there is no fallback)"""
+    if (backend or embedding_backend) == "onnx":
+        from onnx_encoder import ONNX_MODEL_DIR, OnnxEncoder, onnx_encoder_exists
+        model_dir = os.getenv("ONNX_MODEL_DIR", ONNX_MODEL_DIR)
+        if not onnx_encoder_exists(model_dir):
+            raise RuntimeError(f"No ONNX encoder in {model_dir}; run python onnx_encoder.py --model {model_name} "
+                               "or set EMBEDDING_BACKEND=sentence-transformers")
+        encoder = OnnxEncoder(model_dir)
+        if encoder.model_name != model_name:
+            raise RuntimeError(f"ONNX encoder in {model_dir} is for {encoder.model_name}, not {model_name}")
+        return encoder
+    try:
+        # Imported lazily so the ONNX backend never loads torch
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        raise RuntimeError("EMBEDDING_BACKEND=sentence-transformers needs pip install -r requirements-ingest.txt") from e
+    return SentenceTransformer(model_name, cache_folder='/app/models')
+
+def encoder_agreement(sample_size: int = 8, config_path="rag/index/index_config.json"):
+    """Minimum cosine similarity between re-encoded stored chunks and their index vectors (None if not comparable)"""
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            config = json.load(f)
+    if exact_vectors is None and config.get("index_type") in QUANTIZED_INDEX_TYPES:
+        return None  # Lossy codes are no reference for encoder drift
+    positions = np.unique(np.linspace(0, len(texts) - 1, num=min(4 * sample_size, len(texts)), dtype=int))
+    chunk_ids = [int(position) for position in positions if texts[int(position)]][:sample_size]
+    vectors = chunk_vectors(chunk_ids) if chunk_ids else None
+    if vectors is None:
+        return None
+    from onnx_encoder import embedding_agreement
+    encoded = np.asarray(embedding_model.encode([texts[chunk_id] for chunk_id in chunk_ids]), dtype='float32')
+    return float(embedding_agreement(vectors, encoded).min())
+
+def route_query(query: str):
+    """Certification track whose sub-index should serve the query, or None to search everything"""
+    track = detect_track(query) if track_indexes else None
+    if track is None or track not in track_indexes or track_indexes[track].ntotal == 0:
+        return None
+    return track
 
 def load_vector_store():
     """Load FAISS vector store and texts - optimized for fast startup and response"""
-    global embedding_model, faiss_index, texts
+    global embedding_model, faiss_index, texts, bm25_index, track_indexes, chunk_metadata, exact_vectors, rerank_factor
     
     # Load embedding model with optimized startup
     if embedding_model is None:
         print("[LOADING] Initializing embedding model...")
         model_name = os.getenv("EMBEDDING_MODEL", "paraphrase-MiniLM-L3-v2")
         try:
-            embedding_model = SentenceTransformer(model_name, cache_folder='/app/models')
-            print(f"[READY] Embedding model {model_name} ready")
+            embedding_model = load_embedding_model(model_name)
+            print(f"[READY] Embedding model {model_name} ready ({getattr(embedding_model, 'backend', 'sentence-transformers')})")
         except Exception as e:
             print(f"[ERROR] Failed to load embedding model: {e}")
             return False
@@ -45,37 +191,451 @@ def load_vector_store():
     if faiss_index is None:
         print("[LOADING] Initializing vector store...")
         try:
-            faiss_index = faiss.read_index("rag/index/faiss.index")
-            with open("rag/index/texts.pkl", "rb") as f:
-                texts = pickle.load(f)
-            print("[READY] Vector store ready")
+            faiss_index = read_faiss_index("rag/index/faiss.index")
+            try:
+                # IVF indexes need a direct map to reconstruct vectors for context deduplication
+                faiss.extract_index_ivf(faiss_index).make_direct_map()
+            except RuntimeError:
+                pass  # Flat and HNSW indexes reconstruct without one
+            texts = load_chunk_texts("rag/index")
+            bm25_index = load_lexical_index("rag/index", len(texts))
+            track_indexes, chunk_metadata = load_track_indexes("rag/index", len(texts))
+            exact_vectors, rerank_factor = load_exact_vectors("rag/index", len(texts))
+            search_parameters = load_search_parameters()
+            set_search_parameters(faiss_index, **search_parameters)
+            if getattr(embedding_model, "backend", None) == "onnx":
+                # The int8 export must reproduce the embeddings the index was built with
+                agreement = encoder_agreement()
+                if agreement is not None and agreement < onnx_min_cosine:
+                    faiss_index = None  # Stay unready: queries would not match the index
+                    raise RuntimeError(f"ONNX embeddings differ from the index (cosine {agreement:.3f} < {onnx_min_cosine}); "
+                                       "re-export with python onnx_encoder.py for this index")
+            print(f"[READY] Vector store ready ({type(faiss_index).__name__}, {search_parameters}, "
+                  f"{'hybrid BM25' if bm25_index is not None else 'dense only'}, {len(track_indexes)} track sub-indexes, "
+                  f"{f'exact re-rank x{rerank_factor}' if exact_vectors is not None else 'no re-rank'})")
         except Exception as e:
             print(f"[ERROR] Error loading vector store: {e}")
             return False
     return True
 
-def retrieve_answer(query: str, k: int = 5) -> str:
-    """Retrieve relevant documents for the query"""
+class EmbeddingCache:
+    """Bounded, thread-safe LRU cache of query text -> float32 embedding"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.split())
+
+    def get(self, key: str):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key: str, vector):
+        if self.max_entries <= 0:
+            return
+        # Store a compact, read-only 1-D float32 copy so callers cannot mutate cached rows
+        vector = np.array(vector, dtype='float32').reshape(-1)
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": sum(vector.nbytes for vector in self._entries.values())
+            }
+
+class MicroBatcher:
+    """Coalesce concurrent single-item calls into one batched call.
+
+    Items submitted within ``window_seconds`` of each other (up to
+    ``max_batch_size``) are passed to ``batch_fn`` as one list; each caller
+    receives its own element of the returned list.
+    """
+
+    def __init__(self, batch_fn, window_seconds=0.002, max_batch_size=32, name="micro-batcher"):
+        self.batch_fn = batch_fn
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0 and self.max_batch_size > 1
+
+    def submit(self, item):
+        """Process one item, blocking until its batch has been computed"""
+        return self.submit_async(item).result()
+
+    async def asubmit(self, item, executor=None):
+        """Await one item's result without holding a thread, so every in-flight request can join the batch.
+
+        With batching disabled the item is computed on ``executor`` instead of inline on the event loop.
+        """
+        if not self.enabled:
+            return await asyncio.get_running_loop().run_in_executor(executor, self.submit, item)
+        return await asyncio.wrap_future(self.submit_async(item))
+
+    def submit_async(self, item) -> concurrent.futures.Future:
+        """Queue one item and return a future for its result (computed inline when batching is disabled)"""
+        future = concurrent.futures.Future()
+        if not self.enabled:
+            try:
+                future.set_result(self.batch_fn([item])[0])
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch
+            }
+
+def _encode_batch(query_texts):
+    """Encode a batch of queries as one matrix and return one float32 row per query"""
+    return list(np.asarray(embedding_model.encode(query_texts), dtype='float32'))
+
+def _search_batch(requests):
+    """Search FAISS once per target index for a batch of (query_embedding, k[, track]) requests"""
+    groups = {}
+    for position, request in enumerate(requests):
+        groups.setdefault(request[2] if len(request) > 2 else None, []).append(position)
+    results = [None] * len(requests)
+    for track, positions in groups.items():
+        index = faiss_index if track is None else track_indexes[track]
+        max_k = max(requests[position][1] for position in positions)
+        matrix = np.vstack([np.asarray(requests[position][0], dtype='float32').reshape(1, -1) for position in positions])
+        distances, indices = index.search(matrix, max_k)
+        for row, position in enumerate(positions):
+            k = requests[position][1]
+            results[position] = (distances[row:row + 1, :k], indices[row:row + 1, :k])
+    return results
+
+# Cross-request micro-batching for query encoding and FAISS search (EMBEDDING_BATCH_WINDOW_MS=0 disables)
+batch_window_seconds = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "2")) / 1000
+max_batch_size = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+embedding_batcher = MicroBatcher(_encode_batch, batch_window_seconds, max_batch_size, name="embedding-batcher")
+search_batcher = MicroBatcher(_search_batch, batch_window_seconds, max_batch_size, name="search-batcher")
+
+# Query embedding cache so repeat and fallback queries skip the transformer (0 disables)
+embedding_cache = EmbeddingCache(max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")))
+
+@tracing.span("embed_query")
+def embed_query(query: str):
+    """Encode a query into the float32 embedding row used for FAISS search"""
     if not load_vector_store():
-        return "Error: Could not load document index."
+        raise RuntimeError("Could not load document index.")
     
-    try:
-        # Encode query
-        query_embedding = embedding_model.encode([query])
-        
-        # Search FAISS index
-        distances, indices = faiss_index.search(query_embedding, k)
-        
-        # Get relevant texts
-        relevant_texts = []
-        for idx in indices[0]:
-            if idx < len(texts):
-                relevant_texts.append(texts[idx])
+    with stage_latency.time(stage="embed"):
+        key = EmbeddingCache.normalize(query)
+        vector = embedding_cache.get(key)
+        if vector is None:
+            vector = embedding_batcher.submit(key)
+            embedding_cache.put(key, vector)
+    return vector.reshape(1, -1)
+
+async def async_embed_query(query: str):
+    """Async embed_query: awaits the shared encoder batch instead of blocking an executor thread"""
+    with tracing.span("embed_query"):
+        if embedding_model is None or faiss_index is None:
+            # First use loads the model and index, which blocks, so it runs on the CPU executor
+            if not await asyncio.get_running_loop().run_in_executor(cpu_executor, load_vector_store):
+                raise RuntimeError("Could not load document index.")
         
-        return "\n\n".join(relevant_texts)
+        with stage_latency.time(stage="embed"):
+            key = EmbeddingCache.normalize(query)
+            vector = embedding_cache.get(key)
+            if vector is None:
+                vector = await embedding_batcher.asubmit(key, cpu_executor)
+                embedding_cache.put(key, vector)
+        return vector.reshape(1, -1)
+
+def retrieve_chunks(query: str, k: int = 5, query_embedding=None):
+    """Return up to k (chunk_id, fused_score) candidates from FAISS and BM25, best first"""
+    # Encode query unless the caller already did
+    if query_embedding is None:
+        query_embedding = embed_query(query)
+    
+    with stage_latency.time(stage="vector_search"):
+        # Search FAISS index (batched with concurrent requests)
+        request, fetch_k, track = dense_search_request(query, k, query_embedding)
+        dense_search = search_batcher.submit_async(request)
+        # BM25 runs in this thread while the FAISS search is in flight
+        lexical_ids = lexical_search(query, fetch_k, track)
+        return fuse_search_results(query_embedding, k, fetch_k, dense_search.result(), lexical_ids)
+
+def dense_search_request(query: str, k: int, query_embedding):
+    """(search_batcher request, fetch_k, track) for retrieving k candidates"""
+    fetch_k = max(k, hybrid_candidates) if bm25_index is not None else k
+    # Quantized codes only shortlist candidates; exact vectors re-rank them below
+    search_k = fetch_k * rerank_factor if exact_vectors is not None else fetch_k
+    track = route_query(query) if track_routing_enabled else None
+    if track is None:
+        return (query_embedding, search_k), fetch_k, None
+    # Only this certification's partition is searched
+    return (query_embedding, search_k, track), fetch_k, track
+
+def lexical_search(query: str, fetch_k: int, track=None):
+    """BM25 chunk IDs for the query (within the track's partition), or None without a BM25 index"""
+    if bm25_index is None:
+        return None
+    doc_mask = chunk_metadata.track_mask(track) if track is not None else None
+    return [chunk_id for chunk_id, _ in bm25_index.search(query, fetch_k, doc_mask=doc_mask)]
+
+def fuse_search_results(query_embedding, k: int, fetch_k: int, dense_result, lexical_ids):
+    """Exact re-rank of the FAISS shortlist, then RRF with the BM25 ranking"""
+    distances, indices = dense_result
+    if exact_vectors is not None:
+        indices = rerank_exact(query_embedding, indices[0], exact_vectors, fetch_k).reshape(1, -1)
+    # FAISS pads missing results with -1
+    dense_ids = [int(idx) for idx in indices[0] if 0 <= idx < len(texts)]
+    rankings = [dense_ids] if lexical_ids is None else [dense_ids, lexical_ids]
+    return reciprocal_rank_fusion(rankings, k, with_scores=True)
+
+def chunk_vectors(chunk_ids):
+    """Stored vectors for chunk IDs (exact when available), or None if the index cannot reconstruct them"""
+    if exact_vectors is not None:
+        return np.asarray(exact_vectors[np.asarray(chunk_ids, dtype='int64')], dtype='float32')
+    try:
+        return np.vstack([faiss_index.reconstruct(int(chunk_id)) for chunk_id in chunk_ids])
+    except Exception:
+        return None
+
+def query_similarities(query_embedding, vectors):
+    """Cosine similarity of the query to each chunk vector ([] when vectors are unavailable)"""
+    if vectors is None or query_embedding is None:
+        return []
+    query = np.asarray(query_embedding, dtype='float32').reshape(-1)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    return [float(score) for score in (vectors @ query) / np.maximum(norms, 1e-12)]
+
+@tracing.span("retrieve_answer")
+def retrieve_answer(query: str, k: int = 5, query_embedding=None, with_scores: bool = False):
+    """Retrieve relevant documents for the query, assembled into a token-budgeted context.
+
+    With ``with_scores`` returns (context, similarities): the cosine similarity
+    of the query to each retrieved candidate, in fused rank order.
+    """
+    if not load_vector_store():
+        message = "Error: Could not load document index."
+        return (message, []) if with_scores else message
+    
+    try:
+        if query_embedding is None:
+            query_embedding = embed_query(query)
+        candidates = retrieve_chunks(query, max(k, context_candidates), query_embedding)
+        return build_answer_context(candidates, k, query_embedding, with_scores)
     except Exception as e:
         print(f"Error in retrieve_answer: {e}")
-        return "Error retrieving documents."
+        message = "Error retrieving documents."
+        return (message, []) if with_scores else message
+
+def build_answer_context(candidates, k: int, query_embedding, with_scores: bool = False):
+    """Assemble retrieved (chunk_id, fused_score) candidates into the prompt context"""
+    candidates = [(chunk_id, score) for chunk_id, score in candidates if 0 <= chunk_id < len(texts)]
+    vectors = chunk_vectors([chunk_id for chunk_id, _ in candidates]) if candidates else None
+    context = "\n\n".join(text for _, text in select_answer_chunks(candidates, k, vectors))
+    return (context, query_similarities(query_embedding, vectors)) if with_scores else context
+
+def select_answer_chunks(candidates, k: int, vectors=None):
+    """(chunk_id, text) pairs that make up the prompt context, in prompt order.
+
+    ``candidates`` are valid (chunk_id, fused_score) pairs and ``vectors`` their
+    embeddings (looked up when omitted).
+    """
+    if vectors is None and candidates:
+        vectors = chunk_vectors([chunk_id for chunk_id, _ in candidates])
+    # Drop overlapping/near-duplicate text and pick diverse chunks within the budget
+    selected = select_context(
+        [(texts[chunk_id], score) for chunk_id, score in candidates],
+        token_budget=context_token_budget,
+        max_chunks=k,
+        vectors=vectors,
+        diversity=context_diversity
+    )
+    return [(candidates[position][0], text) for position, text in selected]
+
+class SemanticAnswerCache:
+    """In-process answer cache matched by cosine similarity of query embeddings.
+
+    A hit also needs the same certification scope (tracks, levels, numbers) as
+    the cached question, since "CCNA" and "CCNP" paraphrases embed almost alike.
+    Entries expire after ``ttl_seconds`` and are evicted least-recently-used
+    first once ``max_entries`` or ``max_bytes`` is exceeded.
+    """
+
+    def __init__(self, threshold=0.92, ttl_seconds=3600, max_entries=256, max_bytes=8 * 1024 * 1024):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (unit embedding, answer, created_at, size_bytes, scope)
+        self._bytes = 0
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def _normalize(query_embedding):
+        vector = np.asarray(query_embedding, dtype='float32').reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _remove(self, key):
+        size = self._entries.pop(key)[3]
+        self._bytes -= size
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry[2] > self.ttl_seconds]
+        for key in expired:
+            self._remove(key)
+            self.evictions += 1
+
+    def get(self, query_embedding, query: str = ""):
+        """Return the cached answer for the most similar same-scope query above the threshold, or None"""
+        vector = self._normalize(query_embedding)
+        scope = certification_scope(query)
+        with self._lock:
+            self._expire(time.monotonic())
+            keys = [key for key, entry in self._entries.items() if entry[4] == scope]
+            if keys:
+                scores = np.stack([self._entries[key][0] for key in keys]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return self._entries[keys[best]][1]
+            self.misses += 1
+            return None
+
+    def put(self, query_embedding, answer: str, query: str = ""):
+        """Store an answer for the query, evicting old entries to stay within limits"""
+        if not self.enabled or not answer:
+            return
+        vector = self._normalize(query_embedding)
+        size = vector.nbytes + len(answer.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._entries[self._next_key] = (vector, answer, time.monotonic(), size, certification_scope(query))
+            self._next_key += 1
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            }
+
+# Semantic answer cache for repeated/paraphrased questions (set SEMANTIC_CACHE_MAX_ENTRIES=0 to disable)
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(os.getenv("SEMANTIC_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+)
+
+def lookup_cached_answer(user_input: str, conversation_history=None):
+    """Return (query_embedding, cached_answer) for a standalone question.
+
+    Both are None when caching does not apply, e.g. when conversation history
+    makes the answer context-dependent.
+    """
+    if not answer_cache.enabled or conversation_history:
+        return None, None
+    try:
+        query_embedding = embed_query(user_input)
+    except Exception as e:
+        print(f"[ERROR] Could not embed query for answer cache: {e}")
+        return None, None
+    return query_embedding, answer_cache.get(query_embedding, user_input)
 
 def cleanup_memory():
     """Clean up memory after processing"""
@@ -84,10 +644,19 @@ def cleanup_memory():
 # Configure Gemini API
 if not api_key:
     raise ValueError("GOOGLE_API_KEY environment variable must be set")
-genai.configure(api_key=api_key)
+# GEMINI_API_ENDPOINT/GEMINI_TRANSPORT=rest point the client at another host (e.g. the loadtest.py stand-in)
+gemini_api_endpoint = os.getenv("GEMINI_API_ENDPOINT")
+gemini_transport = os.getenv("GEMINI_TRANSPORT") or None
+genai.configure(
+    api_key=api_key,
+    transport=gemini_transport,
+    client_options={"api_endpoint": gemini_api_endpoint} if gemini_api_endpoint else None
+)
 
 # Use Gemini 2.5 Flash for faster responses (optimized for speed)
-model = genai.GenerativeModel("gemini-2.5-flash")
+gemini_model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+gemini_context_cache_enabled = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+gemini_cache_ttl = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
 
 # Optimized generation config for comprehensive responses with good speed
 fast_generation_config = genai.types.GenerationConfig(
@@ -98,38 +667,109 @@ fast_generation_config = genai.types.GenerationConfig(
 )
 
 # Doc search tool using your improved retriever with lazy loading
-def doc_search(query: str) -> str:
+def doc_search(query: str, query_embedding=None, with_scores: bool = False):
     # Increase search results for comprehensive certification information
-    return retrieve_answer(query, k=5)
+    return retrieve_answer(query, k=5, query_embedding=query_embedding, with_scores=with_scores)
+
+# Internet search fallback via Serper API (pooled, deadline-bounded, cached)
+serper_client = create_serper_client()
 
-# Internet search fallback via Serper API
+@tracing.span("web_search")
 def web_search(query: str) -> str:
     # Skip web search if no API key to speed up response
     if not os.environ.get("SERPAPI_KEY"):
         return "Web search unavailable (no API key configured)."
     
-    url = "https://google.serper.dev/search"
-    payload = json.dumps({
-        "q": query,
-        "gl": "us",
-        "hl": "en"
-    })
-    headers = {
-        'X-API-KEY': os.environ.get("SERPAPI_KEY"),
-        'Content-Type': 'application/json'
-    }
+    try:
+        with stage_latency.time(stage="web_search"):
+            return serper_client.search(query, os.environ.get("SERPAPI_KEY"))
+    except Exception as e:
+        print(f"[ERROR] Web search failed: {e}")
+        return "Web search temporarily unavailable."
+
+# Executor used by the non-blocking chat pipeline for CPU-bound work
+cpu_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("RAG_CPU_WORKERS", "2")),
+    thread_name_prefix="rag-cpu"
+)
+
+# Blocking Gemini REST calls (GEMINI_TRANSPORT=rest) get their own pool instead of queueing on the default executor
+gemini_rest_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("GEMINI_REST_WORKERS", "64")),
+    thread_name_prefix="gemini-rest"
+)
+
+async def run_blocking_gemini(fn, *args, **kwargs):
+    """Run a blocking Gemini SDK call on the REST worker pool, keeping the active trace"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(gemini_rest_executor, tracing.bind(lambda: fn(*args, **kwargs)))
+
+async def close_async_clients():
+    """Close pooled async HTTP connections (called on app shutdown)"""
+    await serper_client.aclose()
+
+async def async_retrieve_chunks(query: str, k: int, query_embedding):
+    """Async retrieve_chunks: the FAISS search awaits the shared search batch without holding a thread.
+
+    Only BM25 and the exact re-rank/fusion run on the CPU executor, so the
+    batch can span every in-flight request rather than RAG_CPU_WORKERS of them.
+    """
+    loop = asyncio.get_running_loop()
+    with stage_latency.time(stage="vector_search"):
+        request, fetch_k, track = dense_search_request(query, k, query_embedding)
+        lexical = loop.run_in_executor(cpu_executor, tracing.bind(lexical_search), query, fetch_k, track)
+        try:
+            dense_result = await search_batcher.asubmit(request, cpu_executor)
+        finally:
+            lexical_ids = await lexical
+        return await loop.run_in_executor(
+            cpu_executor, tracing.bind(fuse_search_results), query_embedding, k, fetch_k, dense_result, lexical_ids
+        )
+
+async def async_retrieve_answer(query: str, k: int = 5, query_embedding=None, with_scores: bool = False):
+    """Async retrieve_answer: embedding and FAISS search join the shared batches, assembly runs on the CPU executor"""
+    loop = asyncio.get_running_loop()
+    with tracing.span("retrieve_answer"):
+        if (embedding_model is None or faiss_index is None) and not await loop.run_in_executor(cpu_executor, load_vector_store):
+            message = "Error: Could not load document index."
+            return (message, []) if with_scores else message
+        try:
+            if query_embedding is None:
+                query_embedding = await async_embed_query(query)
+            candidates = await async_retrieve_chunks(query, max(k, context_candidates), query_embedding)
+            return await loop.run_in_executor(
+                cpu_executor, tracing.bind(build_answer_context), candidates, k, query_embedding, with_scores
+            )
+        except Exception as e:
+            print(f"Error in retrieve_answer: {e}")
+            message = "Error retrieving documents."
+            return (message, []) if with_scores else message
+
+async def async_doc_search(query: str, query_embedding=None, with_scores: bool = False):
+    """Async doc_search: no executor thread is held while the query waits for its encode or search batch"""
+    return await async_retrieve_answer(query, k=5, query_embedding=query_embedding, with_scores=with_scores)
+
+async def async_lookup_cached_answer(user_input: str, conversation_history=None):
+    """Async lookup_cached_answer: the query joins the shared encoder batch without holding an executor thread"""
+    if not answer_cache.enabled or conversation_history:
+        return None, None
+    try:
+        query_embedding = await async_embed_query(user_input)
+    except Exception as e:
+        print(f"[ERROR] Could not embed query for answer cache: {e}")
+        return None, None
+    return query_embedding, answer_cache.get(query_embedding, user_input)
+
+async def async_web_search(query: str) -> str:
+    """Non-blocking Serper search using the pooled async HTTP client"""
+    if not os.environ.get("SERPAPI_KEY"):
+        return "Web search unavailable (no API key configured)."
     
     try:
-        response = requests.post(url, headers=headers, data=payload)
-        response.raise_for_status()
-        results = response.json()
-        
-        # Extract organic results
-        if 'organic' in results:
-            snippets = [r.get("snippet", "") for r in results['organic'][:2] if r.get("snippet")]
-            return "\n".join(snippets) if snippets else "No internet results found."
-        return "No internet results found."
+        with tracing.span("web_search"), stage_latency.time(stage="web_search"):
+            return await serper_client.asearch(query, os.environ.get("SERPAPI_KEY"))
     except Exception as e:
+        print(f"[ERROR] Web search failed: {e}")
         return "Web search temporarily unavailable."
 
 # System prompt for Gemini
@@ -248,81 +888,114 @@ system_prompt = """You are a knowledgeable network automation expert who also pr
 <li>Provide specific URLs from verified list rather than generic descriptions</li>
 </ul>"""
 
-def chat(user_input, conversation_history=None, preload_only=False):
-    """Hybrid RAG chat function using Gemini API with conversation memory"""
-    if conversation_history is None:
-        conversation_history = []
-    
-    # If preload_only is True, just initialize models and return
-    if preload_only:
+# HTML formatting rules shared by the RAG and fallback prompts
+html_formatting_instructions = """1. Use <strong>text</strong> for emphasis (never use asterisks)
+2. Use proper HTML lists with consistent spacing:
+   - Unordered lists: <ul style="margin: 0.25em 0;"><li style="margin: 0.125em 0;">Item 1</li><li style="margin: 0.125em 0;">Item 2</li></ul>
+   - Ordered lists: <ol style="margin: 0.25em 0;"><li style="margin: 0.125em 0;">First item</li><li style="margin: 0.125em 0;">Second item</li></ol>
+3. Format links as HTML anchor tags with target="_blank" and do not show raw URLs:
+   <a href="https://example.com" target="_blank">Resource Name</a>
+4. Use proper paragraph spacing and formatting:
+   - Use ONLY a single <br/> between paragraphs and sections
+   - NEVER use multiple <br/> tags or blank lines
+   - Keep headings on the same line as their content
+   - Keep list introductions on the same line as the first list item
+   - Remove ALL extra whitespace
+   - Format as a continuous flow with minimal breaks
+   - Use <strong> tags for visual structure
+   - Keep certification relevance immediately after main content
+   - ALWAYS spell "Cisco U." with a period
+   - NEVER leave more than one blank line between any sections
+5. Keep related content together:
+   - Don't split sentences across lines unnecessarily
+   - Keep list items with their introductory text
+   - Keep punctuation with its preceding text
+6. NEVER use markdown formatting (no asterisks, no dashes for bullets)
+"""
+
+# Static prefix of every request, sent once as the model's system instruction
+system_instruction = f"""{system_prompt}
+
+<strong>Response Formatting:</strong><br/>
+When answering technical or certification questions, format your response using proper HTML with consistent spacing:
+
+{html_formatting_instructions}"""
+
+_gemini_model = None
+_gemini_model_expires_at = None
+_gemini_model_lock = threading.Lock()
+
+def _create_gemini_model():
+    """Build the Gemini model, returning (model, monotonic expiry or None)"""
+    if gemini_context_cache_enabled:
         try:
-            load_vector_store()
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            return "Models preloaded successfully"
+            cached_content = genai.caching.CachedContent.create(
+                model=f"models/{gemini_model_name}",
+                display_name="cisco-rag-system-instruction",
+                system_instruction=system_instruction,
+                ttl=datetime.timedelta(seconds=gemini_cache_ttl)
+            )
+            print(f"[DEBUG] Gemini context cache created: {cached_content.name}")
+            # Recreate shortly before the server-side cache expires
+            return genai.GenerativeModel.from_cached_content(cached_content), time.monotonic() + gemini_cache_ttl * 0.9
         except Exception as e:
-            return f"Preload failed: {str(e)}"
-    # Check if API key is available
-    if not api_key:
-        return "❌ **Configuration Error**: Google API key is not configured. Please check your environment variables and redeploy the application."
-    
-    try:
-        # Initialize Gemini model
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        # Check if this is a simple greeting or casual interaction
-        casual_patterns = ['hi', 'hello', 'hey', 'thanks', 'thank you', 'bye', 'goodbye']
-        is_casual = any(pattern in user_input.lower().strip() for pattern in casual_patterns) and len(user_input.strip()) < 20
-        
-        if is_casual:
-            # For casual interactions, respond directly without document search
-            # Build conversation context
-            conversation_context = ""
-            if conversation_history:
-                conversation_context = "\n\n<strong>Previous Conversation:</strong><br/>"
-                for msg in conversation_history[-4:]:  # Last 4 messages for context
-                    role = "Assistant" if msg['role'] == 'assistant' else "User"
-                    conversation_context += f"<strong>{role}:</strong> {msg['content'][:200]}...<br/>"
-            
-            simple_prompt = f"""{system_prompt}{conversation_context}
+            print(f"[WARNING] Gemini context cache unavailable, using system instruction: {e}")
+    return genai.GenerativeModel(gemini_model_name, system_instruction=system_instruction), None
+
+def get_gemini_model():
+    """Process-wide Gemini model with the static system prompt set once"""
+    global _gemini_model, _gemini_model_expires_at
+    with _gemini_model_lock:
+        if _gemini_model is None or (_gemini_model_expires_at is not None and time.monotonic() >= _gemini_model_expires_at):
+            _gemini_model, _gemini_model_expires_at = _create_gemini_model()
+        return _gemini_model
+
+def gemini_model_is_current() -> bool:
+    """True when get_gemini_model() can return the shared model without rebuilding it"""
+    return _gemini_model is not None and (_gemini_model_expires_at is None or time.monotonic() < _gemini_model_expires_at)
+
+async def aget_gemini_model():
+    """get_gemini_model() for the event loop: building the model may create a context cache over the network"""
+    if gemini_model_is_current():
+        return get_gemini_model()
+    return await run_blocking_gemini(get_gemini_model)
+
+def reset_gemini_model():
+    """Drop the shared model so the next request builds a new one"""
+    global _gemini_model, _gemini_model_expires_at
+    with _gemini_model_lock:
+        _gemini_model, _gemini_model_expires_at = None, None
+
+def is_casual_message(user_input: str) -> bool:
+    """Check if this is a simple greeting or casual interaction"""
+    casual_patterns = ['hi', 'hello', 'hey', 'thanks', 'thank you', 'bye', 'goodbye']
+    return any(pattern in user_input.lower().strip() for pattern in casual_patterns) and len(user_input.strip()) < 20
+
+def build_conversation_context(conversation_history) -> str:
+    """Render the last few conversation turns for inclusion in a prompt"""
+    conversation_context = ""
+    if conversation_history:
+        conversation_context = "\n\n<strong>Previous Conversation:</strong><br/>"
+        for msg in conversation_history[-4:]:  # Last 4 messages for context
+            role = "Assistant" if msg['role'] == 'assistant' else "User"
+            conversation_context += f"<strong>{role}:</strong> {msg['content'][:200]}...<br/>"
+    return conversation_context
+
+@stage_latency.time(stage="prompt_build")
+def build_casual_prompt(user_input: str, conversation_context: str) -> str:
+    """Prompt for casual interactions that skip document search"""
+    return f"""{conversation_context.lstrip()}
 
 <strong>Current User Message:</strong> {user_input}
 
 <strong>Instructions:</strong><br/>
 Respond naturally and briefly to this casual interaction. Be friendly and helpful, and let the user know you're here to help with Cisco certification questions when they're ready. If the user is asking about a previous question or response, reference the conversation history above.
 """
-            response = model.generate_content(simple_prompt)
-            return response.text
-        else:
-            # For technical questions, use optimized RAG pipeline
-            try:
-                print(f"[DEBUG] Processing technical query: {user_input}")
-                
-                # Step 1 & 2: Run document and web search in parallel for speed
-                print("[DEBUG] Starting parallel document and web search...")
-                
-                with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                    # Submit both searches concurrently
-                    doc_future = executor.submit(doc_search, user_input)
-                    web_future = executor.submit(web_search, user_input)
-                    
-                    # Get results as they complete
-                    doc_context = doc_future.result()
-                    web_context = web_future.result()
-                
-                print(f"[DEBUG] Parallel search completed. Doc context: {len(doc_context)}, Web context: {len(web_context)}")
-                
-                # Step 3: Construct streamlined prompt with conversation history
-                # Build conversation context for technical queries
-                conversation_context = ""
-                if conversation_history:
-                    conversation_context = "\n\n<strong>Previous Conversation:</strong><br/>"
-                    for msg in conversation_history[-4:]:  # Last 4 messages for context
-                        role = "Assistant" if msg['role'] == 'assistant' else "User"
-                        conversation_context += f"<strong>{role}:</strong> {msg['content'][:200]}...<br/>"
-                
-                enhanced_prompt = f"""{system_prompt}{conversation_context}
+
+@stage_latency.time(stage="prompt_build")
+def build_rag_prompt(user_input: str, conversation_context: str, doc_context: str, web_context: str) -> str:
+    """Prompt for technical questions using document and web context"""
+    return f"""{conversation_context.lstrip()}
 
 <strong>Current User Question:</strong> {user_input}
 
@@ -341,106 +1014,437 @@ Provide a comprehensive, detailed answer as a Cisco certification expert. If the
 <li>Provide specific course URLs and learning paths from the knowledge base</li>
 </ol>
 
-Use the context above extensively and cite sources naturally. Be thorough and practical, leveraging all available PDF content for certification guidance. Format your response using proper HTML with consistent spacing:
+Use the context above extensively and cite sources naturally. Be thorough and practical, leveraging all available PDF content for certification guidance. Format your response using the HTML formatting rules from your instructions."""
 
-1. Use <strong>text</strong> for emphasis (never use asterisks)
-2. Use proper HTML lists with consistent spacing:
-   - Unordered lists: <ul style="margin: 0.25em 0;"><li style="margin: 0.125em 0;">Item 1</li><li style="margin: 0.125em 0;">Item 2</li></ul>
-   - Ordered lists: <ol style="margin: 0.25em 0;"><li style="margin: 0.125em 0;">First item</li><li style="margin: 0.125em 0;">Second item</li></ol>
-3. Format links as HTML anchor tags with target="_blank" and do not show raw URLs:
-   <a href="https://example.com" target="_blank">Resource Name</a>
-4. Use proper paragraph spacing and formatting:
-   - Use ONLY a single <br/> between paragraphs and sections
-   - NEVER use multiple <br/> tags or blank lines
-   - Keep headings on the same line as their content
-   - Keep list introductions on the same line as the first list item
-   - Remove ALL extra whitespace
-   - Format as a continuous flow with minimal breaks
-   - Use <strong> tags for visual structure
-   - Keep certification relevance immediately after main content
-   - ALWAYS spell "Cisco U." with a period
-   - NEVER leave more than one blank line between any sections
-5. Keep related content together:
-   - Don't split sentences across lines unnecessarily
-   - Keep list items with their introductory text
-   - Keep punctuation with its preceding text
-6. NEVER use markdown formatting (no asterisks, no dashes for bullets)
-"""
+@stage_latency.time(stage="prompt_build")
+def build_fallback_prompt(user_input: str, conversation_context: str, doc_only_context: str) -> str:
+    """Prompt for the document-only fallback when the full pipeline fails"""
+    return f"""{conversation_context.lstrip()}
+
+<strong>Current User Question:</strong> {user_input}
+
+<strong>Available Documentation:</strong><br/>
+{doc_only_context}
+
+<strong>Instructions:</strong><br/>
+Answer based on the documentation above. Be helpful and direct. If the user is referencing a previous question, use the conversation history for context. Format your response using the HTML formatting rules from your instructions."""
+
+# Confidence-gated web search: "speculative" (default) starts both searches but stops waiting for the web
+# when local retrieval is strong, so a weak match costs max(doc, web) instead of doc + web;
+# "gated" searches the web only after weak local retrieval, saving Serper queries at the cost of that serial latency;
+# "always" keeps the unconditional parallel search
+web_search_policy = os.getenv("WEB_SEARCH_POLICY", "speculative")
+web_search_confidence = float(os.getenv("WEB_SEARCH_CONFIDENCE", "0.6"))
+WEB_SEARCH_SKIPPED = "Not searched: the documentation context closely matches this question."
+
+def needs_web_search(similarities) -> bool:
+    """True unless the best local match is similar enough to answer without the web"""
+    if web_search_policy == "always" or not similarities:
+        return True
+    return max(similarities) < web_search_confidence
+
+def record_web_search_decision(search: bool, similarities):
+    """Count whether web search ran and note the retrieval confidence on the current span"""
+    web_search_decisions.inc(decision="searched" if search else "skipped")
+    span = tracing.current_span()
+    if span is not None:
+        span.set_attribute("web_search.skipped", not search)
+        if similarities:
+            span.set_attribute("retrieval.confidence", round(max(similarities), 4))
+
+@tracing.span("gather_context")
+def gather_context(user_input: str, query_embedding=None):
+    """Return (doc_context, web_context), searching the web per WEB_SEARCH_POLICY"""
+    if web_search_policy == "gated":
+        doc_context, similarities = doc_search(user_input, query_embedding, with_scores=True)
+        search = needs_web_search(similarities)
+        record_web_search_decision(search, similarities)
+        return doc_context, web_search(user_input) if search else WEB_SEARCH_SKIPPED
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    try:
+        # Submit both searches concurrently (bound to this trace)
+        doc_future = executor.submit(tracing.bind(doc_search), user_input, query_embedding, with_scores=True)
+        web_future = executor.submit(tracing.bind(web_search), user_input)
+
+        doc_context, similarities = doc_future.result()
+        search = needs_web_search(similarities)
+        record_web_search_decision(search, similarities)
+        if not search:
+            web_future.cancel()
+            return doc_context, WEB_SEARCH_SKIPPED
+        return doc_context, web_future.result()
+    finally:
+        # A skipped web search finishes (within its deadline) without holding up the answer
+        executor.shutdown(wait=False)
+
+# Answer path (casual, cache, rag, fallback) of the request running in this context
+answer_path = contextvars.ContextVar("answer_path", default=None)
+
+def record_answer_path(path: str):
+    """Count the answer path and remember it for the current request and span"""
+    chat_requests.inc(path=path)
+    answer_path.set(path)
+    span = tracing.current_span()
+    if span is not None:
+        span.set_attribute("answer.path", path)
+
+def iter_response_text(response):
+    """Yield text from a streamed Gemini response, skipping chunks without text parts"""
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks that only carry finish/safety metadata have no text
+            continue
+        if text:
+            yield text
+
+def generate_text(model, prompt, generation_config=None) -> str:
+    """Generate a complete Gemini answer, recording its latency"""
+    with tracing.span("gemini.generate_content", model=gemini_model_name, stream=False), stage_latency.time(stage="llm_generation"):
+        return model.generate_content(prompt, generation_config=generation_config).text
+
+def stream_text(model, prompt, generation_config=None):
+    """Stream Gemini answer text, recording latency until the stream ends"""
+    with tracing.span("gemini.generate_content", model=gemini_model_name, stream=True), stage_latency.time(stage="llm_generation"):
+        yield from iter_response_text(model.generate_content(prompt, generation_config=generation_config, stream=True))
+
+def chat(user_input, conversation_history=None, preload_only=False):
+    """Hybrid RAG chat function using Gemini API with conversation memory"""
+    with tracing.span("chat", stream=False):
+        if conversation_history is None:
+            conversation_history = []
+        
+        # If preload_only is True, just initialize models and return
+        if preload_only:
+            try:
+                load_vector_store()
+                get_gemini_model()
+                return "Models preloaded successfully"
+            except Exception as e:
+                return f"Preload failed: {str(e)}"
+        # Check if API key is available
+        if not api_key:
+            return "❌ **Configuration Error**: Google API key is not configured. Please check your environment variables and redeploy the application."
+        
+        try:
+            # Shared Gemini model (system prompt already set)
+            model = get_gemini_model()
+            conversation_context = build_conversation_context(conversation_history)
+            
+            if is_casual_message(user_input):
+                # For casual interactions, respond directly without document search
+                record_answer_path("casual")
+                return generate_text(model, build_casual_prompt(user_input, conversation_context))
+            else:
+                # For technical questions, use optimized RAG pipeline
+                query_embedding = None
+                try:
+                    print(f"[DEBUG] Processing technical query: {user_input}")
+                    
+                    # Step 0: Answer repeated/paraphrased standalone questions from the semantic cache
+                    query_embedding, cached_answer = lookup_cached_answer(user_input, conversation_history)
+                    if cached_answer is not None:
+                        print("[DEBUG] Semantic answer cache hit")
+                        record_answer_path("cache")
+                        return cached_answer
+                    
+                    # Step 1 & 2: Run document and web search in parallel for speed
+                    print("[DEBUG] Starting parallel document and web search...")
+                    doc_context, web_context = gather_context(user_input, query_embedding)
+                    print(f"[DEBUG] Parallel search completed. Doc context: {len(doc_context)}, Web context: {len(web_context)}")
+                    
+                    # Step 3: Construct streamlined prompt with conversation history
+                    enhanced_prompt = build_rag_prompt(user_input, conversation_context, doc_context, web_context)
+                    
+                    # Step 4: Generate response with Gemini (with timeout handling)
+                    print("[DEBUG] Generating response with Gemini...")
+                    answer = generate_text(model, enhanced_prompt, fast_generation_config)
+                    print("[DEBUG] Response generated successfully")
+                    record_answer_path("rag")
+                    if query_embedding is not None:
+                        answer_cache.put(query_embedding, answer, user_input)
+                    
+                    # Cleanup memory after processing
+                    cleanup_memory()
+                    return answer
+                
+                except Exception as tech_error:
+                    print(f"[ERROR] Technical query failed: {str(tech_error)}")
+                    print(f"[ERROR] Error type: {type(tech_error).__name__}")
+                    import traceback
+                    print(f"[ERROR] Full traceback: {traceback.format_exc()}")
+                    
+                    # Fallback to document-only response if full pipeline fails
+                    try:
+                        with tracing.span("fallback"):
+                            print("[DEBUG] Attempting document-only fallback...")
+                            doc_only_context = doc_search(user_input, query_embedding)
+                            print(f"[DEBUG] Document-only context length: {len(doc_only_context)}")
+                            
+                            fallback_prompt = build_fallback_prompt(user_input, conversation_context, doc_only_context)
+                            record_answer_path("fallback")
+                            return generate_text(model, fallback_prompt)
+                    except Exception as fallback_error:
+                        print(f"[ERROR] Fallback also failed: {str(fallback_error)}")
+                        print(f"[ERROR] Fallback error type: {type(fallback_error).__name__}")
+                        return f"Debug info - Technical error: {str(tech_error)}, Fallback error: {str(fallback_error)}"
+            
+        except Exception as e:
+            return f"Error generating response: {str(e)}. Please try again."
+
+def chat_stream(user_input, conversation_history=None):
+    """Streaming variant of chat() that yields response text chunks as Gemini produces them"""
+    with tracing.span("chat", stream=True):
+        if conversation_history is None:
+            conversation_history = []
+
+        # Check if API key is available
+        if not api_key:
+            yield "❌ **Configuration Error**: Google API key is not configured. Please check your environment variables and redeploy the application."
+            return
+
+        try:
+            # Shared Gemini model (system prompt already set)
+            model = get_gemini_model()
+            conversation_context = build_conversation_context(conversation_history)
+
+            if is_casual_message(user_input):
+                # For casual interactions, respond directly without document search
+                record_answer_path("casual")
+                yield from stream_text(model, build_casual_prompt(user_input, conversation_context))
+                return
+        except Exception as e:
+            yield f"Error generating response: {str(e)}. Please try again."
+            return
+
+        # For technical questions, stream the RAG answer
+        emitted = []
+        query_embedding = None
+        try:
+            print(f"[DEBUG] Processing technical query (stream): {user_input}")
+            query_embedding, cached_answer = lookup_cached_answer(user_input, conversation_history)
+            if cached_answer is not None:
+                print("[DEBUG] Semantic answer cache hit")
+                record_answer_path("cache")
+                yield cached_answer
+                return
+
+            doc_context, web_context = gather_context(user_input, query_embedding)
+            print(f"[DEBUG] Parallel search completed. Doc context: {len(doc_context)}, Web context: {len(web_context)}")
+
+            enhanced_prompt = build_rag_prompt(user_input, conversation_context, doc_context, web_context)
+            for text in stream_text(model, enhanced_prompt, fast_generation_config):
+                emitted.append(text)
+                yield text
+            record_answer_path("rag")
+            if query_embedding is not None:
+                answer_cache.put(query_embedding, "".join(emitted), user_input)
+            cleanup_memory()
+            return
+        except Exception as tech_error:
+            print(f"[ERROR] Technical query stream failed: {str(tech_error)}")
+            if emitted:
+                # Part of the answer already reached the client, so a fallback would duplicate it
+                return
+            error_message = str(tech_error)
+
+        # Fallback to document-only response if the full pipeline failed before any output
+        try:
+            with tracing.span("fallback"):
+                print("[DEBUG] Attempting document-only fallback (stream)...")
+                doc_only_context = doc_search(user_input, query_embedding)
+                fallback_prompt = build_fallback_prompt(user_input, conversation_context, doc_only_context)
+                record_answer_path("fallback")
+                yield from stream_text(model, fallback_prompt)
+        except Exception as fallback_error:
+            print(f"[ERROR] Fallback stream also failed: {str(fallback_error)}")
+            yield f"Debug info - Technical error: {error_message}, Fallback error: {str(fallback_error)}"
+
+async def async_gather_context(user_input: str, query_embedding=None):
+    """Async gather_context: document and web search per WEB_SEARCH_POLICY without blocking the event loop"""
+    with tracing.span("gather_context"):
+        if web_search_policy == "gated":
+            doc_context, similarities = await async_doc_search(user_input, query_embedding, with_scores=True)
+            search = needs_web_search(similarities)
+            record_web_search_decision(search, similarities)
+            return doc_context, await async_web_search(user_input) if search else WEB_SEARCH_SKIPPED
+
+        web_task = asyncio.ensure_future(async_web_search(user_input))
+        try:
+            doc_context, similarities = await async_doc_search(user_input, query_embedding, with_scores=True)
+        except BaseException:
+            web_task.cancel()
+            raise
+        search = needs_web_search(similarities)
+        record_web_search_decision(search, similarities)
+        if not search:
+            web_task.cancel()
+            return doc_context, WEB_SEARCH_SKIPPED
+        return doc_context, await web_task
+
+async def async_iter_response_text(response):
+    """Async counterpart of iter_response_text for streamed Gemini responses"""
+    async for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            continue
+        if text:
+            yield text
+
+async def agenerate_text(model, prompt, generation_config=None) -> str:
+    """Async counterpart of generate_text"""
+    with tracing.span("gemini.generate_content", model=gemini_model_name, stream=False), stage_latency.time(stage="llm_generation"):
+        if gemini_transport == "rest":
+            # The SDK has no async REST client, so the blocking call runs in a worker thread
+            response = await run_blocking_gemini(model.generate_content, prompt, generation_config=generation_config)
+        else:
+            response = await model.generate_content_async(prompt, generation_config=generation_config)
+        return response.text
+
+async def astream_text(model, prompt, generation_config=None):
+    """Async counterpart of stream_text"""
+    with tracing.span("gemini.generate_content", model=gemini_model_name, stream=True), stage_latency.time(stage="llm_generation"):
+        if gemini_transport == "rest":
+            response = await run_blocking_gemini(model.generate_content, prompt, generation_config=generation_config, stream=True)
+            texts = iter_response_text(response)
+            while (text := await run_blocking_gemini(next, texts, None)) is not None:
+                yield text
+            return
+        response = await model.generate_content_async(prompt, generation_config=generation_config, stream=True)
+        async for text in async_iter_response_text(response):
+            yield text
+
+async def achat(user_input, conversation_history=None):
+    """Async-native chat() that keeps the event loop free while waiting on search and Gemini.
+
+    Unlike chat() it does not force a gc.collect() per request: a full
+    collection stops the event loop, serializing concurrent users.
+    """
+    with tracing.span("chat", stream=False):
+        if conversation_history is None:
+            conversation_history = []
+        
+        # Check if API key is available
+        if not api_key:
+            return "❌ **Configuration Error**: Google API key is not configured. Please check your environment variables and redeploy the application."
+        
+        try:
+            # Shared Gemini model (system prompt already set), built off the event loop when needed
+            model = await aget_gemini_model()
+            conversation_context = build_conversation_context(conversation_history)
+            
+            if is_casual_message(user_input):
+                record_answer_path("casual")
+                return await agenerate_text(model, build_casual_prompt(user_input, conversation_context))
+            
+            query_embedding = None
+            try:
+                print(f"[DEBUG] Processing technical query (async): {user_input}")
+                query_embedding, cached_answer = await async_lookup_cached_answer(user_input, conversation_history)
+                if cached_answer is not None:
+                    print("[DEBUG] Semantic answer cache hit")
+                    record_answer_path("cache")
+                    return cached_answer
                 
-                # Step 4: Generate response with Gemini (with timeout handling)
-                print("[DEBUG] Generating response with Gemini...")
-                response = model.generate_content(
-                    enhanced_prompt,
-                    generation_config=fast_generation_config
-                )
-                print("[DEBUG] Response generated successfully")
+                doc_context, web_context = await async_gather_context(user_input, query_embedding)
+                print(f"[DEBUG] Parallel search completed. Doc context: {len(doc_context)}, Web context: {len(web_context)}")
                 
-                # Cleanup memory after processing
-                cleanup_memory()
-                return response.text
+                enhanced_prompt = build_rag_prompt(user_input, conversation_context, doc_context, web_context)
+                answer = await agenerate_text(model, enhanced_prompt, fast_generation_config)
+                record_answer_path("rag")
+                if query_embedding is not None:
+                    answer_cache.put(query_embedding, answer, user_input)
+                return answer
             
             except Exception as tech_error:
                 print(f"[ERROR] Technical query failed: {str(tech_error)}")
                 print(f"[ERROR] Error type: {type(tech_error).__name__}")
-                import traceback
-                print(f"[ERROR] Full traceback: {traceback.format_exc()}")
                 
                 # Fallback to document-only response if full pipeline fails
                 try:
-                    print("[DEBUG] Attempting document-only fallback...")
-                    doc_only_context = doc_search(user_input)
-                    print(f"[DEBUG] Document-only context length: {len(doc_only_context)}")
-                    
-                    # Build conversation context for fallback
-                    conversation_context = ""
-                    if conversation_history:
-                                            conversation_context = "\n\n<strong>Previous Conversation:</strong><br/>"
-                    for msg in conversation_history[-4:]:  # Last 4 messages for context
-                        role = "Assistant" if msg['role'] == 'assistant' else "User"
-                        conversation_context += f"<strong>{role}:</strong> {msg['content'][:200]}...<br/>"
-                    
-                    fallback_prompt = f"""{system_prompt}{conversation_context}
-
-<strong>Current User Question:</strong> {user_input}
-
-<strong>Available Documentation:</strong><br/>
-{doc_only_context}
-
-<strong>Instructions:</strong><br/>
-Answer based on the documentation above. Be helpful and direct. If the user is referencing a previous question, use the conversation history for context. Format your response using proper HTML with consistent spacing:
-
-1. Use <strong>text</strong> for emphasis (never use asterisks)
-2. Use proper HTML lists with consistent spacing:
-   - Unordered lists: <ul style="margin: 0.25em 0;"><li style="margin: 0.125em 0;">Item 1</li><li style="margin: 0.125em 0;">Item 2</li></ul>
-   - Ordered lists: <ol style="margin: 0.25em 0;"><li style="margin: 0.125em 0;">First item</li><li style="margin: 0.125em 0;">Second item</li></ol>
-3. Format links as HTML anchor tags with target="_blank" and do not show raw URLs:
-   <a href="https://example.com" target="_blank">Resource Name</a>
-4. Use proper paragraph spacing and formatting:
-   - Use ONLY a single <br/> between paragraphs and sections
-   - NEVER use multiple <br/> tags or blank lines
-   - Keep headings on the same line as their content
-   - Keep list introductions on the same line as the first list item
-   - Remove ALL extra whitespace
-   - Format as a continuous flow with minimal breaks
-   - Use <strong> tags for visual structure
-   - Keep certification relevance immediately after main content
-   - ALWAYS spell "Cisco U." with a period
-   - NEVER leave more than one blank line between any sections
-5. Keep related content together:
-   - Don't split sentences across lines unnecessarily
-   - Keep list items with their introductory text
-   - Keep punctuation with its preceding text
-6. NEVER use markdown formatting (no asterisks, no dashes for bullets)
-"""
-                    response = model.generate_content(fallback_prompt)
-                    return response.text
+                    with tracing.span("fallback"):
+                        print("[DEBUG] Attempting document-only fallback...")
+                        doc_only_context = await async_doc_search(user_input, query_embedding)
+                        fallback_prompt = build_fallback_prompt(user_input, conversation_context, doc_only_context)
+                        record_answer_path("fallback")
+                        return await agenerate_text(model, fallback_prompt)
                 except Exception as fallback_error:
                     print(f"[ERROR] Fallback also failed: {str(fallback_error)}")
-                    print(f"[ERROR] Fallback error type: {type(fallback_error).__name__}")
                     return f"Debug info - Technical error: {str(tech_error)}, Fallback error: {str(fallback_error)}"
         
-    except Exception as e:
-        return f"Error generating response: {str(e)}. Please try again."
+        except Exception as e:
+            return f"Error generating response: {str(e)}. Please try again."
+
+async def achat_stream(user_input, conversation_history=None):
+    """Async-native chat_stream() yielding response text chunks as Gemini produces them"""
+    with tracing.span("chat", stream=True):
+        if conversation_history is None:
+            conversation_history = []
+
+        # Check if API key is available
+        if not api_key:
+            yield "❌ **Configuration Error**: Google API key is not configured. Please check your environment variables and redeploy the application."
+            return
+
+        try:
+            # Shared Gemini model (system prompt already set), built off the event loop when needed
+            model = await aget_gemini_model()
+            conversation_context = build_conversation_context(conversation_history)
+
+            if is_casual_message(user_input):
+                record_answer_path("casual")
+                async for text in astream_text(model, build_casual_prompt(user_input, conversation_context)):
+                    yield text
+                return
+        except Exception as e:
+            yield f"Error generating response: {str(e)}. Please try again."
+            return
+
+        # For technical questions, stream the RAG answer
+        emitted = []
+        query_embedding = None
+        try:
+            print(f"[DEBUG] Processing technical query (async stream): {user_input}")
+            query_embedding, cached_answer = await async_lookup_cached_answer(user_input, conversation_history)
+            if cached_answer is not None:
+                print("[DEBUG] Semantic answer cache hit")
+                record_answer_path("cache")
+                yield cached_answer
+                return
+
+            doc_context, web_context = await async_gather_context(user_input, query_embedding)
+            print(f"[DEBUG] Parallel search completed. Doc context: {len(doc_context)}, Web context: {len(web_context)}")
+
+            enhanced_prompt = build_rag_prompt(user_input, conversation_context, doc_context, web_context)
+            async for text in astream_text(model, enhanced_prompt, fast_generation_config):
+                emitted.append(text)
+                yield text
+            record_answer_path("rag")
+            if query_embedding is not None:
+                answer_cache.put(query_embedding, "".join(emitted), user_input)
+            return
+        except Exception as tech_error:
+            print(f"[ERROR] Technical query stream failed: {str(tech_error)}")
+            if emitted:
+                # Part of the answer already reached the client, so a fallback would duplicate it
+                return
+            error_message = str(tech_error)
+
+        # Fallback to document-only response if the full pipeline failed before any output
+        try:
+            with tracing.span("fallback"):
+                print("[DEBUG] Attempting document-only fallback (async stream)...")
+                doc_only_context = await async_doc_search(user_input, query_embedding)
+                fallback_prompt = build_fallback_prompt(user_input, conversation_context, doc_only_context)
+                record_answer_path("fallback")
+                async for text in astream_text(model, fallback_prompt):
+                    yield text
+        except Exception as fallback_error:
+            print(f"[ERROR] Fallback stream also failed: {str(fallback_error)}")
+            yield f"Debug info - Technical error: {error_message}, Fallback error: {str(fallback_error)}"
 
 # For local testing
 if __name__ == "__main__":
@@ -0,0 +1,325 @@
+# loadtest.py
+"""
+Load-test harness for /chat with local Gemini and Serper stand-ins.
+
+A mock upstream server emulates the Gemini REST API (generateContent and
+streamGenerateContent) and the Serper search API with log-normal latency and
+injected error rates. The harness points hybrid_rag_gpt at it, serves
+fastapi_only.app locally and drives /chat with open-loop Poisson arrivals at
+a fixed rate, then reports latency percentiles, throughput and error rate per
+answer path (casual, cache, rag, fallback):
+
+    python loadtest.py --rate 20 --duration 60 --gemini-latency-ms 900 --gemini-error-rate 0.02
+    python loadtest.py --mocks-only          # only serve the stand-ins for another process
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import httpx
+import numpy as np
+
+os.environ.setdefault("GOOGLE_API_KEY", "loadtest")  # hybrid_rag_gpt refuses to import without one
+
+CASUAL_MESSAGES = ["hello", "hi there", "thanks!", "thank you", "bye"]
+TECHNICAL_MESSAGES = [
+    "What topics are on the {} exam?",
+    "How do I automate device configuration with {}?",
+    "Explain how {} fits into the ENAUTO blueprint.",
+    "Which labs should I use to study {}?",
+    "Compare {} with RESTCONF for network automation.",
+]
+TOPICS = ["NETCONF", "YANG", "Ansible", "pyATS", "Terraform", "gNMI", "Catalyst Center", "Meraki APIs", "SD-WAN", "ACI"]
+MOCK_ANSWER = ("<strong>NETCONF</strong> is a model-driven protocol that uses YANG data models over SSH. "
+               "It is covered in the <strong>ENAUTO</strong> and <strong>AUTOCOR</strong> blueprints.")
+
+class LatencyProfile:
+    """Log-normal latency (median and spread) with a per-request error probability and status"""
+
+    def __init__(self, median_ms: float, sigma: float = 0.4, error_rate: float = 0.0, error_status: int = 503, seed=None):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """(latency in seconds, whether to fail) for one request"""
+        with self._lock:
+            latency = self.median_ms / 1000 * math.exp(self.sigma * self._rng.gauss(0, 1))
+            return latency, self._rng.random() < self.error_rate
+
+def create_mock_app(gemini: LatencyProfile, serper: LatencyProfile):
+    """FastAPI app emulating the Gemini REST endpoints and Serper search"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI(title="Gemini/Serper stand-in")
+    app.state.stats = {"gemini_calls": 0, "gemini_errors": 0, "serper_calls": 0, "serper_errors": 0}
+
+    def gemini_chunk(text):
+        return {
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": 900, "candidatesTokenCount": len(text.split())}
+        }
+
+    @app.post("/v1beta/models/{model_action}")
+    async def gemini_generate(model_action: str, request: Request):
+        await request.body()
+        latency, fail = gemini.sample()
+        app.state.stats["gemini_calls"] += 1
+        if fail:
+            app.state.stats["gemini_errors"] += 1
+            await asyncio.sleep(latency / 4)
+            status = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}.get(gemini.error_status, "UNKNOWN")
+            return JSONResponse({"error": {"code": gemini.error_status, "message": "Mock failure", "status": status}},
+                                status_code=gemini.error_status)
+        if model_action.endswith(":streamGenerateContent"):
+            words = MOCK_ANSWER.split(" ")
+            parts = [" ".join(words[i:i + 8]) + " " for i in range(0, len(words), 8)]
+
+            async def stream():
+                # About a third of the latency before the first token, the rest spread over the chunks
+                await asyncio.sleep(latency / 3)
+                for position, part in enumerate(parts):
+                    if position:
+                        await asyncio.sleep(latency * 2 / 3 / len(parts))
+                    yield ("[" if position == 0 else ",") + json.dumps(gemini_chunk(part))
+                yield "]"
+            return StreamingResponse(stream(), media_type="application/json")
+        await asyncio.sleep(latency)
+        return JSONResponse(gemini_chunk(MOCK_ANSWER))
+
+    @app.post("/search")
+    async def serper_search(request: Request):
+        query = json.loads(await request.body() or b"{}").get("q", "")
+        latency, fail = serper.sample()
+        app.state.stats["serper_calls"] += 1
+        await asyncio.sleep(latency)
+        if fail:
+            app.state.stats["serper_errors"] += 1
+            return JSONResponse({"message": "Mock upstream error"}, status_code=serper.error_status)
+        return JSONResponse({"organic": [
+            {"title": f"{query} guide", "snippet": f"{query}: model-driven programmability with YANG and NETCONF."},
+            {"title": "Cisco DevNet", "snippet": "DevNet sandboxes provide always-on labs for automation practice."}
+        ]})
+
+    return app
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class BackgroundServer:
+    """Run an ASGI app with uvicorn on a local port in a daemon thread"""
+
+    def __init__(self, app, port=None):
+        import uvicorn
+        self.port = port or _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning",
+                                                     access_log=False, lifespan="on"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError(f"Server on port {self.port} did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+@contextmanager
+def mocked_upstreams(mock_url: str, disable_caches: bool = True):
+    """Point the already imported hybrid_rag_gpt at the stand-ins, restoring it afterwards"""
+    import hybrid_rag_gpt as rag
+    from benchmark import patched
+
+    def configure_gemini(transport, endpoint):
+        rag.genai.configure(api_key=rag.api_key, transport=transport,
+                            client_options={"api_endpoint": endpoint} if endpoint else None)
+        rag.reset_gemini_model()
+
+    saved_key = os.environ.get("SERPAPI_KEY")
+    caches = {}
+    if disable_caches:
+        # Every request runs the full pipeline instead of replaying cached answers
+        caches = {"answer_cache": rag.SemanticAnswerCache(max_entries=0), "embedding_cache": rag.EmbeddingCache(max_entries=0)}
+    configure_gemini("rest", mock_url)
+    try:
+        os.environ["SERPAPI_KEY"] = "loadtest"
+        with patched(rag, gemini_transport="rest", **caches), \
+                patched(rag.serper_client, url=f"{mock_url}/search", cache=None if disable_caches else rag.serper_client.cache):
+            yield rag
+    finally:
+        configure_gemini(rag.gemini_transport, rag.gemini_api_endpoint)
+        if saved_key is None:
+            os.environ.pop("SERPAPI_KEY", None)
+        else:
+            os.environ["SERPAPI_KEY"] = saved_key
+
+def make_messages(count: int, casual_fraction: float, seed=0):
+    """Seeded mix of casual and technical chat messages"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        if rng.random() < casual_fraction:
+            messages.append(rng.choice(CASUAL_MESSAGES))
+        else:
+            messages.append(rng.choice(TECHNICAL_MESSAGES).format(rng.choice(TOPICS)))
+    return messages
+
+async def _send(client, message):
+    start = time.perf_counter()
+    try:
+        response = await client.post("/chat", json={"message": message})
+        latency = time.perf_counter() - start
+        body = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+        answer = body.get("response", "")
+        failed = response.status_code != 200 or answer.startswith(("Debug info", "Error generating response"))
+        return {"path": response.headers.get("X-Answer-Path") or "error", "latency": latency,
+                "status": response.status_code, "error": failed}
+    except httpx.HTTPError as e:
+        return {"path": "error", "latency": time.perf_counter() - start, "status": None, "error": True,
+                "exception": type(e).__name__}
+
+async def drive(base_url: str, rate: float, duration: float, casual_fraction=0.2, timeout=60.0, seed=0):
+    """Send /chat requests with Poisson arrivals at ``rate`` per second for ``duration`` seconds"""
+    rng = random.Random(seed)
+    messages = make_messages(max(1, int(rate * duration * 2)), casual_fraction, seed)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        next_arrival = start
+        tasks = []
+        while next_arrival - start < duration:
+            await asyncio.sleep(max(0.0, next_arrival - loop.time()))
+            tasks.append(asyncio.create_task(_send(client, messages[len(tasks) % len(messages)])))
+            next_arrival += rng.expovariate(rate)
+        results = await asyncio.gather(*tasks)
+        return results, loop.time() - start
+
+def summarize(results, elapsed: float) -> dict:
+    """Latency percentiles, throughput and error rate overall and per answer path"""
+    def stats(group):
+        latencies = np.asarray([result["latency"] for result in group]) * 1000
+        errors = sum(result["error"] for result in group)
+        return {
+            "requests": len(group),
+            "throughput_rps": round(len(group) / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(errors / len(group), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        }
+
+    paths = {}
+    for result in results:
+        paths.setdefault(result["path"], []).append(result)
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "overall": stats(results) if results else None,
+        "paths": {path: stats(group) for path, group in sorted(paths.items())}
+    }
+
+def print_summary(summary):
+    print(f"\n{'path':<10} {'requests':>8} {'rps':>8} {'errors':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = list(summary["paths"].items()) + ([("overall", summary["overall"])] if summary["overall"] else [])
+    for path, stats in rows:
+        print(f"{path:<10} {stats['requests']:>8} {stats['throughput_rps']:>8.2f} {stats['error_rate']:>8.2%} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+def run_load_test(rate=10.0, duration=30.0, casual_fraction=0.2, gemini=None, serper=None,
+                  synthetic_docs=500, model_name="paraphrase-MiniLM-L3-v2", disable_caches=True, seed=0):
+    """Start the stand-ins and the app, drive /chat and return the summary (with upstream call counts)"""
+    import fastapi_only
+    from benchmark import load_encoder, patched, synthetic_vector_store
+
+    gemini = gemini or LatencyProfile(900, seed=seed)
+    serper = serper or LatencyProfile(250, seed=seed + 1)
+    mock_app = create_mock_app(gemini, serper)
+    with BackgroundServer(mock_app) as mocks, mocked_upstreams(mocks.url, disable_caches):
+        if synthetic_docs:
+            store = synthetic_vector_store(load_encoder(model_name), synthetic_docs)
+        else:
+            import hybrid_rag_gpt
+            if not hybrid_rag_gpt.load_vector_store():
+                raise RuntimeError("Could not load rag/index; build it with vectorize.py or use --synthetic-docs")
+            store = nullcontext()
+        with store, patched(fastapi_only, models_loaded=True), BackgroundServer(fastapi_only.app) as app_server:
+            print(f"🚀 Driving {app_server.url}/chat at {rate}/s for {duration}s (upstream stand-ins at {mocks.url})")
+            results, elapsed = asyncio.run(drive(app_server.url, rate, duration, casual_fraction, seed=seed))
+    summary = summarize(results, elapsed)
+    summary["offered_rate_rps"] = rate
+    summary["upstream"] = dict(mock_app.state.stats)
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test /chat against local Gemini and Serper stand-ins")
+    parser.add_argument("--rate", type=float, default=10.0, help="Requests per second (Poisson arrivals)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    parser.add_argument("--casual-fraction", type=float, default=0.2, help="Share of casual messages")
+    parser.add_argument("--gemini-latency-ms", type=float, default=900.0, help="Median Gemini latency")
+    parser.add_argument("--gemini-sigma", type=float, default=0.4, help="Log-normal spread of Gemini latency")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="Share of Gemini calls that fail")
+    parser.add_argument("--gemini-error-status", type=int, default=503,
+                        help="HTTP status of failed Gemini calls (the SDK retries 503; 500 reaches the fallback path)")
+    parser.add_argument("--serper-latency-ms", type=float, default=250.0, help="Median Serper latency")
+    parser.add_argument("--serper-sigma", type=float, default=0.5, help="Log-normal spread of Serper latency")
+    parser.add_argument("--serper-error-rate", type=float, default=0.0, help="Share of Serper calls that fail")
+    parser.add_argument("--serper-error-status", type=int, default=500, help="HTTP status of failed Serper calls")
+    parser.add_argument("--synthetic-docs", type=int, default=500,
+                        help="Serve a synthetic index of this many documents (0 = the built rag/index)")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "paraphrase-MiniLM-L3-v2"),
+                        help="Model of the ONNX export for the synthetic index (hashing-384 for the offline hashing encoder)")
+    parser.add_argument("--keep-caches", action="store_true", help="Keep answer/embedding/Serper caches enabled")
+    parser.add_argument("--mocks-only", action="store_true", help="Only serve the stand-ins until interrupted")
+    parser.add_argument("--port", type=int, default=None, help="Port for --mocks-only")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the summary JSON here")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    gemini = LatencyProfile(args.gemini_latency_ms, args.gemini_sigma, args.gemini_error_rate,
+                            args.gemini_error_status, seed=args.seed)
+    serper = LatencyProfile(args.serper_latency_ms, args.serper_sigma, args.serper_error_rate,
+                            args.serper_error_status, seed=args.seed + 1)
+
+    if args.mocks_only:
+        with BackgroundServer(create_mock_app(gemini, serper), port=args.port) as mocks:
+            print(f"🧪 Stand-ins listening on {mocks.url}; point the app at them with:")
+            print(f"   GEMINI_TRANSPORT=rest GEMINI_API_ENDPOINT={mocks.url} SERPER_URL={mocks.url}/search SERPAPI_KEY=loadtest")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                return 0
+
+    summary = run_load_test(args.rate, args.duration, args.casual_fraction, gemini, serper,
+                            args.synthetic_docs, args.model, not args.keep_caches, args.seed)
+    print_summary(summary)
+    print(f"Upstream calls: {summary['upstream']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,205 @@
+# onnx_encoder.py
+"""
+Torch-free query encoder: an int8-quantized ONNX export of the sentence-transformers
+embedding model, run with ONNX Runtime and a `tokenizers` tokenizer.
+
+Export once (pip install -r requirements-ingest.txt for torch, sentence-transformers and onnx):
+    python onnx_encoder.py --model paraphrase-MiniLM-L3-v2 --output rag/models/onnx
+
+Serving with EMBEDDING_BACKEND=onnx then needs only requirements.txt (onnxruntime and tokenizers).
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+ONNX_MODEL_DIR = "rag/models/onnx"
+MODEL_FILE = "model.onnx"  # Intermediate float32 export, removed after quantization
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "encoder_config.json"
+DEFAULT_MIN_COSINE = 0.98  # Minimum cosine similarity to the sentence-transformers embedding
+POOLING_MODES = ("mean", "cls")
+
+def onnx_encoder_exists(model_dir: str) -> bool:
+    return all(os.path.exists(os.path.join(model_dir, name)) for name in (QUANTIZED_MODEL_FILE, TOKENIZER_FILE, CONFIG_FILE))
+
+def pool(token_embeddings, attention_mask, mode="mean", normalize=False):
+    """Sentence embeddings from token embeddings, matching the sentence-transformers Pooling/Normalize modules"""
+    if mode == "cls":
+        pooled = token_embeddings[:, 0]
+    else:
+        mask = attention_mask[..., None].astype('float32')
+        pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+    if normalize:
+        pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+    return np.asarray(pooled, dtype='float32')
+
+class OnnxEncoder:
+    """Drop-in for SentenceTransformer.encode backed by the int8 ONNX export in model_dir"""
+
+    backend = "onnx"
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, threads: int = None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.model_name = self.config["model_name"]
+        self.max_seq_length = self.config["max_seq_length"]
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self._tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self._tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, QUANTIZED_MODEL_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, **kwargs):
+        """Encode one sentence (-> vector) or a list of sentences (-> float32 matrix)"""
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self._tokenizer.encode_batch(list(sentences[start:start + batch_size]))
+            inputs = {
+                "input_ids": np.array([encoding.ids for encoding in encodings], dtype='int64'),
+                "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype='int64'),
+                "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype='int64')
+            }
+            token_embeddings = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+            batches.append(pool(token_embeddings, inputs["attention_mask"], self.config["pooling"], self.config["normalize"]))
+        vectors = np.vstack(batches) if batches else np.zeros((0, self.config["dimension"]), dtype='float32')
+        return vectors[0] if single else vectors
+
+def embedding_agreement(reference, candidate) -> np.ndarray:
+    """Row-wise cosine similarity between two embedding matrices"""
+    reference = np.asarray(reference, dtype='float32')
+    candidate = np.asarray(candidate, dtype='float32')
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    return (reference * candidate).sum(axis=1) / np.maximum(norms, 1e-12)
+
+def sample_texts(index_dir="rag/index", limit=64):
+    """Validation sentences: stored chunks spread across the index, or built-in queries when there is none"""
+    queries = [
+        "What is on the CCNA Automation exam?",
+        "How do I configure NETCONF with YANG models on IOS XE?",
+        "Which Terraform providers are covered by DCNAUTO?",
+        "hi",
+    ]
+    from chunk_store import ChunkStore, chunk_store_exists
+    if not chunk_store_exists(index_dir):
+        return queries
+    store = ChunkStore(index_dir)
+    positions = np.unique(np.linspace(0, len(store) - 1, num=min(limit, len(store)), dtype=int)) if len(store) else []
+    chunks = [store[int(position)] for position in positions]
+    store.close()
+    return queries + [chunk for chunk in chunks if chunk]
+
+def export_onnx(model_name, output_dir=ONNX_MODEL_DIR, texts=None, min_cosine=DEFAULT_MIN_COSINE, opset=17):
+    """Export model_name to an int8 ONNX model plus tokenizer in output_dir and validate it against the original.
+
+    Returns the validation report (min/mean cosine similarity and ms/query for
+    both encoders), which is also saved in the encoder config.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model = SentenceTransformer(model_name, device="cpu")
+    modules = [module for module in model]
+    pooling = modules[1].get_pooling_mode_str() if len(modules) > 1 and hasattr(modules[1], "get_pooling_mode_str") else "mean"
+    if pooling not in POOLING_MODES or len(modules) > 3:
+        raise ValueError(f"Unsupported model layout for ONNX export: pooling={pooling}, modules={len(modules)}")
+    normalize = any(type(module).__name__ == "Normalize" for module in modules)
+
+    class TokenEmbeddings(torch.nn.Module):
+        """The transformer with only last_hidden_state as output"""
+
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs)))[0]
+
+    tokenizer = model.tokenizer
+    sample = tokenizer(["ONNX export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]}
+
+    os.makedirs(output_dir, exist_ok=True)
+    float_path = os.path.join(output_dir, MODEL_FILE)
+    print(f"📦 Exporting {model_name} to ONNX...")
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(modules[0].auto_model.eval()), tuple(sample[name] for name in input_names), float_path,
+            input_names=input_names, output_names=["token_embeddings"], dynamic_axes=dynamic_axes, opset_version=opset
+        )
+    print("🗜️ Quantizing weights to int8...")
+    quantize_dynamic(float_path, os.path.join(output_dir, QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8)
+    os.remove(float_path)
+
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILE))
+    config = {
+        "model_name": model_name,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "pooling": pooling,
+        "normalize": normalize,
+        "pad_token_id": tokenizer.pad_token_id,
+        "pad_token": tokenizer.pad_token
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), "w") as f:
+        json.dump(config, f, indent=2)
+
+    # The export must reproduce the embeddings the index was built with
+    texts = texts or sample_texts()
+    encoder = OnnxEncoder(output_dir)
+    timings = {}
+    for name, candidate in (("sentence_transformers", model), ("onnx_int8", encoder)):
+        candidate.encode(texts[:1])  # Warm-up
+        started = time.perf_counter()
+        for text in texts:
+            candidate.encode([text])
+        timings[name] = (time.perf_counter() - started) * 1000 / len(texts)
+    similarity = embedding_agreement(model.encode(texts), encoder.encode(texts))
+    report = {
+        "samples": len(texts),
+        "min_cosine": float(similarity.min()),
+        "mean_cosine": float(similarity.mean()),
+        "ms_per_query": timings
+    }
+    config["validation"] = report
+    with open(os.path.join(output_dir, CONFIG_FILE), "w") as f:
+        json.dump(config, f, indent=2)
+
+    print(f"[✓] Cosine similarity to {model_name}: min {report['min_cosine']:.4f}, mean {report['mean_cosine']:.4f} "
+          f"over {len(texts)} texts")
+    print(f"⏱️ ms/query: sentence-transformers {timings['sentence_transformers']:.2f}, onnx int8 {timings['onnx_int8']:.2f}")
+    if report["min_cosine"] < min_cosine:
+        print(f"[WARNING] Minimum cosine {report['min_cosine']:.4f} is below {min_cosine}; "
+              "the app will not use this export for the index")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the embedding model to an int8 ONNX query encoder")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "paraphrase-MiniLM-L3-v2"),
+                        help="sentence-transformers model the index was built with")
+    parser.add_argument("--output", default=ONNX_MODEL_DIR, help="Directory for the ONNX model, tokenizer and config")
+    parser.add_argument("--min-cosine", type=float, default=DEFAULT_MIN_COSINE,
+                        help="Fail when any validation embedding falls below this cosine similarity")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset version")
+    args = parser.parse_args()
+    report = export_onnx(args.model, args.output, min_cosine=args.min_cosine, opset=args.opset)
+    # Non-zero exit so an image build never ships an encoder that disagrees with the index
+    raise SystemExit(0 if report["min_cosine"] >= args.min_cosine else 1)
@@ -0,0 +1,309 @@
+# serper_client.py
+"""
+Pooled, deadline-bounded Serper client with a persistent result cache.
+
+Repeat queries are answered from a small SQLite cache, and every network call
+is bounded by a hard deadline so a stuck upstream cannot pin worker threads.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+SERPER_URL = os.getenv("SERPER_URL", "https://google.serper.dev/search")
+
+class SerperError(Exception):
+    """Raised when a Serper search fails or exceeds its deadline"""
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for cache lookups (case and whitespace insensitive)"""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+def extract_snippets(results: dict) -> str:
+    """Extract the top organic result snippets from a Serper response"""
+    if 'organic' in results:
+        snippets = [r.get("snippet", "") for r in results['organic'][:2] if r.get("snippet")]
+        return "\n".join(snippets) if snippets else "No internet results found."
+    return "No internet results found."
+
+class SerperResultCache:
+    """Disk-backed TTL cache of normalized query -> snippets stored in SQLite.
+
+    Expired rows are pruned at most once per ``prune_interval`` seconds instead
+    of on every write; get() already ignores them.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 86400, prune_interval: float = 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.prune_interval = prune_interval
+        self.enabled = True
+        self._next_prune = 0.0
+        self._prune_lock = threading.Lock()
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS serper_cache ("
+                    "query TEXT PRIMARY KEY, snippets TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS serper_cache_created_at ON serper_cache (created_at)")
+        except Exception as e:
+            print(f"[WARNING] Serper result cache disabled: {e}")
+            self.enabled = False
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=1.0)
+
+    def get(self, query: str):
+        if not self.enabled:
+            return None
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT snippets, created_at FROM serper_cache WHERE query = ?",
+                    (normalize_query(query),)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[WARNING] Serper cache read failed: {e}")
+            return None
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return row[0]
+
+    def put(self, query: str, snippets: str):
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO serper_cache (query, snippets, created_at) VALUES (?, ?, ?)",
+                    (normalize_query(query), snippets, now)
+                )
+        except sqlite3.Error as e:
+            print(f"[WARNING] Serper cache write failed: {e}")
+            return
+        with self._prune_lock:
+            due = now >= self._next_prune
+            if due:
+                self._next_prune = now + self.prune_interval
+        if due:
+            self.prune(now)
+
+    def prune(self, now: float = None) -> int:
+        """Delete expired rows and return how many were removed"""
+        if not self.enabled:
+            return 0
+        now = time.time() if now is None else now
+        try:
+            with closing(self._connect()) as conn, conn:
+                return conn.execute("DELETE FROM serper_cache WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        except sqlite3.Error as e:
+            print(f"[WARNING] Serper cache prune failed: {e}")
+            return 0
+
+class SerperClient:
+    """Serper search client with connection reuse, a hard deadline and optional hedging.
+
+    ``hedge_delay`` > 0 sends a second identical request if the first has not
+    answered within that many seconds; whichever succeeds first wins.
+    """
+
+    def __init__(self, deadline=3.0, hedge_delay=0.0, max_workers=8, cache=None, url=SERPER_URL):
+        self.deadline = deadline
+        self.hedge_delay = hedge_delay
+        self.url = url
+        self.cache = cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="serper")
+        self._async_client = None
+        self._async_client_loop = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _request(query: str, api_key: str):
+        payload = json.dumps({
+            "q": query,
+            "gl": "us",
+            "hl": "en"
+        })
+        headers = {
+            'X-API-KEY': api_key,
+            'Content-Type': 'application/json'
+        }
+        return headers, payload
+
+    def _count(self, attribute: str):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def _cached(self, query: str):
+        if self.cache is None:
+            return None
+        snippets = self.cache.get(query)
+        self._count("cache_hits" if snippets is not None else "cache_misses")
+        return snippets
+
+    def _store(self, query: str, snippets: str):
+        if self.cache is not None:
+            self.cache.put(query, snippets)
+
+    def _fetch(self, query: str, api_key: str) -> str:
+        headers, payload = self._request(query, api_key)
+        # Socket timeouts keep each worker thread bounded even after the caller gave up
+        response = self._session.post(self.url, headers=headers, data=payload, timeout=(min(1.0, self.deadline), self.deadline))
+        response.raise_for_status()
+        return extract_snippets(response.json())
+
+    def search(self, query: str, api_key: str) -> str:
+        """Return result snippets for the query, raising SerperError on failure or deadline"""
+        snippets = self._cached(query)
+        if snippets is not None:
+            return snippets
+
+        started = time.monotonic()
+        pending = {self._executor.submit(self._fetch, query, api_key)}
+        can_hedge = self.hedge_delay > 0
+        last_error = None
+        while True:
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                self._count("timeouts")
+                raise SerperError(f"Serper search exceeded {self.deadline}s deadline")
+            wait_time = min(remaining, self.hedge_delay) if can_hedge else remaining
+            done, pending = concurrent.futures.wait(pending, timeout=wait_time, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    snippets = future.result()
+                    self._store(query, snippets)
+                    return snippets
+                last_error = future.exception()
+            if can_hedge:
+                # Primary is slow or already failed: fire one hedged request
+                can_hedge = False
+                self._count("hedges")
+                pending.add(self._executor.submit(self._fetch, query, api_key))
+            elif not pending:
+                raise SerperError(f"Serper search failed: {last_error}")
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._retire_async_client()
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.deadline, connect=min(1.0, self.deadline)),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            )
+            self._async_client_loop = loop
+        return self._async_client
+
+    def _retire_async_client(self):
+        """Close the client bound to another event loop instead of leaking its connection pool"""
+        client, loop = self._async_client, self._async_client_loop
+        self._async_client = self._async_client_loop = None
+        if client is None or client.is_closed:
+            return
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            # Connections bound to a stopped loop cannot be awaited; call aclose() before the loop ends
+            print("[WARNING] Dropping Serper async client whose event loop is no longer running")
+
+    async def _afetch(self, query: str, api_key: str) -> str:
+        headers, payload = self._request(query, api_key)
+        response = await self._get_async_client().post(self.url, headers=headers, content=payload)
+        response.raise_for_status()
+        return extract_snippets(response.json())
+
+    async def _ahedged(self, query: str, api_key: str) -> str:
+        tasks = {asyncio.ensure_future(self._afetch(query, api_key))}
+        can_hedge = self.hedge_delay > 0
+        last_error = None
+        try:
+            while True:
+                done, tasks = await asyncio.wait(
+                    tasks,
+                    timeout=self.hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                if can_hedge:
+                    can_hedge = False
+                    self._count("hedges")
+                    tasks.add(asyncio.ensure_future(self._afetch(query, api_key)))
+                elif not tasks:
+                    raise SerperError(f"Serper search failed: {last_error}")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def asearch(self, query: str, api_key: str) -> str:
+        """Async counterpart of search() for the non-blocking chat pipeline"""
+        loop = asyncio.get_running_loop()
+        # SQLite cache I/O runs on the worker pool, never on the event loop
+        snippets = await loop.run_in_executor(self._executor, self._cached, query) if self.cache is not None else None
+        if snippets is not None:
+            return snippets
+        try:
+            snippets = await asyncio.wait_for(self._ahedged(query, api_key), timeout=self.deadline)
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            raise SerperError(f"Serper search exceeded {self.deadline}s deadline")
+        if self.cache is not None:
+            await loop.run_in_executor(self._executor, self._store, query, snippets)
+        return snippets
+
+    async def aclose(self):
+        """Close the pooled async client; call from the event loop that used it (e.g. the app's shutdown hook)"""
+        client, self._async_client, self._async_client_loop = self._async_client, None, None
+        if client is not None:
+            await client.aclose()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "timeouts": self.timeouts,
+                "hedges": self.hedges
+            }
+
+def create_serper_client() -> SerperClient:
+    """Build the process-wide Serper client from environment variables"""
+    cache_path = os.getenv("SERPER_CACHE_PATH", os.path.join(tempfile.gettempdir(), "serper_cache.sqlite3"))
+    cache = None
+    if cache_path:
+        cache = SerperResultCache(
+            cache_path,
+            ttl_seconds=float(os.getenv("SERPER_CACHE_TTL", "86400")),
+            prune_interval=float(os.getenv("SERPER_CACHE_PRUNE_INTERVAL", "3600"))
+        )
+    return SerperClient(
+        deadline=float(os.getenv("SERPER_DEADLINE", "3.0")),
+        hedge_delay=float(os.getenv("SERPER_HEDGE_DELAY", "0")),
+        max_workers=int(os.getenv("SERPER_MAX_WORKERS", "8")),
+        cache=cache
+    )
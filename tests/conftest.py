@@ -61,4 +61,12 @@ def sample_conversation_history():
     return [
         {"role": "user", "content": "What certifications are available?"},
         {"role": "assistant", "content": "Cisco offers several automation certifications including CCNA, CCNP, and CCIE Automation tracks."}
-    ]
\ No newline at end of file
+    ]
+
+@pytest.fixture(autouse=True)
+def reset_gemini_model():
+    """Rebuild the shared Gemini model per test so patched stubs take effect."""
+    import hybrid_rag_gpt
+    hybrid_rag_gpt.reset_gemini_model()
+    yield
+    hybrid_rag_gpt.reset_gemini_model()
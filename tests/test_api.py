@@ -88,4 +88,112 @@ def test_main_app_html(test_client):
 def test_404_handling(test_client, endpoint):
     """Test 404 error handling for unknown endpoints."""
     response = test_client.get(endpoint)
-    assert response.status_code == 404
\ No newline at end of file
+    assert response.status_code == 404
+
+def test_chat_stream_empty_message(test_client):
+    """Test streaming chat endpoint with empty message."""
+    response = test_client.post("/chat/stream", json={"message": ""})
+    assert response.status_code == 400
+    assert "error" in response.json()
+
+def test_chat_stream_models_not_loaded(test_client, monkeypatch):
+    """Test streaming chat endpoint before models are loaded."""
+    import fastapi_only
+    monkeypatch.setattr(fastapi_only, "models_loaded", False)
+    response = test_client.post("/chat/stream", json={"message": "What is NETCONF?"})
+    assert response.status_code == 503
+    assert "Models are still loading" in response.json()["error"]
+
+def test_chat_stream_sends_events(test_client, monkeypatch):
+    """Test streaming chat endpoint emits one SSE event per chunk plus a done event."""
+    import json
+    import fastapi_only
+
+    async def fake_achat_stream(user_input, conversation_history=None):
+        yield "<strong>NETCONF</strong> "
+        yield "is a protocol."
+
+    monkeypatch.setattr(fastapi_only, "models_loaded", True)
+    monkeypatch.setattr(fastapi_only, "achat_stream", fake_achat_stream)
+    response = test_client.post("/chat/stream", json={"message": "What is NETCONF?"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [json.loads(line[len("data: "):]) for line in response.text.split("\n\n") if line.startswith("data: ")]
+    assert events == [
+        {"delta": "<strong>NETCONF</strong> "},
+        {"delta": "is a protocol."},
+        {"done": True},
+    ]
+
+def test_metrics_endpoint_exports_stage_latency(test_client, monkeypatch):
+    """Test /metrics exposes per-stage histograms, answer paths and request gauges after a chat."""
+    import fastapi_only
+    import hybrid_rag_gpt
+    import metrics
+
+    class _StubModel:
+        async def generate_content_async(self, prompt, generation_config=None, stream=False):
+            class _Response:
+                text = "Hello! Ask me about Cisco certifications."
+            return _Response()
+
+    monkeypatch.setattr(fastapi_only, "models_loaded", True)
+    monkeypatch.setattr(hybrid_rag_gpt, "get_gemini_model", lambda: _StubModel())
+    casual_before = metrics.chat_requests.value(path="casual")
+    total_before = metrics.stage_latency.count(stage="total")
+
+    assert test_client.post("/chat", json={"message": "hello"}).status_code == 200
+    assert metrics.chat_requests.value(path="casual") == casual_before + 1
+    assert metrics.stage_latency.count(stage="total") == total_before + 1
+    assert metrics.requests_in_flight.value() == 0
+
+    response = test_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE rag_stage_latency_seconds histogram" in body
+    assert 'rag_stage_latency_seconds_bucket{stage="llm_generation",le="+Inf"}' in body
+    assert 'rag_stage_latency_seconds_count{stage="prompt_build"}' in body
+    assert 'rag_chat_requests_total{path="casual"}' in body
+    assert "rag_requests_in_flight 0" in body
+    assert "rag_models_loaded" in body
+
+def test_chat_endpoint_returns_trace_id_header(test_client, monkeypatch, tmp_path):
+    """Test /chat returns X-Trace-Id and exports the endpoint, chat and Gemini spans under it."""
+    import json
+    import fastapi_only
+    import hybrid_rag_gpt
+    import tracing
+
+    class _StubModel:
+        async def generate_content_async(self, prompt, generation_config=None, stream=False):
+            class _Response:
+                text = "Hello!"
+            return _Response()
+
+    exporter = tracing.JsonlSpanExporter(str(tmp_path / "spans.jsonl"))
+    monkeypatch.setattr(tracing, "exporter", exporter)
+    monkeypatch.setattr(fastapi_only, "models_loaded", True)
+    monkeypatch.setattr(hybrid_rag_gpt, "get_gemini_model", lambda: _StubModel())
+
+    parent_trace = "4bf92f3577b34da6a3ce929d0e0e4736"
+    response = test_client.post("/chat", json={"message": "hello"},
+                                headers={"traceparent": f"00-{parent_trace}-00f067aa0ba902b7-01"})
+    exporter.close()
+    assert response.status_code == 200
+    assert response.headers["X-Trace-Id"] == parent_trace
+
+    spans = [json.loads(line) for line in (tmp_path / "spans.jsonl").read_text().splitlines()]
+    by_name = {span["name"]: span for span in spans}
+    assert {span["traceId"] for span in spans} == {parent_trace}
+    assert by_name["chat_endpoint"]["parentSpanId"] == "00f067aa0ba902b7"
+    assert by_name["chat"]["parentSpanId"] == by_name["chat_endpoint"]["spanId"]
+    assert by_name["gemini.generate_content"]["parentSpanId"] == by_name["chat"]["spanId"]
+
+def test_chat_stream_returns_trace_id_header(test_client, monkeypatch):
+    """Test /chat/stream returns X-Trace-Id even when the request is rejected."""
+    import fastapi_only
+    monkeypatch.setattr(fastapi_only, "models_loaded", False)
+    response = test_client.post("/chat/stream", json={"message": "What is NETCONF?"})
+    assert response.status_code == 503
+    assert len(response.headers["X-Trace-Id"]) == 32
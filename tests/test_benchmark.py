@@ -0,0 +1,85 @@
+"""
+Tests for the offline micro-benchmark suite.
+"""
+import benchmark
+
+def _results(encoder="hashing-384", **p50s):
+    return {"environment": {"encoder": encoder}, "benchmarks": {name: {"p50_ms": value} for name, value in p50s.items()}}
+
+def test_compare_results_flags_regressions_beyond_threshold():
+    """Test only benchmarks slower than their (possibly overridden) threshold are reported."""
+    baseline = _results(chunking=10.0, html_extraction=10.0, chat=100.0)
+    baseline["thresholds"] = {"chat": 0.5}
+    current = _results(chunking=13.0, html_extraction=12.0, chat=140.0, pdf_extraction=50.0)
+    assert benchmark.compare_results(current, baseline, threshold=0.25) == [("chunking", 10.0, 13.0, 1.25)]
+
+def test_compare_results_refuses_a_different_encoder():
+    """Test query encoding and chat timings are never compared across different encoders."""
+    import pytest
+    baseline = _results(query_encoding=0.02, chat=100.0, chunking=10.0)
+    current = _results(encoder="paraphrase-MiniLM-L3-v2", query_encoding=5.0, chat=400.0, chunking=10.0)
+    with pytest.raises(ValueError, match="hashing-384"):
+        benchmark.compare_results(current, baseline)
+    # Encoder-independent benchmarks still compare
+    assert benchmark.compare_results(_results(encoder="paraphrase-MiniLM-L3-v2", chunking=13.0), baseline) == [
+        ("chunking", 10.0, 13.0, 1.25)]
+
+def test_main_exits_when_baseline_encoder_differs(tmp_path, monkeypatch):
+    """Test the CLI refuses a baseline recorded with another encoder instead of passing silently."""
+    import json
+    baseline_path = tmp_path / "baseline.json"
+    baseline_path.write_text(json.dumps(_results(query_encoding=0.02)))
+    monkeypatch.setattr(benchmark, "print_results", lambda results, baseline=None: None)
+    monkeypatch.setattr(benchmark, "run_benchmarks",
+                        lambda *args: _results(encoder="paraphrase-MiniLM-L3-v2", query_encoding=5.0))
+    assert benchmark.main(["--baseline", str(baseline_path)]) == 2
+    monkeypatch.setattr(benchmark, "run_benchmarks", lambda *args: _results(query_encoding=0.02))
+    assert benchmark.main(["--baseline", str(baseline_path)]) == 0
+
+def test_run_benchmarks_quick_subset():
+    """Test a small run produces latency stats for each selected benchmark and FAISS size."""
+    results = benchmark.run_benchmarks(only=["faiss_search", "chunking", "html_extraction"], sizes=[200], repeat=3)
+    names = set(results["benchmarks"])
+    assert names == {"faiss_search.flat.200", "faiss_search.hnsw.200", "chunking", "html_extraction"}
+    for stats in results["benchmarks"].values():
+        assert stats["p95_ms"] >= stats["p50_ms"] > 0
+    assert results["benchmarks"]["chunking"]["mb_per_s"] > 0
+
+def test_stubbed_chat_pipeline_answers_and_restores_globals():
+    """Test the end-to-end chat benchmark runs offline and leaves hybrid_rag_gpt untouched afterwards."""
+    import hybrid_rag_gpt
+    original_index = hybrid_rag_gpt.faiss_index
+    with benchmark.stubbed_chat_pipeline(benchmark.HashingEncoder(), num_docs=20) as rag:
+        assert "NETCONF" in rag.chat("How do I automate netconf with ansible?")
+    assert hybrid_rag_gpt.faiss_index is original_index
+
+def test_hashing_encoder_is_deterministic():
+    vectors = benchmark.HashingEncoder().encode(["NETCONF over SSH", "NETCONF over SSH"])
+    assert vectors.shape == (2, benchmark.EMBEDDING_DIM)
+    assert (vectors[0] == vectors[1]).all()
+
+def test_load_encoder_fails_instead_of_falling_back(tmp_path, monkeypatch):
+    """Test a missing ONNX export is an error, not a silent switch to the hashing encoder."""
+    import pytest
+    monkeypatch.setenv("ONNX_MODEL_DIR", str(tmp_path))
+    with pytest.raises(RuntimeError, match="No ONNX encoder"):
+        benchmark.load_encoder("paraphrase-MiniLM-L3-v2", "onnx")
+
+def test_load_encoder_names_the_pinned_onnx_export(tmp_path, monkeypatch):
+    """Test the recorded encoder name changes with the exported model file."""
+    import hashlib
+    import hybrid_rag_gpt
+    (tmp_path / "model_int8.onnx").write_bytes(b"int8 weights")
+    monkeypatch.setenv("ONNX_MODEL_DIR", str(tmp_path))
+    monkeypatch.setattr(hybrid_rag_gpt, "load_embedding_model", lambda model_name, backend: benchmark.HashingEncoder())
+    encoder = benchmark.load_encoder("paraphrase-MiniLM-L3-v2", "onnx")
+    digest = hashlib.sha256(b"int8 weights").hexdigest()[:12]
+    assert encoder.name == f"paraphrase-MiniLM-L3-v2@onnx-int8:{digest}"
+
+def test_main_refuses_to_save_a_hashing_baseline(tmp_path, monkeypatch):
+    """Test --save-baseline never records timings from the hashing stand-in."""
+    baseline_path = tmp_path / "baseline.json"
+    monkeypatch.setattr(benchmark, "print_results", lambda results, baseline=None: None)
+    monkeypatch.setattr(benchmark, "run_benchmarks", lambda *args: _results(query_encoding=0.02))
+    assert benchmark.main(["--baseline", str(baseline_path), "--save-baseline"]) == 2
+    assert not baseline_path.exists()
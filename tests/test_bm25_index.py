@@ -0,0 +1,45 @@
+"""
+Tests for the BM25 lexical index and reciprocal-rank fusion.
+"""
+from bm25_index import BM25Index, bm25_index_exists, reciprocal_rank_fusion, tokenize
+
+CHUNKS = [
+    "The DevNet Professional 350-901 exam covers software design for automation.",
+    "pyATS is a Python test automation framework from Cisco.",
+    "",  # Tombstone of a removed chunk
+    "The DevNet Associate 200-901 exam covers APIs, Python and network fundamentals.",
+]
+
+def test_tokenize_keeps_exam_codes_and_parts():
+    """Test compound tokens are kept whole and split, and stopwords dropped."""
+    assert tokenize("What is the 350-901 exam on IOS-XE?") == ["350-901", "350", "901", "exam", "ios-xe", "ios", "xe"]
+
+def test_bm25_ranks_exact_token_matches():
+    """Test exact exam codes and product names rank the matching chunk first."""
+    index = BM25Index.build(CHUNKS)
+    assert index.search("350-901 exam topics")[0][0] == 0
+    assert index.search("200-901")[0][0] == 3
+    assert [doc_id for doc_id, _ in index.search("pyATS")] == [1]
+    assert index.search("completely unrelated words") == []
+
+def test_bm25_skips_tombstones_and_limits_k():
+    """Test removed chunks are never returned and k bounds the results."""
+    index = BM25Index.build(CHUNKS)
+    assert index.num_docs == len(CHUNKS)
+    results = index.search("exam automation python", k=2)
+    assert len(results) == 2
+    assert all(doc_id != 2 for doc_id, _ in index.search("exam automation python", k=10))
+
+def test_bm25_save_and_load(tmp_path):
+    """Test the array-backed index round-trips through disk."""
+    index = BM25Index.build(CHUNKS)
+    index.save(str(tmp_path))
+    assert bm25_index_exists(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.search("pyats 350-901") == index.search("pyats 350-901")
+    assert loaded.num_docs == index.num_docs
+
+def test_reciprocal_rank_fusion():
+    """Test IDs ranked well in both lists win and k bounds the output."""
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]], k=2) == [1, 3]
+    assert reciprocal_rank_fusion([[5], []], k=5) == [5]
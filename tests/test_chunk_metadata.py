@@ -0,0 +1,56 @@
+"""
+Tests for per-chunk metadata and certification track detection.
+"""
+import pytest
+from chunk_metadata import ChunkMetadata, certification_scope, chunk_metadata_exists, detect_track, detect_tracks
+
+@pytest.mark.parametrize("text,expected", [
+    ("docs/300-635-DCNAUTO-v2.0-7-9-2025.pdf", "DCNAUTO"),
+    ("docs/CCIE_Automation_equipment_list_v1.1.pdf", "CCIEAUTO"),
+    ("https://u.cisco.com/exams/cisco-exam-review-devcor-4531", "AUTOCOR"),
+    ("https://u.cisco.com/exam/ccna-automation-200-901", "CCNAAUTO"),
+    ("What topics are on the 350-901 exam?", "AUTOCOR"),
+    ("How should I study for ENAUTO?", "ENAUTO"),
+    ("What is NETCONF?", None),
+    ("Compare ENAUTO and DCNAUTO", None),
+    ("What is on the CCNP Automation exam?", None),
+    ("DEVCOR study plan", "AUTOCOR"),
+])
+def test_detect_track(text, expected):
+    """Test exam codes and aliases identify one track; none or several give None."""
+    assert detect_track(text) == expected
+
+def test_detect_tracks_shared_alias_names_every_track():
+    """Test a certification spanning several exams names all of them, not just the core exam."""
+    assert detect_tracks("CCNP Automation") == ["ENAUTO", "DCNAUTO", "SPAUTO", "AUTOCOR"]
+    assert detect_tracks("devnet-professional-study-guide.pdf") == ["ENAUTO", "DCNAUTO", "SPAUTO", "AUTOCOR"]
+
+def test_detect_tracks_ignores_longer_numbers():
+    """Test exam codes only match as whole codes."""
+    assert detect_tracks("ticket 1350-9012") == []
+
+def test_certification_scope():
+    """Test scopes hold tracks, certification levels and numbers other than exam codes."""
+    assert certification_scope("What is on the CCNA Automation exam?") == {"CCNAAUTO", "ccna"}
+    assert certification_scope("Which topics does 350-901 cover?") == {"AUTOCOR"}
+    assert certification_scope("Is NETCONF on port 830?") == {"830"}
+    assert certification_scope("What is NETCONF?") == frozenset()
+
+def test_chunk_metadata_build_describe_and_round_trip(tmp_path):
+    """Test chunks inherit their source's track, general chunks get one only when unambiguous."""
+    manifest_sources = {
+        "docs/300-635-DCNAUTO-v2.0.pdf": {"hash": "a", "chunk_ids": [0, 1], "pages": [1, 3]},
+        "https://example.com/career-path": {"hash": "b", "chunk_ids": [3, 4]},
+    }
+    chunks = ["ACI automation with Ansible", "NDFC REST APIs", "", "The 200-901 exam covers APIs", "Every track builds on the basics"]
+    metadata = ChunkMetadata.build(manifest_sources, chunks)
+    assert metadata.describe(1) == {"source": "docs/300-635-DCNAUTO-v2.0.pdf", "page": 3, "track": "DCNAUTO", "exam_code": "300-635"}
+    assert metadata.describe(2) == {"source": None, "page": None, "track": None, "exam_code": None}
+    assert metadata.describe(3)["track"] == "CCNAAUTO"
+    assert metadata.describe(4)["track"] is None
+    assert metadata.track_mask("DCNAUTO").tolist() == [True, True, False, False, False]
+
+    metadata.save(str(tmp_path))
+    assert chunk_metadata_exists(str(tmp_path))
+    loaded = ChunkMetadata.load(str(tmp_path))
+    assert [loaded.describe(i) for i in range(5)] == [metadata.describe(i) for i in range(5)]
@@ -0,0 +1,56 @@
+"""
+Tests for the memory-mapped chunk store.
+"""
+import pytest
+from chunk_store import ChunkStore, ChunkStoreWriter, chunk_store_exists, write_chunk_store
+
+def test_chunk_store_round_trip(tmp_path):
+    """Test chunks (including non-ASCII text) are read back unchanged."""
+    chunks = ["1.1 Describe REST APIs", "NETCONF → YANG", "", "pyATS ✓"]
+    write_chunk_store(chunks, str(tmp_path))
+    assert chunk_store_exists(str(tmp_path))
+
+    store = ChunkStore(str(tmp_path))
+    assert len(store) == 4
+    assert store[1] == "NETCONF → YANG"
+    assert store[-1] == "pyATS ✓"
+    assert store[1:3] == ["NETCONF → YANG", ""]
+    assert list(store) == chunks
+
+def test_chunk_store_index_error(tmp_path):
+    """Test out-of-range lookups raise IndexError like a list."""
+    write_chunk_store(["only chunk"], str(tmp_path))
+    store = ChunkStore(str(tmp_path))
+    with pytest.raises(IndexError):
+        store[1]
+
+def test_empty_chunk_store(tmp_path):
+    """Test an empty store can be written and opened."""
+    write_chunk_store([], str(tmp_path))
+    assert len(ChunkStore(str(tmp_path))) == 0
+
+def test_chunk_store_missing(tmp_path):
+    """Test a directory without a chunk store is detected."""
+    assert not chunk_store_exists(str(tmp_path))
+
+def test_chunk_store_writer_resumes_from_last_flush(tmp_path):
+    """Test reopening a writer drops chunks appended after the last flush."""
+    writer = ChunkStoreWriter(str(tmp_path))
+    writer.extend(["first", "second"])
+    writer.flush()
+    writer.append("lost on interruption")
+    writer._blob.flush()
+
+    writer = ChunkStoreWriter(str(tmp_path), resume=True)
+    assert len(writer) == 2
+    writer.append("third")
+    writer.close()
+    assert list(ChunkStore(str(tmp_path))) == ["first", "second", "third"]
+
+def test_chunk_store_closes_as_context_manager(tmp_path):
+    """Test leaving a with block releases the memory map."""
+    write_chunk_store(["NETCONF"], str(tmp_path))
+    with ChunkStore(str(tmp_path)) as store:
+        mapped = store._blob
+        assert store[0] == "NETCONF"
+    assert mapped.closed and len(store) == 0
@@ -0,0 +1,59 @@
+"""
+Tests for token-budgeted context assembly.
+"""
+import numpy as np
+from context_assembler import assemble_context, estimate_tokens, strip_overlap
+
+def test_strip_overlap_removes_repeated_prefix():
+    """Test the span shared with a selected chunk's tail is trimmed."""
+    previous = "NETCONF uses YANG models. It runs over SSH on port 830."
+    text = "It runs over SSH on port 830. RESTCONF uses HTTPS instead."
+    assert strip_overlap(text, [previous]) == "RESTCONF uses HTTPS instead."
+    assert strip_overlap("Unrelated text entirely here.", [previous]) == "Unrelated text entirely here."
+
+def test_strip_overlap_is_bounded_and_linear():
+    """Test long chunks are compared by a linear scan, only within max_overlap characters."""
+    import time
+    previous = "a" * 50000
+    started = time.perf_counter()
+    assert strip_overlap("a" * 50000 + " tail", [previous], max_overlap=100000) == "tail"
+    assert time.perf_counter() - started < 1.0
+    assert strip_overlap("a" * 300 + " tail", [previous], max_overlap=100) == "a" * 200 + " tail"
+
+def test_assemble_context_respects_hard_token_budget():
+    """Test selected chunks never exceed the budget and oversized first chunks are truncated."""
+    candidates = [(f"Objective {i} covers automation topic number {i}.", 1.0 / (i + 1)) for i in range(10)]
+    selected = assemble_context(candidates, token_budget=25)
+    assert selected and sum(estimate_tokens(text) for text in selected) <= 25
+
+    huge = [("word " * 500, 1.0)]
+    selected = assemble_context(huge, token_budget=50)
+    assert 0 < estimate_tokens(selected[0]) <= 50
+
+def test_assemble_context_drops_near_duplicates_with_vectors():
+    """Test a near-identical candidate is skipped in favour of a distinct one."""
+    candidates = [("pyATS is a test framework.", 1.0), ("pyATS is a test framework!", 0.9), ("Genie parses CLI output.", 0.5)]
+    vectors = np.array([[1, 0], [0.999, 0.01], [0, 1]], dtype="float32")
+    assert assemble_context(candidates, token_budget=100, max_chunks=2, vectors=vectors) == [
+        "pyATS is a test framework.", "Genie parses CLI output."]
+
+def test_assemble_context_mmr_prefers_diverse_chunks_without_vectors():
+    """Test word-overlap similarity steers selection towards new information."""
+    candidates = [
+        ("NETCONF uses YANG data models over SSH.", 1.0),
+        ("NETCONF uses YANG data models over SSH transport.", 0.95),
+        ("Ansible automates device configuration.", 0.8),
+    ]
+    selected = assemble_context(candidates, token_budget=100, max_chunks=2, diversity=0.5, duplicate_threshold=1.1)
+    assert selected == ["NETCONF uses YANG data models over SSH.", "Ansible automates device configuration."]
+
+def test_assemble_context_relevance_keeps_fused_rank_spread():
+    """Test near-flat RRF scores are spread over [0, 1] so fused rank is not swamped by the redundancy penalty."""
+    candidates = [("pyATS runs network tests.", 0.0164), ("pyATS parsers use Genie.", 0.0161), ("NETCONF uses SSH.", 0.0159)]
+    vectors = np.array([[1, 0], [0.8, 0.6], [0, 1]], dtype="float32")
+    assert assemble_context(candidates, token_budget=100, max_chunks=2, vectors=vectors, diversity=0.3) == [
+        "pyATS runs network tests.", "pyATS parsers use Genie."]
+
+def test_assemble_context_empty_inputs():
+    assert assemble_context([], token_budget=100) == []
+    assert assemble_context([("text", 1.0)], token_budget=0) == []
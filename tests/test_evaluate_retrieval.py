@@ -0,0 +1,82 @@
+"""
+Tests for the retrieval quality-vs-latency evaluation harness.
+"""
+import evaluate_retrieval
+from benchmark import HashingEncoder
+
+ITEM = {"question": "How long is the CCIE Automation lab exam?",
+        "sources": ["CCIE_Automation_Lab_V1.1_BP.pdf"], "terms": ["8-hour, hands-on exam"]}
+
+def test_score_question_by_sources():
+    """Test recall counts expected sources found and MRR uses the first relevant rank."""
+    retrieved = [("a", "Learn-with-Cisco-evolving.pdf"), ("b", "CCIE_Automation_Lab_V1.1_BP.pdf"), ("c", None)]
+    assert evaluate_retrieval.score_question(ITEM, retrieved, judge="sources") == (1.0, 0.5)
+    assert evaluate_retrieval.score_question(ITEM, retrieved[:1], judge="sources") == (0.0, 0.0)
+
+def test_score_question_by_terms_ignores_extraction_spacing():
+    """Test the terms judge matches phrases despite PDF extraction spacing."""
+    retrieved = [("The lab is an 8 -hour, hands -on exam", None)]
+    assert evaluate_retrieval.score_question(ITEM, retrieved, judge="terms") == (1.0, 1.0)
+
+def test_golden_set_sources_exist_and_contain_terms():
+    """Test every expected source is in docs/ and every expected term appears in its sources."""
+    documents = {source: " ".join(text for _, text in pages) for source, pages in evaluate_retrieval.load_documents()}
+    for item in evaluate_retrieval.load_golden_set():
+        assert all(source in documents for source in item["sources"]), item["question"]
+        text = evaluate_retrieval.normalize(" ".join(documents[source] for source in item["sources"]))
+        assert all(evaluate_retrieval.normalize(term) in text for term in item["terms"]), item["question"]
+
+def test_run_evaluation_compares_candidate_configurations():
+    """Test each candidate configuration and k yields one row with bounded metrics."""
+    documents = [
+        ("netconf.pdf", [(1, "NETCONF uses YANG models over SSH to configure Cisco IOS XE devices.")]),
+        ("kubernetes.pdf", [(1, "Package and deploy a solution by using Kubernetes deployments and services.")]),
+        ("terraform.pdf", [(1, "Construct a Terraform plan with controller and device providers.")]),
+    ]
+    golden = [
+        {"question": "Kubernetes deployments and services", "sources": ["kubernetes.pdf"], "terms": ["Kubernetes"]},
+        {"question": "Terraform plan providers", "sources": ["terraform.pdf"], "terms": ["Terraform plan"]},
+    ]
+    rows = evaluate_retrieval.run_evaluation(
+        golden, ks=[1, 2], models=["hashing-384"], hybrid_modes=[True, False],
+        include_current=False, documents=documents
+    )
+    assert [(row["hybrid"], row["k"]) for row in rows] == [(True, 1), (True, 2), (False, 1), (False, 2)]
+    for row in rows:
+        assert row["judge"] == "sources" and row["queries"] == 2 and row["chunks"] == 3
+        assert row["recall_at_k"] == row["shortlist_recall_at_k"] == 1.0 and row["mrr"] == row["shortlist_mrr"] == 1.0
+        assert row["p95_ms"] >= row["p50_ms"] > 0
+
+def test_candidate_store_restores_pipeline():
+    """Test an in-memory candidate leaves the loaded index untouched afterwards."""
+    import hybrid_rag_gpt
+    original_index = hybrid_rag_gpt.faiss_index
+    documents = [("a.pdf", [(1, "Python unit tests with pytest for network automation scripts.")])]
+    with evaluate_retrieval.candidate_store(documents, HashingEncoder()) as (rag, source_of, count):
+        assert count == 1 and source_of(0) == "a.pdf"
+        assert rag.faiss_index is not original_index
+    assert hybrid_rag_gpt.faiss_index is original_index
+
+def test_evaluate_scores_the_assembled_context(monkeypatch):
+    """Test recall comes from the chunks put in the prompt, with the shortlist reported separately."""
+    import hybrid_rag_gpt
+    documents = [
+        ("netconf.pdf", [(1, "NETCONF uses YANG models over SSH to configure Cisco IOS XE devices.")]),
+        ("terraform.pdf", [(1, "Construct a Terraform plan with controller and device providers.")]),
+    ]
+    golden = [{"question": "Terraform plan providers", "sources": ["terraform.pdf"], "terms": ["Terraform plan"]}]
+    with evaluate_retrieval.candidate_store(documents, HashingEncoder()) as (rag, source_of, count):
+        # Context assembly keeps only the lowest-ranked candidate
+        monkeypatch.setattr(hybrid_rag_gpt, "select_answer_chunks",
+                            lambda candidates, k: [(chunk_id, rag.texts[chunk_id]) for chunk_id, _ in candidates[-1:]])
+        result = evaluate_retrieval.evaluate(rag, golden, k=2, source_of=source_of)
+    assert result["shortlist_recall_at_k"] == 1.0 and result["shortlist_mrr"] == 1.0
+    assert result["recall_at_k"] == 0.0 and result["mrr"] == 0.0
+    assert result["per_query"][0]["context_sources"] == ["netconf.pdf"]
+
+def test_parse_args_rejects_unknown_index_types():
+    """Test --index-types only accepts index types vectorize.py can build."""
+    import pytest
+    assert evaluate_retrieval.parse_args(["--index-types", "flat", "sq8"]).index_types == ["flat", "sq8"]
+    with pytest.raises(SystemExit):
+        evaluate_retrieval.parse_args(["--index-types", "annoy"])
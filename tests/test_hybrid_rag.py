@@ -75,4 +75,829 @@ def test_chat_various_queries(vector_store, mock_env, query, expected_substring)
     response = chat(query)
     assert isinstance(response, str)
     assert len(response) > 0
-    # Don't assert specific content in test environment
\ No newline at end of file
+    # Don't assert specific content in test environment
+
+class _FakeChunk:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("no text parts")
+        return self._text
+
+class _FakeStreamingModel:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        assert stream
+        return iter([_FakeChunk("Hello"), _FakeChunk(None), _FakeChunk(" there!")])
+
+def test_chat_stream_casual(monkeypatch):
+    """Test streaming chat yields Gemini chunks and skips chunks without text."""
+    import hybrid_rag_gpt
+    monkeypatch.setattr(hybrid_rag_gpt.genai, "GenerativeModel", _FakeStreamingModel)
+    chunks = list(hybrid_rag_gpt.chat_stream("hello"))
+    assert chunks == ["Hello", " there!"]
+
+def test_chat_stream_rag_falls_back_to_documents(monkeypatch):
+    """Test streaming chat falls back to a document-only answer when the RAG pipeline fails."""
+    import hybrid_rag_gpt
+    monkeypatch.setattr(hybrid_rag_gpt.genai, "GenerativeModel", _FakeStreamingModel)
+
+    def failing_gather_context(user_input, query_embedding=None):
+        raise RuntimeError("search failed")
+
+    monkeypatch.setattr(hybrid_rag_gpt, "lookup_cached_answer", lambda user_input, history: (None, None))
+    monkeypatch.setattr(hybrid_rag_gpt, "gather_context", failing_gather_context)
+    monkeypatch.setattr(hybrid_rag_gpt, "doc_search", lambda query, query_embedding=None: "NETCONF docs")
+    chunks = list(hybrid_rag_gpt.chat_stream("Explain NETCONF vs RESTCONF in detail"))
+    assert "".join(chunks) == "Hello there!"
+
+class _FakeAsyncModel:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        class _Response:
+            text = "Async answer"
+        return _Response()
+
+@pytest.mark.asyncio
+async def test_achat_does_not_block_event_loop(monkeypatch):
+    """Test the async chat pipeline offloads blocking retrieval so other coroutines keep running."""
+    import asyncio
+    import time
+    import numpy as np
+    import hybrid_rag_gpt
+
+    def slow_build_answer_context(candidates, k, query_embedding, with_scores=False):
+        time.sleep(0.3)
+        return ("NETCONF docs", [0.2]) if with_scores else "NETCONF docs"
+
+    async def fake_retrieve_chunks(query, k, query_embedding):
+        return [(0, 1.0)]
+
+    async def fake_web_search(query):
+        return "Web snippet"
+
+    async def no_cached_answer(user_input, history=None):
+        return None, None
+
+    async def fake_embed_query(query):
+        return np.zeros((1, 4), dtype="float32")
+
+    monkeypatch.setattr(hybrid_rag_gpt.genai, "GenerativeModel", _FakeAsyncModel)
+    monkeypatch.setattr(hybrid_rag_gpt, "async_lookup_cached_answer", no_cached_answer)
+    monkeypatch.setattr(hybrid_rag_gpt, "async_embed_query", fake_embed_query)
+    monkeypatch.setattr(hybrid_rag_gpt, "embedding_model", object())
+    monkeypatch.setattr(hybrid_rag_gpt, "faiss_index", object())
+    monkeypatch.setattr(hybrid_rag_gpt, "async_retrieve_chunks", fake_retrieve_chunks)
+    monkeypatch.setattr(hybrid_rag_gpt, "build_answer_context", slow_build_answer_context)
+    monkeypatch.setattr(hybrid_rag_gpt, "async_web_search", fake_web_search)
+
+    ticks = 0
+
+    async def heartbeat():
+        nonlocal ticks
+        for _ in range(5):
+            await asyncio.sleep(0.02)
+            ticks += 1
+
+    answer, _ = await asyncio.gather(
+        hybrid_rag_gpt.achat("Explain NETCONF vs RESTCONF in detail"),
+        heartbeat()
+    )
+    assert answer == "Async answer"
+    assert ticks == 5
+
+@pytest.mark.asyncio
+async def test_achat_skips_per_request_garbage_collection(monkeypatch):
+    """Test the async pipeline never runs a full gc.collect() on the event loop."""
+    import hybrid_rag_gpt
+
+    async def fake_gather_context(user_input, query_embedding=None):
+        return "NETCONF docs", "Web snippet"
+
+    async def no_cached_answer(user_input, history=None):
+        return None, None
+
+    collections = []
+    monkeypatch.setattr(hybrid_rag_gpt.genai, "GenerativeModel", _FakeAsyncModel)
+    monkeypatch.setattr(hybrid_rag_gpt, "async_lookup_cached_answer", no_cached_answer)
+    monkeypatch.setattr(hybrid_rag_gpt, "async_gather_context", fake_gather_context)
+    monkeypatch.setattr(hybrid_rag_gpt.gc, "collect", lambda *args: collections.append(args))
+    assert await hybrid_rag_gpt.achat("Explain NETCONF vs RESTCONF in detail") == "Async answer"
+    assert collections == []
+
+@pytest.mark.asyncio
+async def test_concurrent_achat_calls_share_one_encode_batch(monkeypatch):
+    """Test N concurrent requests are encoded as one batch of N, not capped by the CPU executor size."""
+    import asyncio
+    import numpy as np
+    import hybrid_rag_gpt
+
+    class RecordingEncoder:
+        batches = []
+
+        def encode(self, sentences, show_progress_bar=False):
+            RecordingEncoder.batches.append(len(sentences))
+            return np.ones((len(sentences), 4), dtype="float32")
+
+    queries = [f"Explain NETCONF topic number {i} in detail" for i in range(8)]
+    monkeypatch.setattr(hybrid_rag_gpt.genai, "GenerativeModel", _FakeAsyncModel)
+    monkeypatch.setattr(hybrid_rag_gpt, "embedding_model", RecordingEncoder())
+    monkeypatch.setattr(hybrid_rag_gpt, "faiss_index", object())
+    monkeypatch.setattr(hybrid_rag_gpt, "embedding_cache", hybrid_rag_gpt.EmbeddingCache())
+    monkeypatch.setattr(hybrid_rag_gpt, "answer_cache", hybrid_rag_gpt.SemanticAnswerCache())
+    monkeypatch.setattr(hybrid_rag_gpt, "embedding_batcher",
+                        hybrid_rag_gpt.MicroBatcher(hybrid_rag_gpt._encode_batch, window_seconds=0.05, max_batch_size=32))
+    async def fake_doc_search(query, query_embedding=None, with_scores=False):
+        return "NETCONF docs", [0.9]
+
+    monkeypatch.setattr(hybrid_rag_gpt, "async_doc_search", fake_doc_search)
+    assert hybrid_rag_gpt.cpu_executor._max_workers < len(queries)
+
+    answers = await asyncio.gather(*(hybrid_rag_gpt.achat(query) for query in queries))
+    assert answers == ["Async answer"] * len(queries)
+    assert RecordingEncoder.batches == [len(queries)]
+
+@pytest.mark.asyncio
+async def test_concurrent_async_searches_share_one_faiss_batch(monkeypatch):
+    """Test N concurrent async retrievals reach FAISS as one search of N, not capped by the CPU executor size."""
+    import asyncio
+    import numpy as np
+    import hybrid_rag_gpt
+
+    class RecordingIndex:
+        batches = []
+
+        def search(self, matrix, k):
+            RecordingIndex.batches.append(matrix.shape[0])
+            ids = np.tile(np.arange(k), (matrix.shape[0], 1))
+            return np.zeros((matrix.shape[0], k), dtype="float32"), ids
+
+    monkeypatch.setattr(hybrid_rag_gpt, "faiss_index", RecordingIndex())
+    monkeypatch.setattr(hybrid_rag_gpt, "texts", [f"chunk {i}" for i in range(5)])
+    monkeypatch.setattr(hybrid_rag_gpt, "bm25_index", None)
+    monkeypatch.setattr(hybrid_rag_gpt, "exact_vectors", None)
+    monkeypatch.setattr(hybrid_rag_gpt, "track_routing_enabled", False)
+    monkeypatch.setattr(hybrid_rag_gpt, "search_batcher",
+                        hybrid_rag_gpt.MicroBatcher(hybrid_rag_gpt._search_batch, window_seconds=0.05, max_batch_size=32))
+    queries = [f"NETCONF question {i}" for i in range(8)]
+    assert hybrid_rag_gpt.cpu_executor._max_workers < len(queries)
+
+    results = await asyncio.gather(*(
+        hybrid_rag_gpt.async_retrieve_chunks(query, 5, np.ones((1, 4), dtype="float32")) for query in queries
+    ))
+    assert [chunk_id for chunk_id, _ in results[0]] == [0, 1, 2, 3, 4]
+    assert RecordingIndex.batches == [len(queries)]
+
+@pytest.mark.asyncio
+async def test_async_web_search_handles_failure(monkeypatch):
+    """Test async web search degrades to a friendly message when Serper fails."""
+    import hybrid_rag_gpt
+    from serper_client import SerperError
+
+    async def failing_asearch(query, api_key):
+        raise SerperError("deadline exceeded")
+
+    monkeypatch.setenv("SERPAPI_KEY", "test_serper_key")
+    monkeypatch.setattr(hybrid_rag_gpt.serper_client, "asearch", failing_asearch)
+    assert await hybrid_rag_gpt.async_web_search("NETCONF") == "Web search temporarily unavailable."
+
+def test_semantic_cache_hit_on_similar_embedding():
+    """Test the semantic cache returns answers for near-identical query embeddings only."""
+    import numpy as np
+    from hybrid_rag_gpt import SemanticAnswerCache
+
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.put(np.array([[1.0, 0.0, 0.0]]), "Study the 200-901 blueprint.")
+    assert cache.get(np.array([[0.99, 0.05, 0.0]])) == "Study the 200-901 blueprint."
+    assert cache.get(np.array([[0.0, 1.0, 0.0]])) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+@pytest.mark.parametrize("cached,asked", [
+    ("What is on the CCNA Automation exam?", "What is on the CCNP Automation exam?"),
+    ("How should I study for ENAUTO?", "How should I study for AUTOCOR?"),
+    ("Which topics does 200-901 cover?", "Which topics does 350-901 cover?"),
+    ("Does the exam use Python 2?", "Does the exam use Python 3?"),
+])
+def test_semantic_cache_never_serves_other_certification(cached, asked):
+    """Test paraphrases naming another track, level or number miss even at identical embeddings."""
+    import numpy as np
+    from hybrid_rag_gpt import SemanticAnswerCache
+
+    cache = SemanticAnswerCache(threshold=0.92)
+    embedding = np.array([1.0, 0.0, 0.0])
+    cache.put(embedding, f"Answer to: {cached}", cached)
+    assert cache.get(embedding, asked) is None
+    assert cache.get(embedding, cached.lower()) == f"Answer to: {cached}"
+
+def test_semantic_cache_ttl_and_lru_eviction(monkeypatch):
+    """Test the semantic cache expires old entries and evicts least-recently-used ones."""
+    import numpy as np
+    import hybrid_rag_gpt
+    from hybrid_rag_gpt import SemanticAnswerCache
+
+    cache = SemanticAnswerCache(threshold=0.99, ttl_seconds=60, max_entries=2)
+    a, b, c = np.eye(3)
+    cache.put(a, "A")
+    cache.put(b, "B")
+    assert cache.get(a) == "A"  # a becomes most recently used
+    cache.put(c, "C")
+    assert cache.get(b) is None  # b was least recently used
+    assert cache.get(a) == "A"
+
+    now = hybrid_rag_gpt.time.monotonic()
+    monkeypatch.setattr(hybrid_rag_gpt.time, "monotonic", lambda: now + 120)
+    assert cache.get(a) is None
+    assert cache.stats()["entries"] == 0
+
+def test_semantic_cache_memory_cap():
+    """Test the semantic cache stays under its byte budget."""
+    import numpy as np
+    from hybrid_rag_gpt import SemanticAnswerCache
+
+    cache = SemanticAnswerCache(max_bytes=1000)
+    for i in range(10):
+        vector = np.zeros(8)
+        vector[i % 8] = 1.0
+        cache.put(vector, "x" * 200)
+    assert cache.stats()["bytes"] <= 1000
+    cache.put(np.ones(8), "y" * 5000)  # Larger than the whole budget, never stored
+    assert cache.get(np.ones(8)) is None
+
+def test_semantic_cache_skipped_with_history(monkeypatch, sample_conversation_history):
+    """Test follow-up questions bypass the semantic cache."""
+    import hybrid_rag_gpt
+
+    def unexpected_embed(query):
+        raise AssertionError("query should not be embedded for the cache")
+
+    monkeypatch.setattr(hybrid_rag_gpt, "embed_query", unexpected_embed)
+    assert hybrid_rag_gpt.lookup_cached_answer("Tell me more", sample_conversation_history) == (None, None)
+
+class _CountingEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, sentences):
+        import numpy as np
+        self.calls.append(list(sentences))
+        return np.array([[float(len(sentence)), 1.0, 0.0] for sentence in sentences], dtype="float64")
+
+def test_embed_query_uses_cache(monkeypatch):
+    """Test repeat queries (up to whitespace) skip the embedding model."""
+    import hybrid_rag_gpt
+    from hybrid_rag_gpt import EmbeddingCache
+
+    encoder = _CountingEncoder()
+    monkeypatch.setattr(hybrid_rag_gpt, "load_vector_store", lambda: True)
+    monkeypatch.setattr(hybrid_rag_gpt, "embedding_model", encoder)
+    monkeypatch.setattr(hybrid_rag_gpt, "embedding_cache", EmbeddingCache(max_entries=8))
+
+    first = hybrid_rag_gpt.embed_query("What is  NETCONF?")
+    second = hybrid_rag_gpt.embed_query(" What is NETCONF? ")
+    assert encoder.calls == [["What is NETCONF?"]]
+    assert first.shape == (1, 3)
+    assert first.dtype == "float32"
+    assert (first == second).all()
+    assert hybrid_rag_gpt.embedding_cache.stats()["hit_rate"] == 0.5
+
+def test_embedding_cache_lru_bound():
+    """Test the embedding cache evicts least-recently-used entries."""
+    from hybrid_rag_gpt import EmbeddingCache
+
+    cache = EmbeddingCache(max_entries=2)
+    cache.put("a", [1.0, 0.0])
+    cache.put("b", [0.0, 1.0])
+    assert cache.get("a") is not None
+    cache.put("c", [1.0, 1.0])
+    assert cache.get("b") is None
+    assert cache.get("c").dtype == "float32"
+    assert cache.stats()["entries"] == 2
+
+def test_micro_batcher_coalesces_concurrent_calls():
+    """Test concurrent submissions are processed as shared batches with per-caller results."""
+    import concurrent.futures
+    import time
+    from hybrid_rag_gpt import MicroBatcher
+
+    batch_sizes = []
+
+    def square_batch(items):
+        batch_sizes.append(len(items))
+        time.sleep(0.01)
+        return [item * item for item in items]
+
+    batcher = MicroBatcher(square_batch, window_seconds=0.02, max_batch_size=16)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(batcher.submit, range(16)))
+    assert results == [i * i for i in range(16)]
+    assert sum(batch_sizes) == 16
+    assert len(batch_sizes) < 16
+    assert batcher.stats()["largest_batch"] > 1
+
+def test_micro_batcher_propagates_errors():
+    """Test a failing batch raises in every waiting caller."""
+    from hybrid_rag_gpt import MicroBatcher
+
+    def failing_batch(items):
+        raise RuntimeError("encoder crashed")
+
+    batcher = MicroBatcher(failing_batch, window_seconds=0.001)
+    with pytest.raises(RuntimeError):
+        batcher.submit("query")
+
+def test_search_batch_slices_per_request_k(monkeypatch):
+    """Test one FAISS search serves requests with different k."""
+    import numpy as np
+    import hybrid_rag_gpt
+
+    class FakeIndex:
+        def search(self, matrix, k):
+            self.shape = (matrix.shape, k)
+            rows = matrix.shape[0]
+            return np.zeros((rows, k), dtype="float32"), np.tile(np.arange(k), (rows, 1))
+
+    fake_index = FakeIndex()
+    monkeypatch.setattr(hybrid_rag_gpt, "faiss_index", fake_index)
+    results = hybrid_rag_gpt._search_batch([(np.ones((1, 4)), 2), (np.ones(4), 5)])
+    assert fake_index.shape == ((2, 4), 5)
+    assert results[0][1].tolist() == [[0, 1]]
+    assert results[1][1].tolist() == [[0, 1, 2, 3, 4]]
+
+def test_load_search_parameters(tmp_path, monkeypatch):
+    """Test saved query-time FAISS parameters are read and env vars override them."""
+    import json
+    from hybrid_rag_gpt import load_search_parameters
+
+    config_path = tmp_path / "index_config.json"
+    config_path.write_text(json.dumps({"index_type": "hnsw", "ef_search": 64, "nprobe": 8}))
+    monkeypatch.delenv("FAISS_EF_SEARCH", raising=False)
+    monkeypatch.setenv("FAISS_NPROBE", "16")
+    assert load_search_parameters(str(config_path)) == {"ef_search": 64, "nprobe": 16}
+    assert load_search_parameters(str(tmp_path / "missing.json")) == {"ef_search": None, "nprobe": 16}
+
+def test_load_chunk_texts_prefers_chunk_store(tmp_path):
+    """Test the chunk store is used when present and texts.pkl otherwise."""
+    import pickle
+    from chunk_store import ChunkStore, write_chunk_store
+    from hybrid_rag_gpt import load_chunk_texts
+
+    with open(tmp_path / "texts.pkl", "wb") as f:
+        pickle.dump(["legacy chunk"], f)
+    assert load_chunk_texts(str(tmp_path)) == ["legacy chunk"]
+
+    write_chunk_store(["mapped chunk"], str(tmp_path))
+    texts = load_chunk_texts(str(tmp_path))
+    assert isinstance(texts, ChunkStore)
+    assert texts[0] == "mapped chunk"
+
+def test_read_faiss_index_memory_mapped(tmp_path, monkeypatch):
+    """Test the FAISS index can be opened memory-mapped and searched."""
+    import faiss
+    import numpy as np
+    from hybrid_rag_gpt import read_faiss_index
+
+    vectors = np.eye(4, dtype="float32")
+    index = faiss.IndexFlatL2(4)
+    index.add(vectors)
+    faiss.write_index(index, str(tmp_path / "faiss.index"))
+
+    monkeypatch.setenv("FAISS_MMAP", "1")
+    mapped = read_faiss_index(str(tmp_path / "faiss.index"))
+    assert mapped.ntotal == 4
+    assert mapped.search(vectors[2:3], 1)[1].tolist() == [[2]]
+
+def test_retrieve_answer_fuses_bm25_with_faiss(monkeypatch):
+    """Test an exact-token BM25 hit is merged into dense results by reciprocal-rank fusion."""
+    import numpy as np
+    import hybrid_rag_gpt
+    from bm25_index import BM25Index
+
+    texts = ["Generic automation overview.", "Network programmability basics.", "The 350-901 exam blueprint."]
+
+    class DenseOnlyGeneric:
+        def submit_async(self, request):
+            import concurrent.futures
+            future = concurrent.futures.Future()
+            future.set_result((np.zeros((1, 2), dtype="float32"), np.array([[0, 1]])))
+            return future
+
+    monkeypatch.setattr(hybrid_rag_gpt, "load_vector_store", lambda: True)
+    monkeypatch.setattr(hybrid_rag_gpt, "texts", texts)
+    monkeypatch.setattr(hybrid_rag_gpt, "search_batcher", DenseOnlyGeneric())
+    monkeypatch.setattr(hybrid_rag_gpt, "bm25_index", BM25Index.build(texts))
+    result = hybrid_rag_gpt.retrieve_answer("350-901", k=2, query_embedding=np.zeros((1, 4), dtype="float32"))
+    assert "350-901 exam blueprint" in result
+
+    monkeypatch.setattr(hybrid_rag_gpt, "bm25_index", None)
+    result = hybrid_rag_gpt.retrieve_answer("350-901", k=2, query_embedding=np.zeros((1, 4), dtype="float32"))
+    assert "350-901" not in result
+
+def test_load_lexical_index_requires_matching_chunk_count(tmp_path):
+    """Test a BM25 index built for a different chunk store is ignored."""
+    from bm25_index import BM25Index
+    from hybrid_rag_gpt import load_lexical_index
+
+    assert load_lexical_index(str(tmp_path), 2) is None
+    BM25Index.build(["first chunk", "second chunk"]).save(str(tmp_path))
+    assert load_lexical_index(str(tmp_path), 2).num_docs == 2
+    assert load_lexical_index(str(tmp_path), 3) is None
+
+def test_micro_batcher_submit_async_when_disabled():
+    """Test submit_async returns a completed future when batching is off."""
+    from hybrid_rag_gpt import MicroBatcher
+
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], window_seconds=0)
+    assert batcher.submit_async(21).result() == 42
+
+def test_retrieve_answer_routes_to_track_partition(monkeypatch):
+    """Test a query naming one certification searches only that track's sub-index and BM25 partition."""
+    import faiss
+    import numpy as np
+    import hybrid_rag_gpt
+    from bm25_index import BM25Index
+    from chunk_metadata import ChunkMetadata
+
+    texts = ["DCNAUTO covers ACI automation.", "ENAUTO covers SD-WAN automation.", "Automation basics for everyone."]
+    metadata = ChunkMetadata.build({
+        "docs/300-635-DCNAUTO.pdf": {"hash": "a", "chunk_ids": [0]},
+        "docs/300-435-ENAUTO.pdf": {"hash": "b", "chunk_ids": [1]},
+        "docs/basics.pdf": {"hash": "c", "chunk_ids": [2]},
+    }, texts)
+    vectors = np.eye(3, 4, dtype="float32")
+    full_index = faiss.IndexIDMap2(faiss.IndexFlatL2(4))
+    full_index.add_with_ids(vectors, np.arange(3, dtype="int64"))
+    dcnauto_index = faiss.IndexIDMap2(faiss.IndexFlatL2(4))
+    dcnauto_index.add_with_ids(vectors[:1], np.array([0], dtype="int64"))
+
+    monkeypatch.setattr(hybrid_rag_gpt, "load_vector_store", lambda: True)
+    monkeypatch.setattr(hybrid_rag_gpt, "texts", texts)
+    monkeypatch.setattr(hybrid_rag_gpt, "faiss_index", full_index)
+    monkeypatch.setattr(hybrid_rag_gpt, "track_indexes", {"DCNAUTO": dcnauto_index})
+    monkeypatch.setattr(hybrid_rag_gpt, "chunk_metadata", metadata)
+    monkeypatch.setattr(hybrid_rag_gpt, "bm25_index", BM25Index.build(texts))
+    monkeypatch.setattr(hybrid_rag_gpt, "search_batcher", hybrid_rag_gpt.MicroBatcher(hybrid_rag_gpt._search_batch, 0))
+
+    assert hybrid_rag_gpt.route_query("What is on the DCNAUTO exam?") == "DCNAUTO"
+    assert hybrid_rag_gpt.route_query("What is on the ENAUTO exam?") is None  # No sub-index loaded
+    monkeypatch.setattr(hybrid_rag_gpt, "track_indexes", {"AUTOCOR": dcnauto_index, "DCNAUTO": dcnauto_index})
+    assert hybrid_rag_gpt.route_query("What is on the CCNP Automation exam?") is None  # Spans several tracks
+    monkeypatch.setattr(hybrid_rag_gpt, "track_indexes", {"DCNAUTO": dcnauto_index})
+    query_embedding = vectors[1:2]  # Closest to the ENAUTO chunk overall
+    result = hybrid_rag_gpt.retrieve_answer("DCNAUTO automation", k=3, query_embedding=query_embedding)
+    assert result == "DCNAUTO covers ACI automation."
+    result = hybrid_rag_gpt.retrieve_answer("automation", k=3, query_embedding=query_embedding)
+    assert "ENAUTO" in result and "basics" in result
+
+def test_search_batch_groups_requests_by_track(monkeypatch):
+    """Test batched requests are searched against their own target index."""
+    import numpy as np
+    import hybrid_rag_gpt
+
+    class FakeIndex:
+        def __init__(self, label):
+            self.label = label
+            self.calls = 0
+
+        def search(self, matrix, k):
+            self.calls += 1
+            return np.zeros((matrix.shape[0], k), dtype="float32"), np.full((matrix.shape[0], k), self.label)
+
+    full_index, track_index = FakeIndex(1), FakeIndex(2)
+    monkeypatch.setattr(hybrid_rag_gpt, "faiss_index", full_index)
+    monkeypatch.setattr(hybrid_rag_gpt, "track_indexes", {"AUTOCOR": track_index})
+    results = hybrid_rag_gpt._search_batch([(np.ones(4), 1), (np.ones(4), 2, "AUTOCOR"), (np.ones(4), 1)])
+    assert [result[1].tolist() for result in results] == [[[1]], [[2, 2]], [[1]]]
+    assert (full_index.calls, track_index.calls) == (1, 1)
+
+def test_retrieve_answer_dedupes_and_respects_token_budget(monkeypatch):
+    """Test near-duplicate chunks are dropped and the context stays within CONTEXT_TOKEN_BUDGET."""
+    import numpy as np
+    import hybrid_rag_gpt
+    from context_assembler import estimate_tokens
+
+    texts = [
+        "NETCONF runs over SSH on port 830.",
+        "NETCONF runs over SSH on port 830!",
+        "RESTCONF exposes YANG data over HTTPS.",
+        "gNMI streams telemetry over gRPC. " * 40,
+    ]
+
+    class AllChunks:
+        def submit_async(self, request):
+            import concurrent.futures
+            future = concurrent.futures.Future()
+            future.set_result((np.zeros((1, 4), dtype="float32"), np.array([[0, 1, 2, 3]])))
+            return future
+
+    monkeypatch.setattr(hybrid_rag_gpt, "load_vector_store", lambda: True)
+    monkeypatch.setattr(hybrid_rag_gpt, "texts", texts)
+    monkeypatch.setattr(hybrid_rag_gpt, "search_batcher", AllChunks())
+    monkeypatch.setattr(hybrid_rag_gpt, "bm25_index", None)
+    monkeypatch.setattr(hybrid_rag_gpt, "chunk_vectors", lambda ids: None)
+    monkeypatch.setattr(hybrid_rag_gpt, "context_token_budget", 40)
+    result = hybrid_rag_gpt.retrieve_answer("NETCONF", k=4, query_embedding=np.zeros((1, 4), dtype="float32"))
+    assert result.count("port 830") == 1
+    assert "RESTCONF" in result
+    assert estimate_tokens(result) <= 40
+
+def test_retrieve_answer_keeps_bm25_only_chunk(monkeypatch):
+    """Test a chunk only BM25 found (exam code far from the query embedding) survives context assembly."""
+    import concurrent.futures
+    import numpy as np
+    import hybrid_rag_gpt
+    from bm25_index import BM25Index
+
+    texts = [f"Model-driven programmability note {i} about YANG data models." for i in range(5)]
+    texts.append("The 350-901 blueprint weights software development and design at 20 percent.")
+    query = np.array([1, 0, 0, 0], dtype="float32")
+    vectors = np.array([[1, 0.6, 0, 0], [1, 0, 0.6, 0], [1, -0.6, 0, 0], [1, 0, -0.6, 0], [1, 0.4, 0.4, 0], [0, 0, 0, 1]],
+                       dtype="float32")
+
+    class DenseOnly:
+        def submit_async(self, request):
+            future = concurrent.futures.Future()
+            future.set_result((np.zeros((1, 5), dtype="float32"), np.array([[0, 1, 2, 3, 4]])))
+            return future
+
+    monkeypatch.setattr(hybrid_rag_gpt, "load_vector_store", lambda: True)
+    monkeypatch.setattr(hybrid_rag_gpt, "texts", texts)
+    monkeypatch.setattr(hybrid_rag_gpt, "search_batcher", DenseOnly())
+    monkeypatch.setattr(hybrid_rag_gpt, "bm25_index", BM25Index.build(texts))
+    monkeypatch.setattr(hybrid_rag_gpt, "track_routing_enabled", False)
+    monkeypatch.setattr(hybrid_rag_gpt, "exact_vectors", None)
+    monkeypatch.setattr(hybrid_rag_gpt, "chunk_vectors", lambda ids: vectors[np.asarray(ids)])
+    result = hybrid_rag_gpt.retrieve_answer("What does 350-901 weight?", k=3, query_embedding=query)
+    assert "350-901 blueprint" in result
+
+class _StubGeminiModel:
+    """Local stand-in for genai.GenerativeModel recording how it is built and called."""
+    created = []
+
+    def __init__(self, model_name=None, system_instruction=None, cached_content=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.cached_content = cached_content
+        self.prompts = []
+        _StubGeminiModel.created.append(self)
+
+    @classmethod
+    def from_cached_content(cls, cached_content):
+        return cls(cached_content=cached_content)
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        self.prompts.append(prompt)
+
+        class _Response:
+            text = "Hi! Ask me about Cisco certifications."
+        return _Response()
+
+def test_gemini_model_reused_with_system_instruction(monkeypatch):
+    """Test chat builds one Gemini model and sends the system prompt as an instruction, not per request."""
+    import hybrid_rag_gpt
+    monkeypatch.setattr(_StubGeminiModel, "created", [])
+    monkeypatch.setattr(hybrid_rag_gpt.genai, "GenerativeModel", _StubGeminiModel)
+    monkeypatch.setattr(hybrid_rag_gpt, "gemini_context_cache_enabled", False)
+
+    assert hybrid_rag_gpt.chat("hello") == "Hi! Ask me about Cisco certifications."
+    hybrid_rag_gpt.chat("thanks")
+    assert len(_StubGeminiModel.created) == 1
+    model = _StubGeminiModel.created[0]
+    assert hybrid_rag_gpt.system_prompt in model.system_instruction
+    assert hybrid_rag_gpt.html_formatting_instructions in model.system_instruction
+    assert all(hybrid_rag_gpt.system_prompt not in prompt for prompt in model.prompts)
+    rag_prompt = hybrid_rag_gpt.build_rag_prompt("What is NETCONF?", "", "docs", "web")
+    assert hybrid_rag_gpt.html_formatting_instructions not in rag_prompt
+
+def test_gemini_context_cache_created_once_and_refreshed(monkeypatch):
+    """Test the static prefix is cached server-side once and recreated before the cache TTL runs out."""
+    import hybrid_rag_gpt
+    created_caches = []
+
+    class _StubCachedContent:
+        @staticmethod
+        def create(model, display_name=None, system_instruction=None, ttl=None):
+            cache = type("Cache", (), {"name": f"cachedContents/{len(created_caches)}", "ttl": ttl})()
+            created_caches.append((model, system_instruction))
+            return cache
+
+    now = 1000.0
+    monkeypatch.setattr(_StubGeminiModel, "created", [])
+    monkeypatch.setattr(hybrid_rag_gpt.genai, "GenerativeModel", _StubGeminiModel)
+    monkeypatch.setattr(hybrid_rag_gpt.genai.caching, "CachedContent", _StubCachedContent)
+    monkeypatch.setattr(hybrid_rag_gpt, "gemini_context_cache_enabled", True)
+    monkeypatch.setattr(hybrid_rag_gpt, "gemini_cache_ttl", 600)
+    monkeypatch.setattr(hybrid_rag_gpt.time, "monotonic", lambda: now)
+
+    first = hybrid_rag_gpt.get_gemini_model()
+    assert hybrid_rag_gpt.get_gemini_model() is first
+    assert first.cached_content.name == "cachedContents/0"
+    assert created_caches == [(f"models/{hybrid_rag_gpt.gemini_model_name}", hybrid_rag_gpt.system_instruction)]
+
+    now += 600
+    assert hybrid_rag_gpt.get_gemini_model().cached_content.name == "cachedContents/1"
+
+@pytest.mark.asyncio
+async def test_achat_creates_context_cache_off_event_loop(monkeypatch):
+    """Test a slow CachedContent.create runs in a worker thread instead of stalling other coroutines."""
+    import asyncio
+    import time
+    import hybrid_rag_gpt
+
+    class _SlowCachedContent:
+        @staticmethod
+        def create(model, display_name=None, system_instruction=None, ttl=None):
+            time.sleep(0.3)
+            return type("Cache", (), {"name": "cachedContents/0", "ttl": ttl})()
+
+    monkeypatch.setattr(_StubGeminiModel, "created", [])
+    monkeypatch.setattr(hybrid_rag_gpt.genai, "GenerativeModel", _StubGeminiModel)
+    monkeypatch.setattr(hybrid_rag_gpt.genai.caching, "CachedContent", _SlowCachedContent)
+    monkeypatch.setattr(hybrid_rag_gpt, "gemini_context_cache_enabled", True)
+    monkeypatch.setattr(hybrid_rag_gpt, "gemini_transport", "rest")
+
+    finished = []
+
+    async def answer():
+        finished.append(await hybrid_rag_gpt.achat("hello"))
+
+    async def heartbeat():
+        for _ in range(5):
+            await asyncio.sleep(0.02)
+        finished.append("heartbeat")
+
+    await asyncio.gather(answer(), heartbeat())
+    # The heartbeat only finishes first if the cache was created while the loop kept running
+    assert finished == ["heartbeat", "Hi! Ask me about Cisco certifications."]
+    assert hybrid_rag_gpt.gemini_model_is_current()
+
+def test_gemini_context_cache_failure_falls_back(monkeypatch):
+    """Test an unavailable context cache falls back to a plain model with the system instruction."""
+    import hybrid_rag_gpt
+
+    class _RejectingCachedContent:
+        @staticmethod
+        def create(**kwargs):
+            raise ValueError("Cached content is too small")
+
+    monkeypatch.setattr(_StubGeminiModel, "created", [])
+    monkeypatch.setattr(hybrid_rag_gpt.genai, "GenerativeModel", _StubGeminiModel)
+    monkeypatch.setattr(hybrid_rag_gpt.genai.caching, "CachedContent", _RejectingCachedContent)
+    monkeypatch.setattr(hybrid_rag_gpt, "gemini_context_cache_enabled", True)
+
+    model = hybrid_rag_gpt.get_gemini_model()
+    assert model.cached_content is None
+    assert model.system_instruction == hybrid_rag_gpt.system_instruction
+    assert hybrid_rag_gpt.get_gemini_model() is model
+
+def test_retrieve_answer_with_scores_returns_query_similarities(monkeypatch):
+    """Test retrieve_answer can report the cosine similarity of the query to each retrieved chunk."""
+    import faiss
+    import numpy as np
+    import hybrid_rag_gpt
+
+    texts = ["NETCONF runs over SSH.", "Webex bots use webhooks."]
+    index = faiss.IndexFlatL2(2)
+    index.add(np.array([[1, 0], [0, 1]], dtype="float32"))
+    monkeypatch.setattr(hybrid_rag_gpt, "load_vector_store", lambda: True)
+    monkeypatch.setattr(hybrid_rag_gpt, "texts", texts)
+    monkeypatch.setattr(hybrid_rag_gpt, "faiss_index", index)
+    monkeypatch.setattr(hybrid_rag_gpt, "bm25_index", None)
+    monkeypatch.setattr(hybrid_rag_gpt, "track_indexes", {})
+    monkeypatch.setattr(hybrid_rag_gpt, "search_batcher", hybrid_rag_gpt.MicroBatcher(hybrid_rag_gpt._search_batch, 0))
+
+    context, similarities = hybrid_rag_gpt.retrieve_answer(
+        "NETCONF", k=2, query_embedding=np.array([[3, 4]], dtype="float32"), with_scores=True)
+    assert "NETCONF" in context
+    assert similarities == pytest.approx([0.8, 0.6])
+
+def _gated_search(monkeypatch, similarities, policy="gated"):
+    import hybrid_rag_gpt
+    web_calls = []
+
+    def fake_web_search(query):
+        web_calls.append(query)
+        return "Web snippet"
+
+    async def fake_async_web_search(query):
+        web_calls.append(query)
+        return "Web snippet"
+
+    monkeypatch.setattr(hybrid_rag_gpt, "web_search_policy", policy)
+    monkeypatch.setattr(hybrid_rag_gpt, "web_search_confidence", 0.6)
+    async def fake_async_doc_search(query, query_embedding=None, with_scores=False):
+        import asyncio
+        await asyncio.sleep(0)  # Real retrieval awaits its batches, letting a speculative web search start
+        return "NETCONF docs", similarities
+
+    monkeypatch.setattr(hybrid_rag_gpt, "doc_search",
+                        lambda query, query_embedding=None, with_scores=False: ("NETCONF docs", similarities))
+    monkeypatch.setattr(hybrid_rag_gpt, "async_doc_search", fake_async_doc_search)
+    monkeypatch.setattr(hybrid_rag_gpt, "web_search", fake_web_search)
+    monkeypatch.setattr(hybrid_rag_gpt, "async_web_search", fake_async_web_search)
+    return hybrid_rag_gpt, web_calls
+
+@pytest.mark.parametrize("policy", ["gated", "speculative"])
+def test_gather_context_skips_web_search_when_retrieval_is_confident(monkeypatch, policy):
+    """Test a strong local match answers without waiting for web search and is counted as skipped."""
+    from metrics import web_search_decisions
+    rag, web_calls = _gated_search(monkeypatch, [0.75, 0.4], policy)
+    skipped = web_search_decisions.value(decision="skipped")
+
+    doc_context, web_context = rag.gather_context("Explain NETCONF")
+    assert (doc_context, web_context) == ("NETCONF docs", rag.WEB_SEARCH_SKIPPED)
+    if policy == "gated":
+        assert web_calls == []
+    assert web_search_decisions.value(decision="skipped") == skipped + 1
+
+@pytest.mark.parametrize("policy", ["gated", "speculative", "always"])
+def test_gather_context_searches_web_when_retrieval_is_weak(monkeypatch, policy):
+    """Test weak local matches (and the always policy) still get web results."""
+    from metrics import web_search_decisions
+    rag, web_calls = _gated_search(monkeypatch, [0.9] if policy == "always" else [0.3], policy)
+    searched = web_search_decisions.value(decision="searched")
+
+    assert rag.gather_context("Explain NETCONF") == ("NETCONF docs", "Web snippet")
+    assert web_calls == ["Explain NETCONF"]
+    assert web_search_decisions.value(decision="searched") == searched + 1
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("similarities, expected", [([0.8], None), ([0.2], "Web snippet"), ([], "Web snippet")])
+async def test_async_gather_context_gates_web_search(monkeypatch, similarities, expected):
+    """Test the async pipeline applies the same confidence gate."""
+    rag, web_calls = _gated_search(monkeypatch, similarities)
+    doc_context, web_context = await rag.async_gather_context("Explain NETCONF")
+    assert doc_context == "NETCONF docs"
+    assert web_context == (expected or rag.WEB_SEARCH_SKIPPED)
+    assert len(web_calls) == (1 if expected else 0)
+
+@pytest.mark.asyncio
+async def test_async_gather_context_speculative_cancels_unneeded_web_search(monkeypatch):
+    """Test speculative mode starts web search early but cancels it once local retrieval is confident."""
+    import asyncio
+    rag, _ = _gated_search(monkeypatch, [0.9], policy="speculative")
+    cancelled = asyncio.Event()
+
+    async def slow_web_search(query):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(rag, "async_web_search", slow_web_search)
+    assert await asyncio.wait_for(rag.async_gather_context("Explain NETCONF"), 1) == ("NETCONF docs", rag.WEB_SEARCH_SKIPPED)
+    await asyncio.wait_for(cancelled.wait(), 1)
+
+def test_retrieve_chunks_reranks_quantized_candidates_exactly(monkeypatch):
+    """Test a quantized index's shortlist is widened by the re-rank factor and re-ordered by exact vectors."""
+    import numpy as np
+    import hybrid_rag_gpt
+
+    class QuantizedIndex:
+        requested = None
+
+        def search(self, matrix, k):
+            QuantizedIndex.requested = k
+            # Lossy codes rank the true nearest neighbour last
+            ids = np.array([[2, 1, 0, -1][:k] + [-1] * max(0, k - 4)], dtype="int64")
+            return np.zeros(ids.shape, dtype="float32"), ids
+
+    vectors = np.eye(3, 4, dtype="float32")
+    monkeypatch.setattr(hybrid_rag_gpt, "texts", ["a", "b", "c"])
+    monkeypatch.setattr(hybrid_rag_gpt, "faiss_index", QuantizedIndex())
+    monkeypatch.setattr(hybrid_rag_gpt, "bm25_index", None)
+    monkeypatch.setattr(hybrid_rag_gpt, "track_indexes", {})
+    monkeypatch.setattr(hybrid_rag_gpt, "exact_vectors", vectors)
+    monkeypatch.setattr(hybrid_rag_gpt, "rerank_factor", 3)
+    monkeypatch.setattr(hybrid_rag_gpt, "search_batcher", hybrid_rag_gpt.MicroBatcher(hybrid_rag_gpt._search_batch, 0))
+
+    results = hybrid_rag_gpt.retrieve_chunks("query", k=1, query_embedding=vectors[:1])
+    assert QuantizedIndex.requested == 3
+    assert [chunk_id for chunk_id, _ in results] == [0]
+    assert np.allclose(hybrid_rag_gpt.chunk_vectors([2, 0]), vectors[[2, 0]])
+
+def test_load_exact_vectors_only_for_quantized_indexes(tmp_path, monkeypatch):
+    """Test exact vectors are memory-mapped for quantized indexes and ignored otherwise."""
+    import json
+    import numpy as np
+    import hybrid_rag_gpt
+
+    np.arange(12, dtype="float32").tofile(tmp_path / "vectors.f32")
+    config_path = tmp_path / "index_config.json"
+    monkeypatch.delenv("RERANK_FACTOR", raising=False)
+    config_path.write_text(json.dumps({"index_type": "sq8", "dimension": 4, "rerank_factor": 4}))
+    vectors, factor = hybrid_rag_gpt.load_exact_vectors(str(tmp_path), 3, config_path=str(config_path))
+    assert vectors.shape == (3, 4) and factor == 4
+    assert hybrid_rag_gpt.load_exact_vectors(str(tmp_path), 5, config_path=str(config_path)) == (None, 0)
+    config_path.write_text(json.dumps({"index_type": "hnsw", "dimension": 4, "rerank_factor": 4}))
+    assert hybrid_rag_gpt.load_exact_vectors(str(tmp_path), 3, config_path=str(config_path)) == (None, 0)
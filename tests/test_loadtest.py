@@ -0,0 +1,49 @@
+"""
+Tests for the load-test harness and its local Gemini/Serper stand-ins.
+"""
+import httpx
+
+import loadtest
+
+def test_make_messages_is_seeded_and_mixed():
+    """Test the message mix is reproducible and honours the casual fraction."""
+    messages = loadtest.make_messages(200, casual_fraction=0.3, seed=7)
+    assert messages == loadtest.make_messages(200, casual_fraction=0.3, seed=7)
+    casual = sum(message in loadtest.CASUAL_MESSAGES for message in messages)
+    assert 30 < casual < 90
+
+def test_summarize_groups_by_answer_path():
+    """Test percentiles, throughput and error rate are reported overall and per path."""
+    results = [{"path": "rag", "latency": 0.1 * i, "error": False} for i in range(1, 11)]
+    results += [{"path": "fallback", "latency": 0.05, "error": True}, {"path": "fallback", "latency": 0.05, "error": False}]
+    summary = loadtest.summarize(results, elapsed=2.0)
+    assert summary["overall"]["requests"] == 12
+    assert summary["overall"]["throughput_rps"] == 6.0
+    assert summary["paths"]["fallback"]["error_rate"] == 0.5
+    assert summary["paths"]["rag"]["p50_ms"] == 550.0
+    assert summary["paths"]["rag"]["p99_ms"] >= summary["paths"]["rag"]["p95_ms"] >= summary["paths"]["rag"]["p50_ms"]
+
+def test_mock_upstreams_inject_errors():
+    """Test the stand-ins answer in the upstream formats and fail at the configured status."""
+    gemini = loadtest.LatencyProfile(1, error_rate=1.0, error_status=500, seed=0)
+    serper = loadtest.LatencyProfile(1, seed=0)
+    with loadtest.BackgroundServer(loadtest.create_mock_app(gemini, serper)) as mocks:
+        failed = httpx.post(f"{mocks.url}/v1beta/models/gemini-2.0-flash:generateContent", json={})
+        search = httpx.post(f"{mocks.url}/search", json={"q": "NETCONF"})
+    assert failed.status_code == 500
+    assert search.status_code == 200 and search.json()["organic"]
+
+def test_run_load_test_reports_answer_paths():
+    """Test a short offline run serves every request and restores the pipeline afterwards."""
+    import hybrid_rag_gpt
+    transport = hybrid_rag_gpt.gemini_transport
+    summary = loadtest.run_load_test(
+        rate=4, duration=2, casual_fraction=0.5,
+        gemini=loadtest.LatencyProfile(5, seed=0), serper=loadtest.LatencyProfile(5, seed=1),
+        synthetic_docs=20, model_name="hashing-384"
+    )
+    assert summary["overall"]["requests"] > 0
+    assert summary["overall"]["error_rate"] == 0
+    assert set(summary["paths"]) <= {"casual", "rag", "cache", "fallback"}
+    assert summary["upstream"]["gemini_calls"] > 0
+    assert hybrid_rag_gpt.gemini_transport == transport
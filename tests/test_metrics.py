@@ -0,0 +1,56 @@
+"""
+Tests for the in-process Prometheus metrics.
+"""
+import pytest
+from metrics import Counter, Gauge, Histogram, Registry
+
+def test_histogram_renders_cumulative_buckets():
+    """Test observations land in cumulative le-buckets with matching sum and count."""
+    registry = Registry()
+    histogram = Histogram("stage_seconds", "Stage latency", ["stage"], buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.5, 2.0):
+        histogram.observe(value, stage="embed")
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP stage_seconds Stage latency", "# TYPE stage_seconds histogram"]
+    assert 'stage_seconds_bucket{stage="embed",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="embed",le="1.0"} 2' in lines
+    assert 'stage_seconds_bucket{stage="embed",le="+Inf"} 3' in lines
+    assert 'stage_seconds_sum{stage="embed"} 2.55' in lines
+    assert 'stage_seconds_count{stage="embed"} 3' in lines
+
+def test_histogram_time_as_context_manager_and_decorator():
+    """Test time() records one observation per block or decorated call, including on errors."""
+    histogram = Histogram("work_seconds", "Work", ["stage"], registry=Registry())
+
+    @histogram.time(stage="decorated")
+    def work():
+        return 42
+
+    assert work() == 42 and work() == 42
+    with pytest.raises(RuntimeError):
+        with histogram.time(stage="block"):
+            raise RuntimeError("boom")
+    assert histogram.count(stage="decorated") == 2
+    assert histogram.count(stage="block") == 1
+
+def test_counter_and_gauge_validate_labels():
+    """Test counters only increase, labels must match and unlabeled gauges render a default."""
+    registry = Registry()
+    counter = Counter("requests_total", "Requests", ["path"], registry=registry)
+    gauge = Gauge("in_flight", "In flight", registry=registry)
+    counter.inc(path='rag "docs"')
+    with pytest.raises(ValueError):
+        counter.inc(-1, path="rag")
+    with pytest.raises(ValueError):
+        counter.inc(route="rag")
+    with pytest.raises(ValueError):
+        Counter("requests_total", "Duplicate", registry=registry)
+
+    rendered = registry.render()
+    assert 'requests_total{path="rag \\"docs\\""} 1' in rendered
+    assert "in_flight 0" in rendered
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert gauge.value() == 1
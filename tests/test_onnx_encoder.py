@@ -0,0 +1,92 @@
+"""
+Tests for the torch-free ONNX Runtime query encoder.
+"""
+import os
+import subprocess
+import sys
+import types
+
+import numpy as np
+import pytest
+
+import onnx_encoder
+
+def test_pool_matches_sentence_transformers_modes():
+    """Test mean pooling ignores padding, CLS pooling takes the first token and normalize gives unit rows."""
+    tokens = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]], dtype="float32")
+    mask = np.array([[1, 1, 0]])
+    assert np.allclose(onnx_encoder.pool(tokens, mask), [[2.0, 3.0]])
+    assert np.allclose(onnx_encoder.pool(tokens, mask, mode="cls"), [[1.0, 2.0]])
+    assert np.allclose(np.linalg.norm(onnx_encoder.pool(tokens, mask, normalize=True), axis=1), 1.0)
+
+def test_serving_imports_skip_torch():
+    """Test the app imports with the requirements-ingest.txt packages unavailable, as in the serving image."""
+    code = ("import sys; sys.modules.update(dict.fromkeys(('torch', 'sentence_transformers', 'transformers', 'onnx')));"
+            "import fastapi_only")
+    env = dict(os.environ, GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY") or "test")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True).returncode == 0
+
+def test_load_embedding_model_fails_loudly_without_export(tmp_path, monkeypatch):
+    """Test the onnx backend raises instead of falling back to a package the serving image lacks."""
+    import hybrid_rag_gpt
+    monkeypatch.setitem(sys.modules, "sentence_transformers", None)
+    monkeypatch.setenv("ONNX_MODEL_DIR", str(tmp_path))
+    with pytest.raises(RuntimeError, match="onnx_encoder.py"):
+        hybrid_rag_gpt.load_embedding_model("mini", backend="onnx")
+    with pytest.raises(RuntimeError, match="requirements-ingest.txt"):
+        hybrid_rag_gpt.load_embedding_model("mini", backend="sentence-transformers")
+
+def test_load_vector_store_stays_unready_on_encoder_drift(monkeypatch):
+    """Test an ONNX export that disagrees with the index keeps the store unloaded instead of serving bad matches."""
+    import faiss
+    import hybrid_rag_gpt
+    from benchmark import HashingEncoder
+
+    encoder = HashingEncoder()
+    encoder.backend = "onnx"
+    monkeypatch.setattr(hybrid_rag_gpt, "embedding_model", encoder)
+    monkeypatch.setattr(hybrid_rag_gpt, "faiss_index", None)
+    monkeypatch.setattr(hybrid_rag_gpt, "read_faiss_index", lambda path: faiss.IndexFlatL2(encoder.dim))
+    monkeypatch.setattr(hybrid_rag_gpt, "load_chunk_texts", lambda index_dir: ["NETCONF"])
+    monkeypatch.setattr(hybrid_rag_gpt, "load_lexical_index", lambda index_dir, count: None)
+    monkeypatch.setattr(hybrid_rag_gpt, "load_track_indexes", lambda index_dir, count: ({}, None))
+    monkeypatch.setattr(hybrid_rag_gpt, "load_exact_vectors", lambda index_dir, count: (None, 0))
+    monkeypatch.setattr(hybrid_rag_gpt, "load_search_parameters", lambda: {})
+    monkeypatch.setattr(hybrid_rag_gpt, "encoder_agreement", lambda: 0.5)
+    assert hybrid_rag_gpt.load_vector_store() is False
+    assert hybrid_rag_gpt.faiss_index is None
+
+def test_encoder_agreement_detects_drift(monkeypatch):
+    """Test re-encoded chunks are compared with their stored index vectors."""
+    import faiss
+    import hybrid_rag_gpt
+    from benchmark import HashingEncoder
+
+    texts = ["NETCONF uses YANG models", "", "Terraform plans for ACI", "pyATS test automation"]
+    encoder = HashingEncoder()
+    index = faiss.IndexFlatL2(encoder.dim)
+    index.add(encoder.encode([text or "-" for text in texts]))
+    monkeypatch.setattr(hybrid_rag_gpt, "texts", texts)
+    monkeypatch.setattr(hybrid_rag_gpt, "faiss_index", index)
+    monkeypatch.setattr(hybrid_rag_gpt, "exact_vectors", None)
+    monkeypatch.setattr(hybrid_rag_gpt, "embedding_model", encoder)
+    assert hybrid_rag_gpt.encoder_agreement(config_path="missing.json") == pytest.approx(1.0)
+
+    class Drifted(HashingEncoder):
+        def encode(self, sentences, show_progress_bar=False):
+            return super().encode([sentence[::-1] for sentence in sentences])
+
+    monkeypatch.setattr(hybrid_rag_gpt, "embedding_model", Drifted())
+    assert hybrid_rag_gpt.encoder_agreement(config_path="missing.json") < 0.98
+
+def test_export_matches_sentence_transformers(tmp_path):
+    """Test the int8 export reproduces the original embeddings within tolerance."""
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    texts = ["What is on the CCNA Automation exam?", "Configure NETCONF with YANG on IOS XE", "hi"]
+    report = onnx_encoder.export_onnx("paraphrase-MiniLM-L3-v2", str(tmp_path), texts=texts)
+    assert report["min_cosine"] >= onnx_encoder.DEFAULT_MIN_COSINE
+    encoder = onnx_encoder.OnnxEncoder(str(tmp_path))
+    assert encoder.encode("hi").shape == (encoder.config["dimension"],)
+    assert encoder.encode(texts).shape == (3, encoder.config["dimension"])
@@ -0,0 +1,202 @@
+"""
+Tests for the pooled, deadline-bounded Serper client and its result cache.
+"""
+import time
+import pytest
+import httpx
+import responses
+from serper_client import (
+    SerperClient,
+    SerperError,
+    SerperResultCache,
+    extract_snippets,
+    normalize_query,
+    SERPER_URL
+)
+
+ORGANIC = {"organic": [{"snippet": "First"}, {"snippet": "Second"}, {"snippet": "Third"}]}
+
+@pytest.fixture
+def result_cache(tmp_path):
+    """Create a Serper result cache in a temporary directory."""
+    return SerperResultCache(str(tmp_path / "serper.sqlite3"), ttl_seconds=60)
+
+def test_normalize_query():
+    """Test cache keys ignore case and extra whitespace."""
+    assert normalize_query("  What is   NETCONF? ") == "what is netconf?"
+
+def test_extract_snippets():
+    """Test only the top two organic snippets are kept."""
+    assert extract_snippets(ORGANIC) == "First\nSecond"
+    assert extract_snippets({}) == "No internet results found."
+
+def test_result_cache_ttl(result_cache, monkeypatch):
+    """Test cached snippets expire after the TTL."""
+    result_cache.put("NETCONF", "cached snippet")
+    assert result_cache.get("  netconf ") == "cached snippet"
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert result_cache.get("NETCONF") is None
+
+@responses.activate
+def test_search_uses_cache(result_cache):
+    """Test repeat queries are answered from the cache without a network call."""
+    responses.add(responses.POST, SERPER_URL, json=ORGANIC)
+    client = SerperClient(cache=result_cache)
+    assert client.search("What is NETCONF?", "key") == "First\nSecond"
+    assert client.search("what is  netconf?", "key") == "First\nSecond"
+    assert len(responses.calls) == 1
+    assert client.stats()["cache_hits"] == 1
+
+@responses.activate
+def test_search_raises_on_http_error():
+    """Test HTTP errors surface as SerperError."""
+    responses.add(responses.POST, SERPER_URL, status=500)
+    client = SerperClient()
+    with pytest.raises(SerperError):
+        client.search("NETCONF", "key")
+
+def test_search_enforces_deadline(monkeypatch):
+    """Test a stuck upstream cannot hold the caller past the deadline."""
+    client = SerperClient(deadline=0.2)
+
+    def stuck_fetch(query, api_key):
+        time.sleep(1.0)
+        return "too late"
+
+    monkeypatch.setattr(client, "_fetch", stuck_fetch)
+    started = time.monotonic()
+    with pytest.raises(SerperError):
+        client.search("NETCONF", "key")
+    assert time.monotonic() - started < 0.5
+    assert client.stats()["timeouts"] == 1
+
+def test_search_hedges_slow_request(monkeypatch):
+    """Test a hedged request answers when the first one is slow."""
+    client = SerperClient(deadline=2.0, hedge_delay=0.05)
+    calls = []
+
+    def fetch(query, api_key):
+        calls.append(query)
+        if len(calls) == 1:
+            time.sleep(1.0)
+            return "slow"
+        return "fast"
+
+    monkeypatch.setattr(client, "_fetch", fetch)
+    assert client.search("NETCONF", "key") == "fast"
+    assert client.stats()["hedges"] == 1
+
+@pytest.mark.asyncio
+async def test_asearch_with_mock_transport(result_cache, monkeypatch):
+    """Test the async search path parses results and fills the cache."""
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(request)
+        return httpx.Response(200, json=ORGANIC)
+
+    client = SerperClient(cache=result_cache)
+    monkeypatch.setattr(client, "_get_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    assert await client.asearch("NETCONF", "key") == "First\nSecond"
+    assert await client.asearch("netconf", "key") == "First\nSecond"
+    assert len(requests_seen) == 1
+    assert requests_seen[0].headers["X-API-KEY"] == "key"
+
+@pytest.mark.asyncio
+async def test_asearch_enforces_deadline(monkeypatch):
+    """Test the async path gives up at the deadline."""
+    import asyncio
+    client = SerperClient(deadline=0.1)
+
+    async def stuck_afetch(query, api_key):
+        await asyncio.sleep(1.0)
+
+    monkeypatch.setattr(client, "_afetch", stuck_afetch)
+    with pytest.raises(SerperError):
+        await client.asearch("NETCONF", "key")
+
+def test_result_cache_prunes_periodically(result_cache, monkeypatch):
+    """Test expired rows are pruned at most once per interval, using the created_at index."""
+    import sqlite3
+    now = time.time()
+    result_cache.put("old", "stale snippet")
+    pruned = []
+    monkeypatch.setattr(result_cache, "prune", lambda now=None: pruned.append(now))
+    for offset in (1, 2, 3):
+        monkeypatch.setattr(time, "time", lambda offset=offset: now + offset)
+        result_cache.put(f"query {offset}", "snippet")
+    assert pruned == []
+    monkeypatch.setattr(time, "time", lambda: now + result_cache.prune_interval + 1)
+    result_cache.put("later", "snippet")
+    assert len(pruned) == 1
+    monkeypatch.undo()
+    assert result_cache.prune(now + 120) == 4
+    with sqlite3.connect(result_cache.path) as conn:
+        plan = conn.execute("EXPLAIN QUERY PLAN DELETE FROM serper_cache WHERE created_at < 0").fetchall()
+    assert "serper_cache_created_at" in str(plan)
+
+@pytest.mark.asyncio
+async def test_asearch_reads_cache_off_event_loop(result_cache, monkeypatch):
+    """Test the async path does its SQLite cache I/O on worker threads."""
+    import threading
+    threads = []
+    original_get, original_put = result_cache.get, result_cache.put
+
+    def get(query):
+        threads.append(threading.current_thread())
+        return original_get(query)
+
+    def put(query, snippets):
+        threads.append(threading.current_thread())
+        original_put(query, snippets)
+
+    monkeypatch.setattr(result_cache, "get", get)
+    monkeypatch.setattr(result_cache, "put", put)
+    client = SerperClient(cache=result_cache)
+    monkeypatch.setattr(client, "_get_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, json=ORGANIC)
+    )))
+    assert await client.asearch("NETCONF", "key") == "First\nSecond"
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+def test_async_client_closed_explicitly_and_rebuilt_per_event_loop():
+    """Test aclose() releases the pooled client and a new event loop gets its own client."""
+    import asyncio
+    client = SerperClient()
+
+    async def use_and_close():
+        pooled = client._get_async_client()
+        assert client._get_async_client() is pooled
+        await client.aclose()
+        return pooled
+
+    first = asyncio.run(use_and_close())
+    second = asyncio.run(use_and_close())
+    assert first is not second
+    assert first.is_closed and second.is_closed
+
+def test_async_client_of_a_running_loop_closed_on_loop_change():
+    """Test switching loops closes the previous client on its own, still running, loop."""
+    import asyncio
+    import threading
+    background = asyncio.new_event_loop()
+    thread = threading.Thread(target=background.run_forever, daemon=True)
+    thread.start()
+    client = SerperClient()
+
+    async def get_client():
+        return client._get_async_client()
+
+    try:
+        first = asyncio.run_coroutine_threadsafe(get_client(), background).result(timeout=5)
+        second = asyncio.run(get_client())
+        deadline = time.monotonic() + 5
+        while not first.is_closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert first.is_closed and second is not first
+    finally:
+        background.call_soon_threadsafe(background.stop)
+        thread.join(timeout=5)
+        background.close()
@@ -0,0 +1,104 @@
+"""
+Tests for span tracing and JSONL export.
+"""
+import concurrent.futures
+import json
+import pytest
+import tracing
+
+@pytest.fixture
+def span_file(tmp_path, monkeypatch):
+    """Export spans to a temporary JSONL file and return a reader for it."""
+    path = tmp_path / "spans.jsonl"
+    exporter = tracing.JsonlSpanExporter(str(path))
+    monkeypatch.setattr(tracing, "exporter", exporter)
+
+    def read():
+        exporter.flush()
+        return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+    yield read
+    exporter.close()
+
+def test_spans_nest_and_export_otlp_shape(span_file):
+    """Test child spans share the trace ID, point at their parent and carry OTLP fields."""
+    with tracing.span("chat", stream=False) as root:
+        with tracing.span("retrieve_answer", k=5):
+            pass
+    assert tracing.current_span() is None
+
+    child, parent = span_file()
+    assert parent["name"] == "chat" and parent["parentSpanId"] == ""
+    assert child["traceId"] == parent["traceId"] == root.trace_id
+    assert child["parentSpanId"] == parent["spanId"]
+    assert len(parent["traceId"]) == 32 and len(parent["spanId"]) == 16
+    assert int(child["endTimeUnixNano"]) >= int(child["startTimeUnixNano"])
+    assert child["attributes"] == [{"key": "k", "value": {"intValue": "5"}}]
+    assert parent["attributes"] == [{"key": "stream", "value": {"boolValue": False}}]
+    assert parent["resource"]["attributes"][0]["key"] == "service.name"
+
+def test_span_records_errors_and_works_as_decorator(span_file):
+    """Test exceptions mark the span as an error and decorated functions get a span per call."""
+    @tracing.span("web_search")
+    def failing_search():
+        raise RuntimeError("deadline exceeded")
+
+    with pytest.raises(RuntimeError):
+        failing_search()
+    (exported,) = span_file()
+    assert exported["name"] == "web_search"
+    assert exported["status"] == {"code": tracing.STATUS_ERROR, "message": "RuntimeError: deadline exceeded"}
+
+def test_bind_carries_span_into_executor_threads(span_file):
+    """Test work fanned out to a thread pool is parented to the submitting span."""
+    with tracing.span("gather_context") as parent:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(tracing.bind(tracing.current_trace_id)) for _ in range(2)]
+            unbound = executor.submit(tracing.current_trace_id)
+        assert [future.result() for future in futures] == [parent.trace_id] * 2
+        assert unbound.result() is None
+
+def test_exporter_rotates_and_can_be_disabled(tmp_path):
+    """Test the JSONL file rotates at max_bytes and an empty path exports nothing."""
+    path = tmp_path / "spans.jsonl"
+    exporter = tracing.JsonlSpanExporter(str(path), max_bytes=2000, backup_count=2)
+    for _ in range(20):
+        exporter.export(tracing.Span("embed_query", tracing.new_trace_id()))
+    exporter.close()
+    assert (tmp_path / "spans.jsonl.1").exists()
+    assert not (tmp_path / "spans.jsonl.3").exists()
+    assert path.stat().st_size <= 2000
+
+    disabled = tracing.JsonlSpanExporter("")
+    disabled.export(tracing.Span("embed_query", tracing.new_trace_id()))
+    assert not disabled.enabled and disabled.exported == 0
+
+def test_parse_traceparent():
+    """Test W3C traceparent headers are accepted and malformed or all-zero IDs rejected."""
+    trace_id, span_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    assert tracing.parse_traceparent(f"00-{trace_id}-{span_id}-01") == (trace_id, span_id)
+    assert tracing.parse_traceparent(f"00-{'0' * 32}-{span_id}-01") == (None, None)
+    assert tracing.parse_traceparent("garbage") == (None, None)
+    assert tracing.parse_traceparent(None) == (None, None)
+
+def test_export_is_off_by_default(monkeypatch):
+    """Test spans are only written when TRACE_EXPORT_PATH opts in."""
+    import importlib
+    monkeypatch.delenv("TRACE_EXPORT_PATH", raising=False)
+    try:
+        assert not importlib.reload(tracing).exporter.enabled
+    finally:
+        importlib.reload(tracing)
+
+def test_exporter_writes_on_a_background_thread(tmp_path, monkeypatch):
+    """Test export only queues the span; the file write happens on the listener thread."""
+    import threading
+    from logging.handlers import RotatingFileHandler
+    writers = []
+    emit = RotatingFileHandler.emit
+    monkeypatch.setattr(RotatingFileHandler, "emit",
+                        lambda self, record: writers.append(threading.current_thread()) or emit(self, record))
+    exporter = tracing.JsonlSpanExporter(str(tmp_path / "spans.jsonl"))
+    exporter.export(tracing.Span("embed_query", tracing.new_trace_id()))
+    exporter.close()
+    assert len(writers) == 1 and writers[0] is not threading.current_thread()
+    assert json.loads((tmp_path / "spans.jsonl").read_text())["name"] == "embed_query"
@@ -1,15 +1,30 @@
 """
 Tests for document processing and vectorization functionality.
 """
+import asyncio
+import http.server
 import os
+import threading
 import pytest
 from vectorize import (
     clean_html,
     load_text_from_pdfs,
     load_text_from_urls,
-    build_vector_store
+    read_urls,
+    fetch_urls,
+    fetch_url_texts,
+    url_sources,
+    build_vector_store,
+    create_index,
+    set_search_parameters,
+    evaluate_index
 )
 
+def _live_chunks(store):
+    """Non-empty chunk texts from the store update_vector_store returns, closing it"""
+    with store:
+        return [text for text in store if text]
+
 def test_clean_html():
     """Test HTML cleaning functionality."""
     html_content = """
@@ -33,7 +48,8 @@ def test_build_vector_store_chunking():
     """Test text chunking functionality within build_vector_store."""
     text = ["This is a test " * 100]  # Create a long text
     try:
-        index, chunks = build_vector_store(text, chunk_size=500, chunk_overlap=50)
+        index, store = build_vector_store(text, chunk_size=500, chunk_overlap=50)
+        chunks = _live_chunks(store)
         assert len(chunks) > 1
         assert all(len(chunk) <= 500 for chunk in chunks)  # Max chunk size
         assert all(len(chunk) > 0 for chunk in chunks)  # No empty chunks
@@ -82,7 +98,8 @@ def test_build_vector_store(tmp_path, sample_pdf_content):
     documents = [sample_pdf_content * 3]  # Make it long enough to create chunks
     
     try:
-        index, chunks = build_vector_store(documents)
+        index, store = build_vector_store(documents)
+        chunks = _live_chunks(store)
         assert len(chunks) > 0
         assert all(len(chunk) > 20 for chunk in chunks)  # Verify chunk size threshold
     except IndexError:
@@ -107,8 +124,520 @@ def test_error_handling_invalid_url():
 def test_build_vector_store_various_inputs(text, min_chunks):
     """Test text chunking with various input sizes."""
     try:
-        index, chunks = build_vector_store(text)
+        index, store = build_vector_store(text)
+        chunks = _live_chunks(store)
         assert len(chunks) >= min_chunks
     except IndexError:
         # It's OK if empty/short texts result in no chunks
-        assert min_chunks == 0
\ No newline at end of file
+        assert min_chunks == 0
+
+@pytest.fixture
+def random_embeddings():
+    """Random float32 embeddings large enough to train IVF/PQ indexes."""
+    import numpy as np
+    return np.random.default_rng(0).standard_normal((300, 16)).astype("float32")
+
+@pytest.mark.parametrize("index_type,expected_class", [
+    ("flat", "IndexFlat"),
+    ("hnsw", "IndexHNSWFlat"),
+    ("ivf_flat", "IndexIVFFlat"),
+    ("ivf_pq", "IndexIVFPQ"),
+    ("sq8", "IndexScalarQuantizer"),
+    ("pq", "IndexPQ"),
+])
+def test_create_index_types(random_embeddings, index_type, expected_class):
+    """Test the index factory builds and trains every supported index type."""
+    index = create_index(random_embeddings, index_type)
+    assert type(index).__name__ == expected_class
+    assert index.ntotal == len(random_embeddings)
+
+def test_create_index_rejects_unknown_type(random_embeddings):
+    """Test unknown index types fail loudly."""
+    with pytest.raises(ValueError):
+        create_index(random_embeddings, "lsh")
+
+def test_set_search_parameters(random_embeddings):
+    """Test efSearch and nprobe are applied only where they make sense."""
+    hnsw = create_index(random_embeddings, "hnsw")
+    ivf = create_index(random_embeddings, "ivf_flat")
+    flat = create_index(random_embeddings, "flat")
+    for index in (hnsw, ivf, flat):
+        set_search_parameters(index, ef_search=77, nprobe=5)
+    assert hnsw.hnsw.efSearch == 77
+    assert ivf.nprobe == 5
+
+def test_evaluate_index_exact_recall(random_embeddings):
+    """Test the recall report is perfect for the exact flat index."""
+    report = evaluate_index(create_index(random_embeddings, "flat"), random_embeddings, k=5, n_queries=20)
+    assert report["recall_at_k"] == 1.0
+    assert report["latency_ms"] >= 0
+
+def test_evaluate_index_reports_footprint_and_reranked_recall(random_embeddings):
+    """Test quantized indexes report their size per vector and recover recall after exact re-ranking."""
+    flat = evaluate_index(create_index(random_embeddings, "flat"), random_embeddings, k=5, n_queries=20)
+    pq = evaluate_index(create_index(random_embeddings, "pq"), random_embeddings, k=5, n_queries=20, rerank_factor=8)
+    assert flat["bytes_per_vector"] >= 16 * 4
+    assert pq["compression"] > flat["compression"]
+    assert pq["reranked_recall_at_k"] > pq["recall_at_k"]
+    assert "reranked_recall_at_k" not in flat
+
+def test_rerank_exact_orders_by_exact_distance():
+    """Test candidates are re-ordered by exact distance and padding IDs are dropped."""
+    import numpy as np
+    from vectorize import rerank_exact
+    vectors = np.array([[0, 0], [3, 0], [1, 0], [2, 0]], dtype="float32")
+    assert rerank_exact([0, 0], [1, -1, 3, 2, 0], vectors, 3).tolist() == [0, 2, 3]
+
+class _FakeSentenceTransformer:
+    """Deterministic stand-in for SentenceTransformer that records what it encodes."""
+    encoded = []
+
+    def __init__(self, model_name=None, **kwargs):
+        pass
+
+    def encode(self, sentences, show_progress_bar=False):
+        import numpy as np
+        _FakeSentenceTransformer.encoded.extend(sentences)
+        vectors = []
+        for sentence in sentences:
+            rng = np.random.default_rng(abs(hash(sentence)) % (2 ** 32))
+            vectors.append(rng.standard_normal(8))
+        return np.array(vectors, dtype="float32").reshape(len(sentences), 8)
+
+@pytest.fixture
+def fake_encoder(monkeypatch):
+    """Replace the embedding model in vectorize.py with a fast deterministic fake."""
+    import vectorize
+    _FakeSentenceTransformer.encoded = []
+    monkeypatch.setattr(vectorize, "load_sentence_transformer", _FakeSentenceTransformer)
+    return _FakeSentenceTransformer
+
+def _sources(documents):
+    from functools import partial
+    from vectorize import content_hash
+    return [(name, content_hash(text), partial(str, text)) for name, text in documents.items()]
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_update_vector_store_incremental(tmp_path, fake_encoder, index_type):
+    """Test a rebuild only re-embeds changed sources and drops deleted ones."""
+    from chunk_store import ChunkStore
+    from vectorize import update_vector_store, load_manifest
+
+    index_dir = str(tmp_path / "index")
+    documents = {
+        "a.pdf": "NETCONF uses YANG data models for configuration. " * 30,
+        "b.pdf": "RESTCONF exposes YANG over HTTP with JSON or XML. " * 30,
+        "https://example.com": "pyATS is a Python test automation framework. " * 30,
+    }
+    index, store = update_vector_store(_sources(documents), chunk_size=200, chunk_overlap=20,
+                                       index_type=index_type, index_dir=index_dir)
+    chunks = _live_chunks(store)
+    first_pass = len(fake_encoder.encoded)
+    assert index.ntotal == len(chunks) == first_pass
+
+    # Change one source, delete another
+    documents["b.pdf"] = "RESTCONF was updated for the 2026 blueprint. " * 30
+    del documents["https://example.com"]
+    fake_encoder.encoded = []
+    index, store = update_vector_store(_sources(documents), chunk_size=200, chunk_overlap=20,
+                                       index_type=index_type, index_dir=index_dir)
+    chunks = _live_chunks(store)
+    assert fake_encoder.encoded
+    assert all("RESTCONF was updated" in chunk for chunk in fake_encoder.encoded)
+
+    manifest = load_manifest(index_dir)
+    assert set(manifest["sources"]) == {"a.pdf", "b.pdf"}
+    live_ids = [i for entry in manifest["sources"].values() for i in entry["chunk_ids"]]
+    assert index.ntotal == len(live_ids) == len(chunks)
+
+    # Search results map straight to chunk store positions
+    store = ChunkStore(index_dir)
+    query = fake_encoder().encode([store[manifest["sources"]["b.pdf"]["chunk_ids"][0]]])
+    _, ids = index.search(query, 1)
+    assert "RESTCONF was updated" in store[int(ids[0][0])]
+
+    # The BM25 index is rebuilt over the same chunk IDs
+    from bm25_index import BM25Index
+    lexical = BM25Index.load(index_dir)
+    assert lexical.num_docs == len(store)
+    assert "RESTCONF was updated" in store[lexical.search("2026 blueprint", 1)[0][0]]
+
+    # Nothing changed: nothing re-embedded
+    fake_encoder.encoded = []
+    _, unchanged = update_vector_store(_sources(documents), chunk_size=200, chunk_overlap=20,
+                                       index_type=index_type, index_dir=index_dir)
+    assert fake_encoder.encoded == []
+    assert _live_chunks(unchanged) == chunks
+    store.close()
+
+def test_update_vector_store_settings_change_rebuilds(tmp_path, fake_encoder):
+    """Test changing chunking settings forces a full rebuild."""
+    from vectorize import update_vector_store
+
+    index_dir = str(tmp_path / "index")
+    documents = {"a.pdf": "NETCONF uses YANG data models for configuration. " * 30}
+    update_vector_store(_sources(documents), chunk_size=200, chunk_overlap=20, index_dir=index_dir)
+    fake_encoder.encoded = []
+    update_vector_store(_sources(documents), chunk_size=300, chunk_overlap=20, index_dir=index_dir)
+    assert fake_encoder.encoded
+
+def test_update_vector_store_keeps_unavailable_sources(tmp_path, fake_encoder):
+    """Test a source that failed to load keeps its previous chunks."""
+    from vectorize import update_vector_store, load_manifest
+
+    index_dir = str(tmp_path / "index")
+    documents = {"https://example.com": "pyATS is a Python test automation framework. " * 30}
+    _, store = update_vector_store(_sources(documents), chunk_size=200, chunk_overlap=20, index_dir=index_dir)
+    chunks = _live_chunks(store)
+    _, store = update_vector_store([("https://example.com", None, None)], chunk_size=200, chunk_overlap=20, index_dir=index_dir)
+    assert _live_chunks(store) == chunks
+    assert "https://example.com" in load_manifest(index_dir)["sources"]
+
+class _CountingPage:
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+
+    def extract_text(self):
+        self.calls += 1
+        return self.text
+
+def test_extract_pdf_pages_once_per_page_and_cached(tmp_path, sample_pdf_file, monkeypatch):
+    """Test each page is extracted once and repeat extractions come from the page cache."""
+    import vectorize
+
+    pages = [_CountingPage("1.0 Software Development and Design"), _CountingPage(""), _CountingPage("2.0 Understanding and Using APIs")]
+
+    class FakeReader:
+        def __init__(self, path):
+            self.pages = pages
+
+    monkeypatch.setattr(vectorize, "PdfReader", FakeReader)
+    cache_dir = str(tmp_path / "cache")
+    result = vectorize.extract_pdf_pages(str(sample_pdf_file), cache_dir=cache_dir)
+    assert result == [(1, "1.0 Software Development and Design"), (3, "2.0 Understanding and Using APIs")]
+    assert [page.calls for page in pages] == [1, 1, 1]
+
+    class FailingReader:
+        def __init__(self, path):
+            raise AssertionError("cached PDF should not be parsed again")
+
+    monkeypatch.setattr(vectorize, "PdfReader", FailingReader)
+    assert vectorize.extract_pdf_pages(str(sample_pdf_file), cache_dir=cache_dir) == result
+
+def test_run_loaders_in_process_pool():
+    """Test loaders run across processes, keep their order and isolate failures."""
+    from functools import partial
+    from vectorize import run_loaders
+
+    loaders = [partial(str, "first"), partial(int, "not a number"), partial(str, "third")]
+    assert run_loaders(loaders, workers=2) == ["first", None, "third"]
+
+def test_update_vector_store_records_pdf_pages(tmp_path, fake_encoder):
+    """Test page numbers from PDF loaders are kept per chunk in the manifest."""
+    from functools import partial
+    from vectorize import update_vector_store, load_manifest
+
+    pages = [(1, "1.1 Describe the advantages of version control. " * 10), (4, "4.2 Describe NETCONF and RESTCONF. " * 10)]
+    index_dir = str(tmp_path / "index")
+    update_vector_store([("docs/blueprint.pdf", "hash", partial(list, pages))], chunk_size=200, chunk_overlap=20,
+                        index_dir=index_dir, workers=1)
+    entry = load_manifest(index_dir)["sources"]["docs/blueprint.pdf"]
+    assert len(entry["pages"]) == len(entry["chunk_ids"])
+    assert set(entry["pages"]) == {1, 4}
+
+class _ConditionalHandler(http.server.BaseHTTPRequestHandler):
+    """Serves /page with an ETag, fails /flaky once with 503 and 404s everything else"""
+    requests_seen = []
+    flaky_failures = 1
+
+    def do_GET(self):
+        type(self).requests_seen.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/flaky" and type(self).flaky_failures > 0:
+            type(self).flaky_failures -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.path not in ("/page", "/flaky"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f"<html><body><p>Content of {self.path}</p></body></html>".encode()
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def local_server():
+    _ConditionalHandler.requests_seen = []
+    _ConditionalHandler.flaky_failures = 1
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _ConditionalHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def test_read_urls_skips_comments_blanks_and_duplicates(tmp_path):
+    urls_file = tmp_path / "urls.txt"
+    urls_file.write_text(
+        "# Section header\n"
+        "\n"
+        "https://a.example/one\n"
+        "   # indented comment\n"
+        "https://a.example/two  # trailing note\n"
+        "https://a.example/one\n"
+    )
+    assert read_urls(str(urls_file)) == ["https://a.example/one", "https://a.example/two"]
+
+def test_fetch_urls_revalidates_with_etag(tmp_path, local_server):
+    urls_file = tmp_path / "urls.txt"
+    urls_file.write_text(f"# docs\n{local_server}/page\n{local_server}/missing\n")
+    cache_dir = str(tmp_path / "cache")
+
+    first = fetch_url_texts(str(urls_file), cache_dir=cache_dir)
+    assert first[0][1:] == ("Content of /page", "fetched")
+    assert first[1][1] is None and first[1][2].startswith("error")
+
+    second = fetch_url_texts(str(urls_file), cache_dir=cache_dir)
+    assert second[0][1:] == ("Content of /page", "not_modified")
+    assert ("/page", '"v1"') in _ConditionalHandler.requests_seen
+
+    # Unchanged pages keep their content hash, so incremental builds skip them
+    sources = list(url_sources(str(urls_file), cache_dir=cache_dir))
+    assert sources[0][1] is not None and sources[1][1:] == (None, None)
+
+    # Loaders carry only the cache path and read the page text when they run
+    import pickle
+    from vectorize import content_hash
+    load_text = sources[0][2]
+    assert b"Content of /page" not in pickle.dumps(load_text)
+    assert load_text() == "Content of /page" and sources[0][1] == content_hash("Content of /page")
+
+def test_fetch_urls_treats_unreadable_cache_as_miss(tmp_path, local_server):
+    """Test a corrupt cache entry is refetched instead of failing the URL."""
+    from vectorize import _url_cache_path
+    cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache_dir)
+    with open(_url_cache_path(cache_dir, f"{local_server}/page"), "w") as f:
+        f.write('{"etag": "\\"v1\\"", "te')
+    results = asyncio.run(fetch_urls([f"{local_server}/page"], cache_dir=cache_dir))
+    assert results == [(f"{local_server}/page", "Content of /page", "fetched")]
+    assert _ConditionalHandler.requests_seen == [("/page", None)]
+
+def test_fetch_urls_skips_a_failing_url(tmp_path, local_server, monkeypatch):
+    """Test an unexpected error on one URL is reported for it while the others still load."""
+    import vectorize
+    clean_html = vectorize.clean_html
+
+    def fragile_clean_html(html):
+        if "/flaky" in html:
+            raise RuntimeError("parser crashed")
+        return clean_html(html)
+
+    monkeypatch.setattr(vectorize, "clean_html", fragile_clean_html)
+    _ConditionalHandler.flaky_failures = 0
+    results = asyncio.run(fetch_urls([f"{local_server}/flaky", f"{local_server}/page"], cache_dir=str(tmp_path)))
+    assert results[0][:2] == (f"{local_server}/flaky", None) and "parser crashed" in results[0][2]
+    assert results[1] == (f"{local_server}/page", "Content of /page", "fetched")
+
+def test_fetch_urls_retries_transient_errors(tmp_path, local_server):
+    results = asyncio.run(fetch_urls([f"{local_server}/flaky"], cache_dir=str(tmp_path), retries=1))
+    assert results == [(f"{local_server}/flaky", "Content of /flaky", "fetched")]
+    assert [path for path, _ in _ConditionalHandler.requests_seen] == ["/flaky", "/flaky"]
+
+def test_update_vector_store_embeds_in_batches(tmp_path, fake_encoder, monkeypatch):
+    """Test chunks are embedded in fixed-size batches rather than one corpus-wide call."""
+    from vectorize import update_vector_store
+
+    batch_sizes = []
+    encode = _FakeSentenceTransformer.encode
+    monkeypatch.setattr(_FakeSentenceTransformer, "encode",
+                        lambda self, sentences, **kwargs: batch_sizes.append(len(sentences)) or encode(self, sentences))
+    documents = {"a.pdf": "NETCONF uses YANG data models for configuration. " * 60}
+    index, store = update_vector_store(_sources(documents), chunk_size=200, chunk_overlap=20,
+                                       index_dir=str(tmp_path / "index"), batch_size=4)
+    chunks = _live_chunks(store)
+    assert max(batch_sizes) == 4
+    assert sum(batch_sizes) == index.ntotal == len(chunks)
+
+def test_update_vector_store_resumes_after_interruption(tmp_path, fake_encoder, monkeypatch):
+    """Test an interrupted build resumes from its checkpoint without re-embedding finished sources."""
+    from vectorize import update_vector_store, load_manifest, BUILD_DIR
+
+    index_dir = str(tmp_path / "index")
+    documents = {
+        "a.pdf": "NETCONF uses YANG data models for configuration. " * 30,
+        "b.pdf": "RESTCONF exposes YANG over HTTP with JSON or XML. " * 30,
+    }
+    encode = _FakeSentenceTransformer.encode
+
+    def interrupted(self, sentences, **kwargs):
+        if "RESTCONF" in sentences[0]:
+            raise KeyboardInterrupt
+        return encode(self, sentences)
+
+    monkeypatch.setattr(_FakeSentenceTransformer, "encode", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        update_vector_store(_sources(documents), chunk_size=200, chunk_overlap=20, index_dir=index_dir, workers=1)
+    assert os.path.exists(os.path.join(index_dir, BUILD_DIR))
+    first_pass = list(fake_encoder.encoded)
+    assert first_pass and not any("RESTCONF" in chunk for chunk in first_pass)
+
+    monkeypatch.setattr(_FakeSentenceTransformer, "encode", encode)
+    fake_encoder.encoded = []
+    index, store = update_vector_store(_sources(documents), chunk_size=200, chunk_overlap=20, index_dir=index_dir, workers=1)
+    chunks = _live_chunks(store)
+    assert fake_encoder.encoded and not any("NETCONF" in chunk for chunk in fake_encoder.encoded)
+    assert index.ntotal == len(chunks) == len(first_pass) + len(fake_encoder.encoded)
+    assert set(load_manifest(index_dir)["sources"]) == {"a.pdf", "b.pdf"}
+    assert not os.path.exists(os.path.join(index_dir, BUILD_DIR))
+
+    # Search results still map to the right chunk store positions
+    query = fake_encoder().encode([chunks[-1]])
+    _, ids = index.search(query, 1)
+    assert chunks[int(ids[0][0])] == chunks[-1]
+
+def test_evaluate_index_accepts_memmap(tmp_path, random_embeddings):
+    """Test recall can be computed from disk-backed embeddings."""
+    import numpy as np
+
+    path = tmp_path / "embeddings.f32"
+    random_embeddings.astype("float32").tofile(path)
+    embeddings = np.memmap(path, dtype="float32", mode="r", shape=random_embeddings.shape)
+    # A single list trains on a 256-vector sample and still searches exhaustively
+    report = evaluate_index(create_index(embeddings, "ivf_flat", nlist=1), embeddings, k=5, n_queries=20)
+    assert report["recall_at_k"] == 1.0
+
+BLUEPRINT_TEXT = """DEVNET ASSOCIATE EXAM TOPICS
+1.0 Software Development and Design
+1.1 Compare data formats (XML, JSON, and YAML). Each format is used by network
+APIs to serialize structured data.
+1.2 Describe parsing of common data format (XML, JSON, and YAML) to Python data structures.
+1.3 Describe the concepts of test-driven development.
+
+2.0 Understanding and Using APIs
+2.1 Construct a REST API request to accomplish a task given API documentation.
+"""
+
+def test_split_units_follows_structure():
+    """Test wrapped lines are re-joined and objectives, headings and sentences become units."""
+    from vectorize import split_units
+
+    units = split_units(BLUEPRINT_TEXT)
+    assert units[0] == (True, "DEVNET ASSOCIATE EXAM TOPICS")
+    assert (False, "Each format is used by network APIs to serialize structured data.") in units
+    assert (False, "1.3 Describe the concepts of test-driven development.") in units
+
+def test_chunk_text_keeps_objectives_whole():
+    """Test chunks respect the token budget and never split an objective mid-sentence."""
+    from vectorize import chunk_text, estimate_tokens
+
+    chunks = chunk_text(BLUEPRINT_TEXT, max_tokens=30)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 30 for chunk in chunks)
+    for objective in ("1.2 Describe parsing of common data format (XML, JSON, and YAML) to Python data structures.",
+                      "2.1 Construct a REST API request to accomplish a task given API documentation."):
+        assert sum(objective in chunk for chunk in chunks) == 1
+    # A heading is never the last thing in a chunk
+    assert not any(chunk.endswith("EXAM TOPICS") for chunk in chunks)
+
+def test_chunk_text_denser_than_fixed_windows():
+    """Test whole-sentence packing without overlap stores no duplicated text."""
+    from vectorize import chunk_text
+
+    text = " ".join(f"Objective {i} covers a distinct automation topic." for i in range(60))
+    chunks = chunk_text(text, max_tokens=64)
+    assert " ".join(chunks) == text
+    assert all(chunk.endswith(".") for chunk in chunks)
+
+def test_chunk_text_splits_oversized_sentences_and_overlaps():
+    """Test a sentence over budget is split at words and overlap repeats whole sentences."""
+    from vectorize import chunk_text, estimate_tokens
+
+    long_sentence = "word " * 100
+    chunks = chunk_text(long_sentence.strip() + ".", max_tokens=25)
+    assert all(estimate_tokens(chunk) <= 25 for chunk in chunks)
+
+    text = "First sentence is here. Second sentence is here. Third sentence is here. Fourth sentence is here."
+    chunks = chunk_text(text, max_tokens=12, overlap_chars=30)
+    assert chunks[1].startswith("Second sentence is here.")
+
+def test_update_vector_store_uses_model_tokenizer(tmp_path, fake_encoder, monkeypatch):
+    """Test chunks are sized by the embedding model's tokenizer and sequence length."""
+    from vectorize import update_vector_store
+
+    class CharTokenizer:
+        def tokenize(self, text):
+            return list(text)
+
+    monkeypatch.setattr(_FakeSentenceTransformer, "tokenizer", CharTokenizer(), raising=False)
+    monkeypatch.setattr(_FakeSentenceTransformer, "max_seq_length", 102, raising=False)
+    documents = {"a.pdf": "NETCONF uses YANG data models for configuration. " * 30}
+    _, store = update_vector_store(_sources(documents), index_dir=str(tmp_path / "index"))
+    chunks = _live_chunks(store)
+    assert chunks and all(len(chunk) <= 100 for chunk in chunks)
+
+def test_update_vector_store_maintains_track_sub_indexes(tmp_path, fake_encoder):
+    """Test each certification gets a sub-index holding exactly its chunk IDs, kept in sync incrementally."""
+    import faiss
+    from chunk_metadata import ChunkMetadata
+    from vectorize import update_vector_store, load_manifest, TRACKS_DIR
+
+    index_dir = str(tmp_path / "index")
+    documents = {
+        "docs/300-635-DCNAUTO-v2.0.pdf": "Automate ACI fabrics with Ansible and Terraform. " * 20,
+        "docs/350-901-AUTOCOR-v2.0.pdf": "Design resilient applications with Cisco APIs. " * 20,
+        "docs/career-path.pdf": "Certifications build on each other over time. " * 20,
+    }
+
+    def track_ids(track):
+        sub_index = faiss.read_index(os.path.join(index_dir, TRACKS_DIR, f"{track}.index"))
+        return sorted(faiss.vector_to_array(sub_index.id_map).tolist())
+
+    update_vector_store(_sources(documents), chunk_size=200, index_dir=index_dir)
+    sources = load_manifest(index_dir)["sources"]
+    assert track_ids("DCNAUTO") == sources["docs/300-635-DCNAUTO-v2.0.pdf"]["chunk_ids"]
+    assert track_ids("AUTOCOR") == sources["docs/350-901-AUTOCOR-v2.0.pdf"]["chunk_ids"]
+    assert ChunkMetadata.load(index_dir).describe(sources["docs/career-path.pdf"]["chunk_ids"][0])["track"] is None
+
+    documents["docs/300-635-DCNAUTO-v2.0.pdf"] = "DCNAUTO now covers Nexus Dashboard automation. " * 20
+    update_vector_store(_sources(documents), chunk_size=200, index_dir=index_dir)
+    sources = load_manifest(index_dir)["sources"]
+    assert track_ids("DCNAUTO") == sources["docs/300-635-DCNAUTO-v2.0.pdf"]["chunk_ids"]
+    assert track_ids("AUTOCOR") == sources["docs/350-901-AUTOCOR-v2.0.pdf"]["chunk_ids"]
+
+def test_update_vector_store_keeps_exact_vectors_for_quantized_index(tmp_path, fake_encoder):
+    """Test vectors.f32 rows stay aligned with chunk IDs across incremental updates."""
+    import json
+    import numpy as np
+    from chunk_store import ChunkStore
+    from vectorize import update_vector_store, VECTORS_FILE, INDEX_CONFIG_FILE
+
+    index_dir = str(tmp_path / "index")
+    documents = {
+        "docs/300-635-DCNAUTO-v2.0.pdf": "Automate ACI fabrics with Ansible and Terraform. " * 20,
+        "docs/350-901-AUTOCOR-v2.0.pdf": "Design resilient applications with Cisco APIs. " * 20,
+    }
+    update_vector_store(_sources(documents), chunk_size=200, index_type="sq8", rerank_factor=3, index_dir=index_dir)
+    documents["docs/350-901-AUTOCOR-v2.0.pdf"] = "AUTOCOR now covers OpenTelemetry tracing. " * 20
+    update_vector_store(_sources(documents), chunk_size=200, index_type="sq8", rerank_factor=3, index_dir=index_dir)
+
+    with open(os.path.join(index_dir, INDEX_CONFIG_FILE)) as f:
+        config = json.load(f)
+    assert config["rerank_factor"] == 3
+    assert "reranked_recall_at_k" in config["report"]
+    store = ChunkStore(index_dir)
+    vectors = np.fromfile(os.path.join(index_dir, VECTORS_FILE), dtype="float32").reshape(-1, config["dimension"])
+    assert len(vectors) == len(store)
+    last = len(store) - 1
+    assert np.allclose(vectors[last], fake_encoder().encode([store[last]])[0])
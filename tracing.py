@@ -0,0 +1,196 @@
+# tracing.py
+"""
+Lightweight request tracing exported as OpenTelemetry-shaped JSONL.
+
+Spans nest through a context variable, so the current span follows a request
+through ``await`` points and, via ``bind``, into executor threads. With
+TRACE_EXPORT_PATH set, finished spans are appended one per line to a
+size-rotated local file in the OTLP/JSON span layout (traceId, spanId,
+parentSpanId, *UnixNano timestamps, attribute key/value lists), so no
+collector is needed to inspect a slow request. Export is off by default.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+TRACE_HEADER = "X-Trace-Id"
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "cisco-automation-certification-station")
+TRACEPARENT_PATTERN = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+def new_span_id() -> str:
+    return secrets.token_hex(8)
+
+def parse_traceparent(header):
+    """(trace_id, parent_span_id) from a W3C traceparent header, or (None, None)"""
+    match = TRACEPARENT_PATTERN.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32:
+        return None, None
+    return match.group(1), match.group(2)
+
+def _attribute_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}  # OTLP/JSON encodes 64-bit ints as strings
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class Span:
+    """One timed operation within a trace"""
+
+    def __init__(self, name, trace_id, parent_span_id=None, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def to_otlp(self) -> dict:
+        return {
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns),
+            "attributes": [{"key": key, "value": _attribute_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status_code, "message": self.status_message}
+        }
+
+class JsonlSpanExporter:
+    """Append finished spans to a size-rotated JSONL file (empty path disables export).
+
+    Spans are queued and written by a listener thread, so exporting from the
+    event loop never blocks it on file I/O or rotation.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3):
+        self.path = path
+        self.enabled = bool(path)
+        self.exported = 0
+        self._logger = None
+        self._queue = None
+        self._listener = None
+        if not self.enabled:
+            return
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._queue = queue.Queue()
+            self._listener = QueueListener(self._queue, handler)
+            self._logger = logging.getLogger(f"tracing.export.{path}")
+            self._logger.handlers = [QueueHandler(self._queue)]
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            self._listener.start()
+        except Exception as e:
+            print(f"[WARNING] Span export disabled: {e}")
+            self.enabled = False
+
+    def export(self, span: Span):
+        if not self.enabled:
+            return
+        self._logger.info(json.dumps(span.to_otlp(), separators=(",", ":")))
+        self.exported += 1
+
+    def flush(self):
+        """Block until every queued span is written"""
+        if self._listener is not None:
+            self._queue.join()
+            for handler in self._listener.handlers:
+                handler.flush()
+
+    def close(self):
+        """Write the remaining spans, stop the listener thread and close the file"""
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+            self.enabled = False
+
+# Opt-in: set TRACE_EXPORT_PATH (e.g. /tmp/rag_traces/spans.jsonl) to export spans
+exporter = JsonlSpanExporter(
+    os.getenv("TRACE_EXPORT_PATH", ""),
+    max_bytes=int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024))),
+    backup_count=int(os.getenv("TRACE_BACKUP_COUNT", "3"))
+)
+atexit.register(lambda: exporter.close())  # Looked up at exit, so a replaced exporter is the one closed
+
+def current_span():
+    return _current_span.get()
+
+def current_trace_id():
+    active = _current_span.get()
+    return active.trace_id if active is not None else None
+
+@contextmanager
+def span(name: str, trace_id=None, parent_span_id=None, kind=SPAN_KIND_INTERNAL, **attributes):
+    """Time the with-block (or decorated call) as a child of the current span.
+
+    ``trace_id``/``parent_span_id`` start or continue a trace explicitly
+    (e.g. from an incoming traceparent header); otherwise a root span gets a
+    fresh trace ID.
+    """
+    parent = _current_span.get()
+    if trace_id is None and parent is not None:
+        trace_id, parent_span_id = parent.trace_id, parent.span_id
+    current = Span(name, trace_id or new_trace_id(), parent_span_id, kind, attributes)
+    _current_span.set(current)
+    try:
+        yield current
+    except GeneratorExit:
+        raise  # A consumer closing a stream early is not a failure
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        current.end_time_ns = time.time_ns()
+        # Restore by value rather than token: generators may finish in another context
+        _current_span.set(parent)
+        exporter.export(current)
+
+def bind(fn):
+    """Wrap fn to run in a copy of the current context, so executor threads keep the active span"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+    return run
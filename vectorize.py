@@ -1,13 +1,49 @@
 import os
-import requests
+import re
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import shutil
+import concurrent.futures
+from collections import defaultdict, deque
+from functools import partial
+from itertools import islice
+from urllib.parse import urlsplit
+import numpy as np
+import httpx
 from PyPDF2 import PdfReader
 from bs4 import BeautifulSoup
 import faiss
-import pickle
-from sentence_transformers import SentenceTransformer
+from chunk_store import BLOB_FILE, OFFSETS_FILE, ChunkStore, ChunkStoreWriter, chunk_store_exists
+from bm25_index import BM25Index, bm25_index_exists
+from chunk_metadata import METADATA_VERSION, TRACK_NAMES, ChunkMetadata
+from context_assembler import estimate_tokens  # Fallback when the model has no tokenizer
 
 DOCS_DIR = "docs"
 URLS_FILE = "urls.txt"
+INDEX_DIR = "rag/index"
+INDEX_CONFIG_FILE = "index_config.json"
+MANIFEST_FILE = "manifest.json"
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "pq")
+QUANTIZED_INDEX_TYPES = ("ivf_pq", "sq8", "pq")  # Lossy codes: search results can be re-ranked exactly
+VECTORS_FILE = "vectors.f32"  # Exact float32 vectors by chunk ID, memory-mapped for re-ranking
+DEFAULT_RERANK_FACTOR = 4  # Quantized search fetches k * factor candidates for exact re-ranking
+PDF_CACHE_DIR = "rag/cache/pdf_pages"
+URL_CACHE_DIR = "rag/cache/urls"
+TRACKS_DIR = "tracks"  # Per-certification sub-indexes, inside the index directory
+BUILD_DIR = "build"  # Checkpointed in-progress build, inside the index directory
+CHECKPOINT_FILE = "checkpoint.json"
+EMBEDDINGS_FILE = "embeddings.f32"
+EMBED_BATCH_SIZE = 256
+ADD_BATCH_SIZE = 16384
+DEFAULT_CHUNK_TOKENS = 126  # 128-token model window minus [CLS]/[SEP]
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+# Markdown headings and short ALL-CAPS titles stand alone; numbered objectives ("1.2 Describe ...") open a paragraph
+HEADING_PATTERN = re.compile(r"^(?:#{1,6}\s+\S.*|[A-Z][A-Z0-9 &/,:()\-]{2,79})$")
+OBJECTIVE_PATTERN = re.compile(r"^\d+(?:\.\d+)*\.?[a-z]?\s+\S")
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
 def clean_html(raw_html):
     soup = BeautifulSoup(raw_html, "html.parser")
@@ -15,90 +51,856 @@ def clean_html(raw_html):
         tag.decompose()
     return soup.get_text(separator="\n", strip=True)
 
-def load_text_from_pdfs(doc_dir):
-    documents = []
-    for filename in os.listdir(doc_dir):
-        if filename.lower().endswith(".pdf"):
-            pdf_path = os.path.join(doc_dir, filename)
+def content_hash(data) -> str:
+    """SHA-256 of raw bytes or text, used to detect changed sources"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+def extract_pdf_pages(pdf_path, file_hash=None, cache_dir=PDF_CACHE_DIR):
+    """Return [(page_number, text)] for a PDF, cached on disk by file hash and page number"""
+    if file_hash is None:
+        with open(pdf_path, "rb") as f:
+            file_hash = content_hash(f.read())
+    cache_path = os.path.join(cache_dir, f"{file_hash}.json") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return [(page["page"], page["text"]) for page in json.load(f)["pages"]]
+
+    reader = PdfReader(pdf_path)
+    pages = []
+    for page_number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text()  # Extraction is the expensive part: once per page
+        if text:
+            pages.append((page_number, text))
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"source": os.path.basename(pdf_path), "pages": [{"page": n, "text": t} for n, t in pages]}, f)
+        os.replace(temp_path, cache_path)
+    return pages
+
+def extract_pdf_text(pdf_path):
+    return "\n".join(text for _, text in extract_pdf_pages(pdf_path))
+
+def iter_loaders(loaders, workers=None):
+    """Run source loaders across a process pool, yielding results in order (None where a loader failed).
+
+    At most ``2 * workers`` loaders are in flight, so only a small window of
+    extracted documents is ever held in memory.
+    """
+    loaders = list(loaders)
+    workers = min(workers or os.cpu_count() or 1, len(loaders))
+    if workers <= 1:
+        for load in loaders:
             try:
-                reader = PdfReader(pdf_path)
-                text = "\n".join(page.extract_text() for page in reader.pages if page.extract_text())
-                documents.append(text)
-                print(f"[✓] Loaded PDF: {filename}")
+                result = load()
             except Exception as e:
-                print(f"[!] Error reading {filename}: {e}")
-    return documents
+                print(f"[!] Error loading source: {e}")
+                result = None
+            yield result
+        return
 
-def load_text_from_urls(urls_file):
-    if not os.path.exists(urls_file):
-        return []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(loaders)
+        in_flight = deque(pool.submit(load) for load in islice(remaining, 2 * workers))
+        while in_flight:
+            future = in_flight.popleft()
+            load = next(remaining, None)
+            if load is not None:
+                in_flight.append(pool.submit(load))
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[!] Error loading source: {e}")
+                result = None
+            yield result
+
+def run_loaders(loaders, workers=None):
+    """Run source loaders across a process pool; returns results in order, None where a loader failed"""
+    return list(iter_loaders(loaders, workers))
 
+def load_text_from_pdfs(doc_dir, workers=None):
+    filenames = [filename for filename in os.listdir(doc_dir) if filename.lower().endswith(".pdf")]
+    loaders = [partial(extract_pdf_text, os.path.join(doc_dir, filename)) for filename in filenames]
     documents = []
+    for filename, text in zip(filenames, run_loaders(loaders, workers)):
+        if text is None:
+            print(f"[!] Error reading {filename}")
+            continue
+        documents.append(text)
+        print(f"[✓] Loaded PDF: {filename}")
+    return documents
+
+def read_urls(urls_file):
+    """Read URLs from urls.txt, skipping blank lines, # comments and duplicates"""
+    urls = []
     with open(urls_file, "r") as f:
         for line in f:
-            url = line.strip()
-            if not url:
+            url = line.split(" #", 1)[0].strip()
+            if url and not url.startswith("#") and url not in urls:
+                urls.append(url)
+    return urls
+
+def _url_cache_path(cache_dir, url):
+    return os.path.join(cache_dir, f"{content_hash(url)}.json")
+
+async def _fetch_url(client, url, host_limits, cache_dir, retries):
+    """Fetch and clean one URL, revalidating a cached copy with ETag/Last-Modified"""
+    cached = None
+    cache_path = _url_cache_path(cache_dir, url) if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+            if not isinstance(cached.get("text"), str):
+                raise ValueError("no cached text")
+        except (OSError, ValueError, AttributeError) as e:
+            # An unreadable cache entry is a miss: fetch the page unconditionally and rewrite it
+            print(f"[WARNING] Ignoring unreadable URL cache for {url}: {e}")
+            cached = None
+
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    for attempt in range(retries + 1):
+        try:
+            async with host_limits[urlsplit(url).netloc]:
+                response = await client.get(url, headers=headers)
+            if response.status_code == 304 and cached:
+                return url, cached["text"], "not_modified"
+            if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+            response.raise_for_status()
+            text = clean_html(response.text)
+            if cache_path:
+                os.makedirs(cache_dir, exist_ok=True)
+                temp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with open(temp_path, "w") as f:
+                    json.dump({
+                        "url": url,
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                        "text": text
+                    }, f)
+                os.replace(temp_path, cache_path)
+            return url, text, "fetched"
+        except httpx.HTTPError as e:
+            if attempt < retries and not isinstance(e, httpx.HTTPStatusError):
+                await asyncio.sleep(0.5 * 2 ** attempt)
                 continue
+            return url, None, f"error: {e}"
+
+async def fetch_urls(urls, cache_dir=URL_CACHE_DIR, concurrency=16, per_host=4, retries=2, timeout=10.0, hash_only=False):
+    """Fetch URLs concurrently with a bounded pool and per-host limits; returns [(url, text, status)].
+
+    With ``hash_only`` each page's text is dropped once it is in the cache and
+    its content hash is returned in place of the text.
+    """
+    if hash_only and not cache_dir:
+        raise ValueError("hash_only needs a cache_dir to keep the page text on disk")
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    host_limits = defaultdict(lambda: asyncio.Semaphore(per_host))
+
+    async def fetch(client, url):
+        try:
+            url, text, status = await _fetch_url(client, url, host_limits, cache_dir, retries)
+        except Exception as e:
+            # One bad page (unparsable HTML, cache write failure) is skipped instead of aborting the gather
+            return url, None, f"error: {type(e).__name__}: {e}"
+        return url, content_hash(text) if hash_only and text is not None else text, status
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits, follow_redirects=True) as client:
+        return await asyncio.gather(*(fetch(client, url) for url in urls))
+
+def fetch_url_texts(urls_file, **fetch_options):
+    """Fetch every URL in urls.txt, printing per-URL status"""
+    if not os.path.exists(urls_file):
+        return []
+    results = asyncio.run(fetch_urls(read_urls(urls_file), **fetch_options))
+    for url, text, status in results:
+        if status == "fetched":
+            print(f"[✓] Loaded URL: {url}")
+        elif status == "not_modified":
+            print(f"[=] Unchanged URL (304): {url}")
+        else:
+            print(f"[!] Error fetching {url}: {status}")
+    return results
+
+def load_text_from_urls(urls_file, **fetch_options):
+    return [text for _, text, _ in fetch_url_texts(urls_file, **fetch_options) if text is not None]
+
+def pdf_sources(doc_dir):
+    """Yield (source, content_hash, load_pages) per PDF; hashing the file bytes avoids parsing unchanged PDFs"""
+    if not os.path.isdir(doc_dir):
+        return
+    for filename in sorted(os.listdir(doc_dir)):
+        if filename.lower().endswith(".pdf"):
+            pdf_path = os.path.join(doc_dir, filename)
+            with open(pdf_path, "rb") as f:
+                file_hash = content_hash(f.read())
+            yield pdf_path, file_hash, partial(extract_pdf_pages, pdf_path, file_hash)
+
+def read_cached_url_text(cache_path):
+    """Page text saved in the URL cache by fetch_urls"""
+    with open(cache_path) as f:
+        return json.load(f)["text"]
+
+def url_sources(urls_file, cache_dir=URL_CACHE_DIR, **fetch_options):
+    """Yield (url, content_hash, load_text) per URL; hash and loader are None when the fetch failed.
+
+    Only hashes are kept in memory: each loader reads its page from the URL
+    cache when it runs, so just the cache path crosses into the loader pool.
+    """
+    for url, text_hash, _ in fetch_url_texts(urls_file, cache_dir=cache_dir, hash_only=True, **fetch_options):
+        if text_hash is None:
+            yield url, None, None
+        else:
+            yield url, text_hash, partial(read_cached_url_text, _url_cache_path(cache_dir, url))
+
+def split_units(text):
+    """Split text into (is_heading, unit) pieces along headings, numbered objectives, paragraphs and sentences.
+
+    Wrapped lines are re-joined within a paragraph; a numbered objective such as
+    "1.2 Describe ..." always starts a new paragraph.
+    """
+    units, paragraph = [], []
+
+    def end_paragraph():
+        if paragraph:
+            units.extend((False, sentence) for sentence in SENTENCE_BOUNDARY.split(" ".join(paragraph)) if sentence)
+            paragraph.clear()
+
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if not line:
+            end_paragraph()
+        elif HEADING_PATTERN.match(line):
+            end_paragraph()
+            units.append((True, line))
+        elif OBJECTIVE_PATTERN.match(line):
+            end_paragraph()
+            paragraph.append(line)
+        else:
+            paragraph.append(line)
+    end_paragraph()
+    return units
+
+def _split_oversized(unit, max_tokens, max_chars, count_tokens):
+    """Split a unit that exceeds the budget at word boundaries (hard-splitting giant words)"""
+    if count_tokens(unit) <= max_tokens and (not max_chars or len(unit) <= max_chars):
+        return [unit]
+    pieces, current = [], ""
+    for word in unit.split(" "):
+        while max_chars and len(word) > max_chars:
+            pieces.extend([current] if current else [])
+            pieces.append(word[:max_chars])
+            current, word = "", word[max_chars:]
+        candidate = f"{current} {word}" if current else word
+        if current and (count_tokens(candidate) > max_tokens or (max_chars and len(candidate) > max_chars)):
+            pieces.append(current)
+            candidate = word
+        current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+def chunk_text(text, max_tokens=DEFAULT_CHUNK_TOKENS, max_chars=None, overlap_chars=0, count_tokens=estimate_tokens):
+    """Pack sentences, headings and numbered objectives into chunks of at most ``max_tokens`` tokens.
+
+    Chunks only break between sentences (a sentence is split at word
+    boundaries only when it alone exceeds the budget), and a heading is never
+    left dangling at the end of a chunk. ``max_chars`` optionally caps chunk
+    length as well; ``overlap_chars`` repeats trailing whole sentences, up to
+    that many characters, at the start of the next chunk.
+    """
+    if len(text.strip()) <= 20:
+        return []
+    chunks, current = [], []  # current: [(is_heading, piece, tokens)]
+
+    def fits(piece, tokens):
+        used_tokens = sum(item[2] for item in current)
+        used_chars = sum(len(item[1]) + 1 for item in current)
+        return used_tokens + tokens <= max_tokens and (not max_chars or used_chars + len(piece) <= max_chars)
+
+    for is_heading, unit in split_units(text):
+        for piece in _split_oversized(unit, max_tokens, max_chars, count_tokens):
+            tokens = count_tokens(piece)
+            if current and not fits(piece, tokens):
+                carry = [current.pop()] if current[-1][0] and len(current) > 1 else []
+                chunks.append(" ".join(item[1] for item in current))
+                overlap = []
+                for item in reversed(current):
+                    if item[0] or sum(len(o[1]) + 1 for o in overlap) + len(item[1]) > overlap_chars:
+                        break
+                    overlap.insert(0, item)
+                current = overlap + carry
+                while current and not fits(piece, tokens):
+                    current.pop(0)
+            current.append((is_heading, piece, tokens))
+    if current:
+        chunks.append(" ".join(item[1] for item in current))
+    # Only keep meaningful chunks
+    return [chunk for chunk in chunks if len(chunk) > 20]
+
+def load_sentence_transformer(model_name, **kwargs):
+    """Load a sentence-transformers model; imported on first use so serving code that imports vectorize skips torch"""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, **kwargs)
+
+def create_index(embeddings, index_type="flat", nlist=None, pq_m=None, hnsw_m=32, ids=None):
+    """Create and train a FAISS index of the requested type for the given embeddings.
+
+    ``sq8`` stores one byte per dimension (4x smaller than float32) and ``pq``
+    stores product-quantized codes (16x smaller by default). When ``ids`` are
+    given the index is wrapped in an IndexIDMap2 so chunks can later be removed
+    and re-added by chunk ID.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+    count, dimension = embeddings.shape
+    # Codebooks need >= 2^nbits training points
+    nbits = int(min(8, max(1, np.floor(np.log2(count)))))
+
+    if index_type == "flat":
+        description = "Flat"
+    elif index_type == "hnsw":
+        description = f"HNSW{hnsw_m}"
+    elif index_type == "sq8":
+        description = "SQ8"
+    elif index_type == "pq":
+        # One byte per four dimensions by default; sub-quantizers must divide the dimension
+        pq_m = pq_m or next(m for m in range(max(1, dimension // 4), 0, -1) if dimension % m == 0)
+        description = f"PQ{pq_m}x{nbits}"
+    else:
+        # Roughly 4*sqrt(n) lists, but never more lists than training vectors
+        nlist = min(nlist or max(1, int(4 * np.sqrt(count))), count)
+        if index_type == "ivf_flat":
+            description = f"IVF{nlist},Flat"
+        else:
+            # PQ sub-quantizers must divide the dimension
+            pq_m = pq_m or next(m for m in (48, 32, 24, 16, 8, 4, 2, 1) if dimension % m == 0)
+            description = f"IVF{nlist},PQ{pq_m}x{nbits}"
+
+    index = faiss.index_factory(dimension, description)
+    if not index.is_trained:
+        # k-means uses at most 256 points per centroid, so a sample trains as well as the full set
+        # (a scalar quantizer only needs per-dimension ranges)
+        if index_type == "sq8":
+            centroids = 256
+        elif index_type == "pq":
+            centroids = 2 ** nbits
+        else:
+            centroids = max(nlist, 2 ** nbits) if index_type == "ivf_pq" else nlist
+        training = embeddings
+        if count > 256 * centroids:
+            sample = np.random.default_rng(0).choice(count, size=256 * centroids, replace=False)
+            training = embeddings[np.sort(sample)]
+        print(f"🏋️ Training {description} index on {len(training)} vectors...")
+        index.train(np.ascontiguousarray(training, dtype='float32'))
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+    add_embeddings(index, embeddings, ids)
+    return index
+
+def add_embeddings(index, embeddings, ids=None, batch_size=ADD_BATCH_SIZE):
+    """Add (possibly memory-mapped) embeddings to an index in fixed-size batches"""
+    for start in range(0, len(embeddings), batch_size):
+        batch = np.ascontiguousarray(embeddings[start:start + batch_size], dtype='float32')
+        if ids is None:
+            index.add(batch)
+        else:
+            index.add_with_ids(batch, np.asarray(ids[start:start + batch_size], dtype='int64'))
+
+def remove_chunk_ids(index, chunk_ids, rebuild):
+    """Remove chunk IDs from an ID-mapped index.
+
+    HNSW graphs cannot delete vertices, so for them the index is rebuilt with
+    ``rebuild(vectors, ids)`` from the vectors it still stores (no re-embedding).
+    """
+    if not chunk_ids:
+        return index
+    try:
+        index.remove_ids(np.asarray(chunk_ids, dtype='int64'))
+        return index
+    except RuntimeError:
+        stale = set(chunk_ids)
+        keep = np.array([i for i in faiss.vector_to_array(index.id_map) if i not in stale], dtype='int64')
+        vectors = np.vstack([index.reconstruct(int(i)) for i in keep]) if len(keep) else np.empty((0, index.d), dtype='float32')
+        return rebuild(vectors, keep)
+
+def set_search_parameters(index, ef_search=None, nprobe=None):
+    """Apply query-time search parameters (efSearch for HNSW, nprobe for IVF)"""
+    parameters = faiss.ParameterSpace()
+    for name, value in (("efSearch", ef_search), ("nprobe", nprobe)):
+        if value:
             try:
-                response = requests.get(url, timeout=10)
-                text = clean_html(response.text)
-                documents.append(text)
-                print(f"[✓] Loaded URL: {url}")
-            except Exception as e:
-                print(f"[!] Error fetching {url}: {e}")
-    return documents
+                parameters.set_index_parameter(index, name, int(value))
+            except RuntimeError:
+                pass  # Parameter does not apply to this index type
+
+def rerank_exact(query, candidate_ids, vectors, k):
+    """Re-order candidate chunk IDs by exact L2 distance to the query using float32 vectors indexed by ID"""
+    ids = np.asarray([i for i in candidate_ids if 0 <= i < len(vectors)], dtype='int64')
+    if not len(ids):
+        return ids
+    exact = np.asarray(vectors[ids], dtype='float32')
+    distances = ((exact - np.asarray(query, dtype='float32').reshape(1, -1)) ** 2).sum(axis=1)
+    return ids[np.argsort(distances, kind="stable")[:k]]
+
+def index_bytes_per_vector(index) -> float:
+    """Serialized index size per stored vector: codes plus amortized codebooks, graph links and IDs"""
+    return faiss.serialize_index(index).nbytes / max(index.ntotal, 1)
+
+def evaluate_index(index, embeddings, k=5, n_queries=100, seed=0, rerank_factor=None):
+    """Measure recall@k against exact search, mean query latency and bytes per vector for an index.
+
+    With ``rerank_factor`` also report recall after exactly re-ranking
+    k * rerank_factor candidates against the float32 embeddings.
+    """
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)
+    queries = np.ascontiguousarray(embeddings[np.sort(sample)], dtype='float32')
+    k = min(k, len(embeddings))
+
+    # Exact neighbours computed batch by batch, so embeddings may be a disk-backed memmap
+    exact = faiss.ResultHeap(len(queries), k)
+    for start in range(0, len(embeddings), ADD_BATCH_SIZE):
+        batch = np.ascontiguousarray(embeddings[start:start + ADD_BATCH_SIZE], dtype='float32')
+        distances, positions = faiss.knn(queries, batch, min(k, len(batch)))
+        exact.add_result(distances, positions + start)
+    exact.finalize()
+    truth = exact.I
+
+    started = time.perf_counter()
+    for query in queries:
+        index.search(query.reshape(1, -1), k)
+    latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    _, found = index.search(queries, k)
+    hits = sum(len(set(truth[i]) & set(found[i])) for i in range(len(queries)))
+    bytes_per_vector = index_bytes_per_vector(index)
+    report = {
+        "recall_at_k": hits / (len(queries) * k),
+        "k": k,
+        "latency_ms": latency_ms,
+        "queries": len(queries),
+        "bytes_per_vector": bytes_per_vector,
+        "compression": embeddings.shape[1] * 4 / bytes_per_vector
+    }
+    if rerank_factor:
+        _, candidates = index.search(queries, k * rerank_factor)
+        reranked = [rerank_exact(query, row, embeddings, k) for query, row in zip(queries, candidates)]
+        hits = sum(len(set(truth[i]) & set(reranked[i].tolist())) for i in range(len(queries)))
+        report["reranked_recall_at_k"] = hits / (len(queries) * k)
+        report["rerank_factor"] = rerank_factor
+    return report
+
+def print_index_report(reports):
+    """Print a footprint/recall/latency table for one or more evaluated index types"""
+    print(f"{'index':<10} {'bytes/vec':>10} {'smaller':>8} {'recall@k':>9} {'loss':>7} {'reranked':>9} {'ms/query':>9}")
+    for index_type, report in reports.items():
+        reranked = report.get("reranked_recall_at_k")
+        print(f"{index_type:<10} {report.get('bytes_per_vector', 0):>10.1f} {report.get('compression', 1):>7.1f}x "
+              f"{report['recall_at_k']:>9.3f} {1 - report['recall_at_k']:>7.3f} "
+              f"{'-' if reranked is None else f'{reranked:.3f}':>9} {report['latency_ms']:>9.3f}")
+
+def load_manifest(index_dir=INDEX_DIR):
+    """Return the build manifest (settings, next chunk ID, per-source hashes and chunk IDs) or None"""
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def save_vector_store(index, chunks_dir, manifest, ef_search, nprobe, report=None, index_dir=INDEX_DIR, rerank_factor=None):
+    """Write the FAISS index, manifest and query-time config, and move the chunk store from chunks_dir into place"""
+    os.makedirs(index_dir, exist_ok=True)
+    faiss.write_index(index, os.path.join(index_dir, "faiss.index"))
+    # Chunk store positions are chunk IDs; removed chunks are kept as empty tombstones
+    for filename in (BLOB_FILE, OFFSETS_FILE):
+        os.replace(os.path.join(chunks_dir, filename), os.path.join(index_dir, filename))
+    legacy_texts = os.path.join(index_dir, "texts.pkl")
+    if os.path.exists(legacy_texts):
+        os.remove(legacy_texts)  # Superseded by the chunk store
+    write_bm25_index(index_dir)
+    store = ChunkStore(index_dir)
+    ChunkMetadata.build(manifest["sources"], store).save(index_dir)
+    store.close()
+    with open(os.path.join(index_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    config_path = os.path.join(index_dir, INDEX_CONFIG_FILE)
+    if report is None and os.path.exists(config_path):
+        with open(config_path) as f:
+            report = json.load(f).get("report")
+    settings = manifest["settings"]
+    with open(config_path, "w") as f:
+        json.dump({
+            "index_type": settings["index_type"],
+            "model_name": settings["model_name"],
+            "dimension": int(index.d),
+            "ef_search": ef_search,
+            "nprobe": nprobe,
+            "rerank_factor": rerank_factor,
+            "report": report
+        }, f, indent=2)
+
+def load_checkpoint(build_dir, settings, base, changed):
+    """Return the checkpoint of an interrupted build that can be resumed, or None.
+
+    A checkpoint is only reusable when it was made with the same settings on
+    the same base index and every source it embedded is still pending with the
+    same content hash.
+    """
+    checkpoint_path = os.path.join(build_dir, CHECKPOINT_FILE)
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    pending = {source: source_hash for source, source_hash, _ in changed}
+    if checkpoint["settings"] != settings or checkpoint["base"] != base:
+        return None
+    if any(pending.get(source) != entry["hash"] for source, entry in checkpoint["sources"].items()):
+        return None
+    return checkpoint
+
+def save_checkpoint(build_dir, checkpoint):
+    checkpoint_path = os.path.join(build_dir, CHECKPOINT_FILE)
+    with open(f"{checkpoint_path}.tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+def update_exact_vectors(index_dir, embeddings, first_id, full):
+    """Append new float32 chunk vectors to index_dir/vectors.f32, where row = chunk ID.
+
+    The file is memory-mapped at query time to re-rank quantized search results
+    exactly, so it costs disk rather than resident memory.
+    """
+    path = os.path.join(index_dir, VECTORS_FILE)
+    if full and os.path.exists(path):
+        os.remove(path)
+    if embeddings is None:
+        return
+    rows = os.path.getsize(path) // (4 * embeddings.shape[1]) if os.path.exists(path) else 0
+    if rows != first_id:
+        # Index built before exact vectors were kept: drop them rather than misalign chunk IDs
+        print("ℹ️ Exact vectors do not match the index; run with --full to enable exact re-ranking")
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, "ab") as f:
+        for start in range(0, len(embeddings), ADD_BATCH_SIZE):
+            f.write(np.ascontiguousarray(embeddings[start:start + ADD_BATCH_SIZE], dtype='float32').tobytes())
+
+def update_track_indexes(index_dir, metadata, stale_ids, embeddings, new_ids, full, quantized=False):
+    """Maintain one flat sub-index per certification track under index_dir/tracks/.
+
+    Sub-indexes hold copies of their chunks' vectors keyed by chunk ID, so a
+    query that targets one certification searches only that partition. With
+    ``quantized`` new sub-indexes store 8-bit scalar-quantized copies.
+    """
+    tracks_dir = os.path.join(index_dir, TRACKS_DIR)
+    if full:
+        shutil.rmtree(tracks_dir, ignore_errors=True)
+    os.makedirs(tracks_dir, exist_ok=True)
+    new_tracks = metadata.track_ids[new_ids] if len(new_ids) else np.zeros(0, dtype=np.int16)
+    stale = np.asarray(sorted(stale_ids), dtype='int64')
+    for track_id, track in enumerate(TRACK_NAMES):
+        path = os.path.join(tracks_dir, f"{track}.index")
+        rows = np.flatnonzero(new_tracks == track_id)
+        if os.path.exists(path):
+            sub_index = faiss.read_index(path)
+            if len(stale):
+                sub_index.remove_ids(stale)
+        elif len(rows):
+            dimension = embeddings.shape[1]
+            if quantized:
+                sub_index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit))
+                sub_index.train(np.ascontiguousarray(embeddings[rows], dtype='float32'))
+            else:
+                sub_index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+        else:
+            continue
+        if len(rows):
+            add_embeddings(sub_index, embeddings[rows], new_ids[rows])
+        faiss.write_index(sub_index, path)
+
+def write_bm25_index(index_dir=INDEX_DIR):
+    """Rebuild the BM25 lexical index from the chunk store (IDF is corpus-wide, so it is never patched)"""
+    store = ChunkStore(index_dir)
+    BM25Index.build(store).save(index_dir)
+    store.close()
+
+def update_vector_store(sources, model_name="paraphrase-MiniLM-L3-v2", chunk_size=None, chunk_overlap=0,
+                        chunk_tokens=None, index_type="flat", nlist=None, pq_m=None, hnsw_m=32, ef_search=64, nprobe=8,
+                        compare=False, full=False, index_dir=INDEX_DIR, workers=None, batch_size=EMBED_BATCH_SIZE,
+                        rerank_factor=DEFAULT_RERANK_FACTOR):
+    """Build or incrementally refresh the vector store from (source, content_hash, load_text) tuples.
 
-def build_vector_store(texts, model_name="paraphrase-MiniLM-L3-v2", chunk_size=500, chunk_overlap=50):
+    Text is chunked along sentence, heading and objective boundaries into
+    chunks of at most ``chunk_tokens`` model tokens (default: the model's
+    sequence length); ``chunk_size``/``chunk_overlap`` optionally add a
+    character cap and a whole-sentence overlap.
+
+    Only sources whose content hash changed are re-chunked and re-embedded;
+    chunks of changed or deleted sources are removed from the ID-mapped index.
+    Sources with a None hash (e.g. a failed fetch) keep their previous chunks.
+
+    Sources stream through extract -> chunk -> embed (``batch_size`` chunks at a
+    time) -> append to an on-disk chunk store and embedding file, so memory is
+    bounded by the batch and the largest source rather than the corpus. A
+    checkpoint is written after every source; an interrupted build resumes
+    from it on the next run.
+
+    Exact float32 vectors are kept on disk next to the index, so quantized
+    indexes (``sq8``, ``pq``, ``ivf_pq``) can re-rank ``k * rerank_factor``
+    candidates exactly at query time.
+
+    Returns the index and an open ChunkStore over the saved chunks (positions
+    are chunk IDs, removed chunks are empty); the caller closes the store.
+    """
+    settings = {
+        "model_name": model_name,
+        "chunker": "structure",
+        "metadata": METADATA_VERSION,
+        "chunk_tokens": chunk_tokens,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "index_type": index_type,
+        "nlist": nlist,
+        "pq_m": pq_m,
+        "hnsw_m": hnsw_m
+    }
+    manifest = None if full else load_manifest(index_dir)
+    if manifest is not None and (
+        manifest.get("settings") != settings
+        or not os.path.exists(os.path.join(index_dir, "faiss.index"))
+        or not chunk_store_exists(index_dir)
+    ):
+        print("⚙️ Index settings changed, rebuilding from scratch")
+        manifest = None
+
+    previous = manifest["sources"] if manifest else {}
+    current = set()
+    changed = []
+    for source, source_hash, load_text in sources:
+        current.add(source)
+        if load_text is None:
+            continue
+        if source not in previous or previous[source]["hash"] != source_hash:
+            changed.append((source, source_hash, load_text))
+    deleted = [source for source in previous if source not in current]
+
+    if manifest is not None and not changed and not deleted:
+        print("✅ Vector store is up to date, nothing to re-embed")
+        if not bm25_index_exists(index_dir):
+            write_bm25_index(index_dir)
+        return faiss.read_index(os.path.join(index_dir, "faiss.index")), ChunkStore(index_dir)
+
+    stale_ids = {chunk_id for source in deleted + [c[0] for c in changed if c[0] in previous]
+                 for chunk_id in previous[source]["chunk_ids"]}
+    print(f"📝 {len(changed)} new/changed and {len(deleted)} deleted sources, {len(stale_ids)} chunks to remove")
+
+    # Resume an interrupted build of the same change set, or start a fresh one
+    build_dir = os.path.join(index_dir, BUILD_DIR)
+    base = {"full": manifest is None, "next_id": manifest["next_id"] if manifest else 0}
+    checkpoint = load_checkpoint(build_dir, settings, base, changed)
+    if checkpoint is None:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        checkpoint = {"settings": settings, "base": base, "next_id": base["next_id"], "dimension": None, "sources": {}}
+    else:
+        print(f"⏯️ Resuming interrupted build: {len(checkpoint['sources'])} sources already embedded")
+    os.makedirs(build_dir, exist_ok=True)
+    done = checkpoint["sources"]
+    pending = [entry for entry in changed if entry[0] not in done]
+
+    # Drop anything appended after the last checkpoint
+    chunk_writer = ChunkStoreWriter(build_dir, resume=bool(done))
+    embeddings_path = os.path.join(build_dir, EMBEDDINGS_FILE)
+    with open(embeddings_path, "ab") as f:
+        f.truncate(len(chunk_writer) * (checkpoint["dimension"] or 0) * 4)
+
+    model, count_tokens = None, estimate_tokens
+    token_budget = chunk_tokens or DEFAULT_CHUNK_TOKENS
+
+    # Stream: extract (process pool) -> chunk -> embed in batches -> append to disk
+    with open(embeddings_path, "ab") as embeddings_file:
+        loaded = iter_loaders([load_text for _, _, load_text in pending], workers)
+        for (source, source_hash, _), content in zip(pending, loaded):
+            if content is None:
+                print(f"[!] Error reading {source}")
+                content = ""
+            segments = content if isinstance(content, list) else [(None, content)]
+            if model is None and any(len(segment.strip()) > 20 for _, segment in segments):
+                # Loaded on first use; its tokenizer and sequence length size the chunks
+                model = load_sentence_transformer(model_name)
+                print("🔄 Generating embeddings...")
+                tokenizer = getattr(model, "tokenizer", None)
+                if tokenizer is not None:
+                    def count_tokens(text):
+                        return len(tokenizer.tokenize(text))
+                if not chunk_tokens and getattr(model, "max_seq_length", None):
+                    token_budget = model.max_seq_length - 2
+            source_chunks, chunk_pages = [], []
+            for page_number, segment in segments:
+                segment_chunks = chunk_text(segment, token_budget, chunk_size, chunk_overlap, count_tokens)
+                source_chunks.extend(segment_chunks)
+                chunk_pages.extend([page_number] * len(segment_chunks))
+
+            for start in range(0, len(source_chunks), batch_size):
+                vectors = np.ascontiguousarray(model.encode(source_chunks[start:start + batch_size], show_progress_bar=False), dtype='float32')
+                embeddings_file.write(vectors.tobytes())
+                checkpoint["dimension"] = int(vectors.shape[1])
+            chunk_writer.extend(source_chunks)
+
+            next_id = checkpoint["next_id"]
+            done[source] = {"hash": source_hash, "chunk_ids": list(range(next_id, next_id + len(source_chunks)))}
+            if any(page is not None for page in chunk_pages):
+                # Page numbers per chunk, kept for citations
+                done[source]["pages"] = chunk_pages
+            checkpoint["next_id"] = next_id + len(source_chunks)
+
+            # Make the appended data durable before recording it in the checkpoint
+            embeddings_file.flush()
+            os.fsync(embeddings_file.fileno())
+            chunk_writer.flush()
+            save_checkpoint(build_dir, checkpoint)
+            print(f"[✓] Embedded {source}: {len(source_chunks)} chunks")
+    new_count = len(chunk_writer)
+    chunk_writer.close()
+
+    dimension = checkpoint["dimension"]
+    embeddings = None
+    new_ids = np.arange(base["next_id"], checkpoint["next_id"], dtype='int64')
+    if new_count:
+        embeddings = np.memmap(embeddings_path, dtype='float32', mode='r', shape=(new_count, dimension))
+
+    report = None
+    if manifest is None:
+        # Full build
+        if not new_count:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise IndexError("No text chunks to embed")
+        index = create_index(embeddings, index_type, nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m, ids=new_ids)
+        set_search_parameters(index, ef_search=ef_search, nprobe=nprobe)
+
+        # Footprint and recall/latency report against exact search
+        def rerank_for(kind):
+            return rerank_factor if kind in QUANTIZED_INDEX_TYPES else None
+
+        reports = {index_type: evaluate_index(index, embeddings, rerank_factor=rerank_for(index_type))}
+        if compare:
+            for other_type in INDEX_TYPES:
+                if other_type != index_type:
+                    other = create_index(embeddings, other_type, nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m)
+                    set_search_parameters(other, ef_search=ef_search, nprobe=nprobe)
+                    reports[other_type] = evaluate_index(other, embeddings, rerank_factor=rerank_for(other_type))
+        print_index_report(reports)
+        report = reports[index_type]
+    else:
+        # Incremental update of the ID-mapped index
+        index = faiss.read_index(os.path.join(index_dir, "faiss.index"))
+        index = remove_chunk_ids(
+            index,
+            sorted(stale_ids),
+            lambda vectors, ids: create_index(vectors, index_type, nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m, ids=ids)
+        )
+        if new_count:
+            add_embeddings(index, embeddings, new_ids)
+        dimension = index.d
+
+    # Final chunk store: previous chunks (stale ones as tombstones) followed by the new ones
+    chunks_dir = os.path.join(build_dir, "store")
+    store_writer = ChunkStoreWriter(chunks_dir)
+    live_count = 0
+    stores = [ChunkStore(build_dir)]
+    if manifest is not None:
+        stores.insert(0, ChunkStore(index_dir))
+    for position, text in enumerate(text for store in stores for text in store):
+        if position in stale_ids:
+            text = ""
+        store_writer.append(text)
+        live_count += bool(text)
+    store_writer.close()
+    for store in stores:
+        store.close()
+    if len(store_writer) - live_count > live_count:
+        print("ℹ️ More removed than live chunks; run with --full to compact the index")
+
+    manifest_sources = {source: entry for source, entry in previous.items() if source not in deleted}
+    manifest_sources.update(done)
+    manifest = {"settings": settings, "next_id": checkpoint["next_id"], "sources": manifest_sources}
+    save_vector_store(index, chunks_dir, manifest, ef_search, nprobe, report=report, index_dir=index_dir,
+                      rerank_factor=rerank_factor)
+    update_exact_vectors(index_dir, embeddings, base["next_id"], full=base["full"])
+    update_track_indexes(index_dir, ChunkMetadata.load(index_dir), stale_ids, embeddings, new_ids, full=base["full"],
+                         quantized=index_type in QUANTIZED_INDEX_TYPES)
+    del embeddings
+    shutil.rmtree(build_dir, ignore_errors=True)
+
+    print(f"💾 Saved vector store: {live_count} chunks, {dimension}D embeddings, {index_type} index")
+    return index, ChunkStore(index_dir)
+
+def build_vector_store(texts, model_name="paraphrase-MiniLM-L3-v2", chunk_size=None, chunk_overlap=0, **index_options):
     """Build FAISS vector store from text documents"""
     print(f"🔧 Building vector store with {len(texts)} documents...")
-    
-    # Initialize sentence transformer
-    model = SentenceTransformer(model_name)
-    
-    # Chunk the texts
-    chunks = []
-    for text in texts:
-        # Simple chunking strategy
-        for i in range(0, len(text), chunk_size - chunk_overlap):
-            chunk = text[i:i + chunk_size]
-            if len(chunk.strip()) > 20:  # Only keep meaningful chunks
-                chunks.append(chunk.strip())
-    
-    print(f"📝 Created {len(chunks)} text chunks")
-    
-    # Create embeddings
-    print("🔄 Generating embeddings...")
-    embeddings = model.encode(chunks, show_progress_bar=True)
-    
-    # Build FAISS index
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings.astype('float32'))
-    
-    # Create output directory
-    os.makedirs("rag/index", exist_ok=True)
-    
-    # Save FAISS index and texts
-    faiss.write_index(index, "rag/index/faiss.index")
-    with open("rag/index/texts.pkl", "wb") as f:
-        pickle.dump(chunks, f)
-    
-    print(f"💾 Saved vector store: {len(chunks)} chunks, {dimension}D embeddings")
-    return index, chunks
-
-def vectorize_all():
+    sources = [(f"text:{i}", content_hash(text), partial(str, text)) for i, text in enumerate(texts)]
+    index_options.setdefault("full", True)
+    # The texts are already in memory, so load them inline rather than pickling copies into a process pool
+    index_options.setdefault("workers", 1)
+    return update_vector_store(sources, model_name=model_name, chunk_size=chunk_size, chunk_overlap=chunk_overlap, **index_options)
+
+def vectorize_all(**index_options):
     print("📄 Loading documents (PDFs + URLs)...")
-    pdf_texts = load_text_from_pdfs(DOCS_DIR)
-    url_texts = load_text_from_urls(URLS_FILE)
-    all_texts = pdf_texts + url_texts
+    sources = list(pdf_sources(DOCS_DIR)) + list(url_sources(URLS_FILE))
 
-    if all_texts:
-        build_vector_store(all_texts)
+    if any(load_text is not None for _, _, load_text in sources):
+        _, store = update_vector_store(sources, **index_options)
+        store.close()
         print("✅ Vector store built and saved to rag/index/")
         return True
     else:
         print("⚠️ No valid content found to embed.")
         return False
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the FAISS vector store from docs/ and urls.txt")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=os.getenv("FAISS_INDEX_TYPE", "flat"))
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(n))")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ sub-quantizers (bytes per vector) for pq/ivf_pq")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW graph degree")
+    parser.add_argument("--ef-search", type=int, default=64, help="HNSW efSearch used at query time")
+    parser.add_argument("--nprobe", type=int, default=8, help="IVF lists probed at query time")
+    parser.add_argument("--rerank-factor", type=int, default=DEFAULT_RERANK_FACTOR,
+                        help="Quantized indexes re-rank k * factor candidates exactly at query time (0 = off)")
+    parser.add_argument("--compare", action="store_true", help="Report recall/latency for every index type")
+    parser.add_argument("--full", action="store_true", help="Re-embed every source instead of only changed ones")
+    parser.add_argument("--workers", type=int, default=None, help="Processes used for PDF extraction (default: CPU count)")
+    parser.add_argument("--chunk-tokens", type=int, default=None, help="Token budget per chunk (default: model sequence length)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks embedded per batch (bounds memory)")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    vectorize_all()
+    args = parse_args()
+    vectorize_all(
+        index_type=args.index_type,
+        nlist=args.nlist,
+        pq_m=args.pq_m,
+        hnsw_m=args.hnsw_m,
+        ef_search=args.ef_search,
+        nprobe=args.nprobe,
+        compare=args.compare,
+        full=args.full,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        chunk_tokens=args.chunk_tokens,
+        rerank_factor=args.rerank_factor
+    )